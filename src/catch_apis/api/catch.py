@@ -7,9 +7,12 @@ from flask import request
 from astropy.time import Time
 
 from ..config import allowed_sources, get_logger, QueryStatus
+from ..config.env import ENV
 from ..validation import parse_target_name
 from ..services.catch import catch_service
-from ..services.status.queue import queue_service
+from ..services.batch import batch_service
+from ..services.queue import JobsQueue
+from ..services import inflight
 from ..services.message import (
     Message,
     listen_for_task_messages,
@@ -32,6 +35,26 @@ def _format_date(date):
     return date if date is None else date.iso
 
 
+def _client() -> str | None:
+    """Identify the requester, e.g., for per-client queue limits.
+
+    Behind ``ENV.TRUSTED_PROXIES`` proxies, the client is the address added to
+    X-Forwarded-For by the outermost proxy.  Earlier addresses are set by the
+    client, and are ignored.
+
+    """
+
+    if ENV.TRUSTED_PROXIES > 0:
+        forwarded: list[str] = [
+            address.strip()
+            for address in request.headers.get("X-Forwarded-For", "").split(",")
+            if address.strip() != ""
+        ]
+        if len(forwarded) >= ENV.TRUSTED_PROXIES:
+            return forwarded[-ENV.TRUSTED_PROXIES]
+    return request.remote_addr
+
+
 def catch_controller(
     target: str,
     sources: list[str] | None = None,
@@ -118,57 +141,221 @@ def catch_controller(
         "queued": False,
         "queue_full": False,
         "queue_position": None,
+        "estimated_cost": None,
+        "message": None,
+        "version": version,
+    }
+
+    # attach to an identical query in progress, but only if the user accepts
+    # cached results
+    inflight_key: str | None = None
+    running: uuid.UUID | None = None
+    if cached:
+        inflight_key = inflight.query_key(
+            sanitized_target,
+            _sources,
+            sanitized_start_date,
+            sanitized_stop_date,
+            uncertainty_ellipse,
+            padding,
+        )
+        running = inflight.claim(inflight_key, job_id)
+
+    if running is not None:
+        job_id = running
+        result["job_id"] = job_id.hex
+        status = QueryStatus.QUEUED
+        messages.append("An identical query is in progress.")
+    else:
+        Message.reset_t0()
+        listen_for_task_messages(job_id)
+
+        status = catch_service(
+            job_id,
+            sanitized_target,
+            sources=_sources,
+            start_date=sanitized_start_date,
+            stop_date=sanitized_stop_date,
+            uncertainty_ellipse=uncertainty_ellipse,
+            padding=padding,
+            cached=cached,
+            inflight_key=inflight_key,
+            client=_client(),
+        )
+
+        stop_listening_for_task_messages(job_id)
+
+    parsed = urllib.parse.urlsplit(request.url_root)
+    results_url = urllib.parse.urlunsplit(
+        (parsed[0], parsed[1], os.path.join(parsed[2], "caught", job_id.hex), "", "")
+    )
+    message_stream_url = urllib.parse.urlunsplit(
+        (parsed[0], parsed[1], os.path.join(parsed[2], "stream"), "", "")
+    )
+
+    if status == QueryStatus.QUEUED:
+        queue = JobsQueue()
+        result["queue_position"] = queue.position(job_id)
+        result["estimated_cost"] = queue.cost(job_id)
+
+        result["queued"] = True
+        result["message_stream"] = message_stream_url
+        result["results"] = results_url
+        messages.append(
+            "Enqueued search.  Listen to task messaging stream until job "
+            "completed, then retrieve data from results URL."
+        )
+    elif status == QueryStatus.QUEUEFULL:
+        result["error"] = True
+        result["queued"] = False
+        result["queue_full"] = True
+        messages.append("Queue is full, please try again later.")
+    elif status == QueryStatus.CLIENTLIMIT:
+        result["error"] = True
+        result["queued"] = False
+        messages.append(
+            "Too many of your queries are in progress, please try again later."
+        )
+    else:
+        # status.SUCCESS
+        result["queued"] = False
+        result["results"] = results_url
+        messages.append("Found cached data.  Retrieve from results URL.")
+
+    result["message"] = "  ".join(messages)
+    logger.info(json.dumps(result))
+    return result
+
+
+def catch_batch_controller(body: dict):
+    """Controller for batches of moving target queries.
+
+    Parameters
+    ----------
+    body : dict
+        The request body:
+        - targets: list of target names
+        - sources, start_date, stop_date, uncertainty_ellipse, padding, cached:
+          shared query parameters, see `catch_controller`
+
+    """
+
+    logger = get_logger()
+    batch_id = uuid.uuid4()
+    messages = []
+
+    # validate all targets, and only search the valid ones
+    targets = []
+    errors = []
+    for target in body["targets"]:
+        try:
+            targets.append(parse_target_name(target)[1])
+        except ValueError as exc:
+            errors.append({"target": target, "message": str(exc)})
+
+    if len(targets) == 0:
+        messages.append("No valid targets.")
+
+    sources = body.get("sources")
+    _sources = allowed_sources if sources is None else sources
+    uncertainty_ellipse = body.get("uncertainty_ellipse", False)
+    padding = body.get("padding", 0)
+    cached = body.get("cached", True)
+
+    try:
+        sanitized_start_date = _parse_date(body.get("start_date"), "start")
+        sanitized_stop_date = _parse_date(body.get("stop_date"), "stop")
+    except ValueError as exc:  # noqa F841
+        messages.append(str(exc))
+
+    if len(messages) > 0:
+        result = {
+            "error": True,
+            "queued": False,
+            "errors": errors,
+            "message": "  ".join(messages),
+            "version": version,
+        }
+        logger.info(json.dumps(result))
+        return result
+
+    result = {
+        "query": {
+            "targets": targets,
+            "sources": _sources,
+            "start_date": _format_date(sanitized_start_date),
+            "stop_date": _format_date(sanitized_stop_date),
+            "cached": cached,
+            "uncertainty_ellipse": uncertainty_ellipse,
+            "padding": padding,
+        },
+        "batch_id": batch_id.hex,
+        "jobs": [],
+        "errors": errors,
+        "error": False,
+        "queued": False,
+        "queue_full": False,
+        "queue_position": None,
+        "estimated_cost": None,
         "message": None,
         "version": version,
     }
 
-    Message.reset_t0()
-    listen_for_task_messages(job_id)
+    if len(errors) > 0:
+        messages.append(f"Skipped {len(errors)} invalid target(s).")
 
-    status = catch_service(
-        job_id,
-        sanitized_target,
+    status, result["jobs"] = batch_service(
+        batch_id,
+        targets,
         sources=_sources,
         start_date=sanitized_start_date,
         stop_date=sanitized_stop_date,
         uncertainty_ellipse=uncertainty_ellipse,
         padding=padding,
         cached=cached,
+        client=_client(),
     )
 
     parsed = urllib.parse.urlsplit(request.url_root)
     results_url = urllib.parse.urlunsplit(
-        (parsed[0], parsed[1], os.path.join(parsed[2], "caught", job_id.hex), "", "")
+        (
+            parsed[0],
+            parsed[1],
+            os.path.join(parsed[2], "caught", "batch", batch_id.hex),
+            "",
+            "",
+        )
     )
     message_stream_url = urllib.parse.urlunsplit(
-        (parsed[0], parsed[1], os.path.join(parsed[2], "stream"), "", "")
+        (parsed[0], parsed[1], os.path.join(parsed[2], "stream", batch_id.hex), "", "")
     )
 
     if status == QueryStatus.QUEUED:
-        for job in queue_service()["jobs"]:
-            if job["prefix"] == job_id.hex[:8]:
-                result["queue_position"] = job["position"]
-                break
+        queue = JobsQueue()
+        result["queue_position"] = queue.position(batch_id)
+        result["estimated_cost"] = queue.cost(batch_id)
 
         result["queued"] = True
         result["message_stream"] = message_stream_url
         result["results"] = results_url
         messages.append(
-            "Enqueued search.  Listen to task messaging stream until job "
+            "Enqueued batch.  Listen to the batch's task messaging stream until "
             "completed, then retrieve data from results URL."
         )
     elif status == QueryStatus.QUEUEFULL:
         result["error"] = True
-        result["queued"] = False
         result["queue_full"] = True
         messages.append("Queue is full, please try again later.")
+    elif status == QueryStatus.CLIENTLIMIT:
+        result["error"] = True
+        messages.append(
+            "Too many of your queries are in progress, please try again later."
+        )
     else:
         # status.SUCCESS
-        result["queued"] = False
         result["results"] = results_url
         messages.append("Found cached data.  Retrieve from results URL.")
 
     result["message"] = "  ".join(messages)
     logger.info(json.dumps(result))
-    stop_listening_for_task_messages(job_id)
     return result
@@ -1,25 +1,183 @@
 import uuid
+from typing import Any, Dict, Generator, Iterator
 
-from ..services.caught import caught_service
+from flask import Response, current_app, stream_with_context
+
+from ..services.caught import caught_service, caught_count_service
+from ..services import filters as result_filters
+from ..services import marshal
+from ..services.batch import caught_batch_service
+from ..services.pagination import decode_cursor, encode_cursor
 from ..services.status.job_id import job_id_service
 from .. import __version__ as version
 
+# number of rows serialized per chunk of a streamed response
+STREAM_BATCH_SIZE: int = 100
+
+# fields that may be requested from caught results
+CAUGHT_FIELDS: tuple[str, ...] = tuple(
+    dict.fromkeys(
+        marshal.OBSERVATION_FIELDS
+        + marshal.FOUND_FIELDS
+        + marshal.survey_specific_keys()
+    )
+)
+
+
+def _stream_caught(
+    header: dict, rows: Generator[Dict[str, Any], None, None], limit: int | None
+) -> Iterator[str]:
+    """Incrementally serialize the caught results as a JSON object.
+
+    The header items are serialized first, followed by the data rows in small
+    batches, and finally the continuation cursor.
+
+    """
+
+    dumps = current_app.json.dumps
+    yield dumps(header).rstrip()[:-1] + ', "data": ['
+
+    count: int = 0
+    batch: list[str] = []
+    last: Dict[str, Any] | None = None
+    next_cursor: str | None = None
+    try:
+        for row in rows:
+            if limit is not None and count == limit:
+                # there is at least one more row
+                next_cursor = encode_cursor(last)
+                break
+
+            batch.append(dumps(row))
+            count += 1
+            last = row
+            if len(batch) == STREAM_BATCH_SIZE:
+                yield ("," if count > len(batch) else "") + ",".join(batch)
+                batch = []
+    finally:
+        # release the database session
+        rows.close()
+
+    if len(batch) > 0:
+        yield ("," if count > len(batch) else "") + ",".join(batch)
+
+    yield '], "next_cursor": ' + dumps(next_cursor) + "}"
+
+
+def caught_controller(
+    job_id: str,
+    stream: bool = False,
+    limit: int | None = None,
+    cursor: str | None = None,
+    sources: list[str] | None = None,
+    fields: list[str] | None = None,
+    **ranges: float | None,
+) -> dict | tuple[str, int]:
+    """Controller for returning caught data.
+
+    Parameters
+    ----------
+    job_id : str
+        Unique job ID for the search.
+
+    stream : bool, optional
+        Incrementally serialize the response rather than building it in memory.
+
+    limit : int, optional
+        Return at most this many rows.
+
+    cursor : str, optional
+        Continuation token from a previous response (``next_cursor``).
+
+    sources : list of str, optional
+        Only return observations from these sources.
 
-def caught_controller(job_id: str) -> dict | tuple[str, int]:
-    """Controller for returning caught data."""
+    fields : list of str, optional
+        Only return these fields, and the product ID and start time.
+
+    **ranges : float, optional
+        Only return observations with quantities in these ranges, e.g.,
+        ``seeing_max``, see `services.filters.from_parameters`.
+
+    """
 
     try:
         _job_id: uuid.UUID = uuid.UUID(job_id, version=4)
     except ValueError:
         return "Invalid job ID", 400
 
+    try:
+        after = None if cursor is None else decode_cursor(cursor)
+        filters = result_filters.from_parameters(**ranges)
+        result_filters.validate(filters)
+        marshal.check_fields(fields, CAUGHT_FIELDS)
+    except ValueError as exc:
+        return str(exc), 400
+
     parameters, status = job_id_service(_job_id)
-    data = caught_service(_job_id)
-    return {
+    if sources is None and len(filters) == 0:
+        # total number of results, from the per-source database counts
+        count = sum([source["count"] for source in status])
+    else:
+        count = caught_count_service(_job_id, sources=sources, filters=filters)
+
+    header = {
         "parameters": parameters,
         "status": status,
-        "count": len(data),
+        "count": count,
         "job_id": _job_id.hex,
         "version": version,
-        "data": data,
     }
+
+    # request one extra row to test for another page
+    rows = caught_service(
+        _job_id,
+        limit=None if limit is None else limit + 1,
+        after=after,
+        sources=sources,
+        filters=filters,
+        fields=fields,
+    )
+
+    if stream:
+        return Response(
+            stream_with_context(_stream_caught(header, rows, limit)),
+            mimetype="application/json",
+        )
+
+    data = list(rows)
+    next_cursor = None
+    if limit is not None and len(data) > limit:
+        data = data[:limit]
+        next_cursor = encode_cursor(data[-1])
+
+    return {**header, "next_cursor": next_cursor, "data": data}
+
+
+def caught_batch_controller(
+    batch_id: str, data: bool = False
+) -> dict | tuple[str, int]:
+    """Controller for returning the status and data of a batch of queries.
+
+    Parameters
+    ----------
+    batch_id : str
+        Unique batch ID.
+
+    data : bool, optional
+        Include the caught data of all queries, otherwise only the status.
+        For large batches, page through each query's data with
+        ``/caught/{job_id}`` instead.
+
+    """
+
+    try:
+        _batch_id: uuid.UUID = uuid.UUID(batch_id, version=4)
+    except ValueError:
+        return "Invalid batch ID", 400
+
+    batch = caught_batch_service(_batch_id, data=data)
+    if batch is None:
+        return "Batch not found", 404
+
+    return {"batch_id": _batch_id.hex, "version": version, **batch}
@@ -1,13 +1,46 @@
 # Licensed with the 3-clause BSD license.  See LICENSE for details.
 
+import os
 import json
 import uuid
+import urllib.parse
+
+from flask import request
+
 from ..validation import parse_ra, parse_dec, parse_date
-from ..services.fixed import fixed_target_query_service
-from ..config import CatchApisException, get_logger, allowed_sources
+from ..services.fixed import (
+    fixed_target_query_service,
+    fixed_target_batch_service,
+    fixed_results_service,
+    fixed_batch_results_service,
+)
+from ..services.fixed_job import (
+    fixed_cost_service,
+    fixed_batch_cost_service,
+    fixed_job_service,
+    fixed_batch_job_service,
+)
+from ..services.pagination import decode_cursor, encode_cursor
+from ..services import filters as result_filters
+from ..services import marshal
+from ..services.queue import JobsQueue
+from ..services.message import (
+    Message,
+    listen_for_task_messages,
+    stop_listening_for_task_messages,
+)
+from ..config import CatchApisException, QueryStatus, get_logger, allowed_sources
+from ..config.env import ENV
+from .catch import _client
 from .. import __version__ as version
 
 
+# fields that may be requested from fixed target queries
+OBSERVATION_FIELDS: tuple[str, ...] = (
+    marshal.OBSERVATION_FIELDS + marshal.survey_specific_keys()
+)
+
+
 def _format_date(date):
     return date if date is None else date.iso
 
@@ -32,9 +65,17 @@ def fixed_target_query_controller(
     stop_date: str | None = None,
     radius: float = 0,
     intersection_type: str = "ImageIntersectsArea",
+    limit: int | None = None,
+    cursor: str | None = None,
+    fields: list[str] | None = None,
+    **ranges: float | None,
 ) -> dict:
     """Controller for fixed target queries.
 
+    Queries with an estimated cost greater than ``ENV.FIXED_INLINE_MAX_COST``
+    seconds are queued, and the results are retrieved with
+    `fixed_results_controller`.
+
     Parameters
     ----------
     ra : string
@@ -62,6 +103,20 @@ def fixed_target_query_controller(
         Type of intersections to allow between search area and data.  See
         `catch.IntersectionType` for valid names.
 
+    limit : int, optional
+        Return at most this many observations.
+
+    cursor : str, optional
+        Continuation token from a previous response (``next_cursor``).
+
+    fields : list of str, optional
+        Only return these observation fields, and the product ID and start
+        time.
+
+    **ranges : float, optional
+        Only return observations with quantities in these ranges, e.g.,
+        ``seeing_max``, see `services.filters.from_parameters`.
+
     """
 
     logger = get_logger()
@@ -87,12 +142,65 @@ def fixed_target_query_controller(
         messages.append(str(exc))
         valid_query = False
 
+    try:
+        after = None if cursor is None else decode_cursor(cursor)
+    except ValueError as exc:
+        messages.append(str(exc))
+        valid_query = False
+
+    try:
+        filters = result_filters.from_parameters(
+            result_filters.OBSERVATION_FIELDS, **ranges
+        )
+        result_filters.validate(filters)
+    except ValueError as exc:
+        messages.append(str(exc))
+        valid_query = False
+
+    try:
+        marshal.check_fields(fields, OBSERVATION_FIELDS)
+    except ValueError as exc:
+        messages.append(str(exc))
+        valid_query = False
+
     if not valid_query:
         return invalid_query(messages)
 
+    query = {
+        "ra": sanitized_ra.deg,
+        "dec": sanitized_dec.deg,
+        "sources": _sources,
+        "start_date": _format_date(sanitized_start_date),
+        "stop_date": _format_date(sanitized_stop_date),
+        "radius": radius,
+        "intersection_type": intersection_type,
+        "filters": filters,
+        "fields": fields,
+    }
+
     data = []
     try:
-        data = fixed_target_query_service(
+        cost = fixed_cost_service(
+            _sources, sanitized_start_date, sanitized_stop_date, radius
+        ).total
+        if cost > ENV.FIXED_INLINE_MAX_COST:
+            return _enqueue(
+                job_id,
+                sanitized_ra,
+                sanitized_dec,
+                sources,
+                sanitized_start_date,
+                sanitized_stop_date,
+                radius,
+                intersection_type,
+                query,
+                cost,
+                filters,
+                fields,
+            )
+
+        # request one extra row to test for another page
+        data, count = fixed_target_query_service(
             job_id,
             sanitized_ra,
             sanitized_dec,
@@ -101,6 +209,10 @@ def fixed_target_query_controller(
             sanitized_stop_date,
             radius,
             intersection_type,
+            limit=None if limit is None else limit + 1,
+            after=after,
+            filters=filters,
+            fields=fields,
         )
     except CatchApisException as exc:
         logger.exception("Error during fixed target query.")
@@ -113,22 +225,440 @@ def fixed_target_query_controller(
         )
         return invalid_query(messages)
 
+    next_cursor = None
+    if limit is not None and len(data) > limit:
+        data = data[:limit]
+        next_cursor = encode_cursor(data[-1])
+
     # add data to the result after logging
     result = {
         "message": "  ".join(messages),
         "version": version,
-        "query": {
-            "ra": sanitized_ra.deg,
-            "dec": sanitized_dec.deg,
-            "sources": _sources,
-            "start_date": _format_date(sanitized_start_date),
-            "stop_date": _format_date(sanitized_stop_date),
-            "radius": radius,
-            "intersection_type": intersection_type,
-        },
-        "count": len(data),
+        "query": query,
+        "queued": False,
+        "estimated_cost": cost,
+        "count": count,
+        "next_cursor": next_cursor,
     }
 
     logger.info(json.dumps(result))
     result["data"] = data
     return result
+
+
+def _url(*path: str) -> str:
+    """Absolute URL of an API route."""
+    parsed = urllib.parse.urlsplit(request.url_root)
+    return urllib.parse.urlunsplit(
+        (parsed[0], parsed[1], os.path.join(parsed[2], *path), "", "")
+    )
+
+
+def _enqueue(
+    job_id: uuid.UUID,
+    ra,
+    dec,
+    sources: list[str] | None,
+    start_date,
+    stop_date,
+    radius: float,
+    intersection_type: str,
+    query: dict,
+    cost: float,
+    filters: dict,
+    fields: list[str] | None,
+) -> dict:
+    """Enqueue a fixed target query and form the response."""
+
+    Message.reset_t0()
+    listen_for_task_messages(job_id)
+    status = fixed_job_service(
+        job_id,
+        ra,
+        dec,
+        sources,
+        start_date,
+        stop_date,
+        radius,
+        intersection_type,
+        query,
+        cost,
+        client=_client(),
+        filters=filters,
+        fields=fields,
+    )
+    stop_listening_for_task_messages(job_id)
+
+    return _queued_result(job_id, status, query, cost, ("fixed", job_id.hex))
+
+
+def _queued_result(
+    job_id: uuid.UUID,
+    status: QueryStatus,
+    query: dict,
+    cost: float,
+    results: tuple[str, ...],
+    **extra,
+) -> dict:
+    """Form the response for a queued, or refused, query.
+
+    Parameters
+    ----------
+    results : tuple of str
+        Path of the results route.
+
+    **extra
+        Additional response items.
+
+    """
+
+    logger = get_logger()
+    messages = []
+
+    result = {
+        "error": False,
+        "message": None,
+        "version": version,
+        "query": query,
+        "job_id": job_id.hex,
+        "queued": False,
+        "queue_full": False,
+        "queue_position": None,
+        "estimated_cost": cost,
+        **extra,
+    }
+
+    if status == QueryStatus.QUEUED:
+        result["queued"] = True
+        result["queue_position"] = JobsQueue().position(job_id)
+        result["message_stream"] = _url("stream", job_id.hex)
+        result["results"] = _url(*results)
+        messages.append(
+            "Enqueued search.  Listen to task messaging stream until job "
+            "completed, then retrieve data from results URL."
+        )
+    elif status == QueryStatus.QUEUEFULL:
+        result["error"] = True
+        result["queue_full"] = True
+        messages.append("Queue is full, please try again later.")
+    else:
+        # QueryStatus.CLIENTLIMIT
+        result["error"] = True
+        messages.append(
+            "Too many of your queries are in progress, please try again later."
+        )
+
+    result["message"] = "  ".join(messages)
+    logger.info(json.dumps(result))
+    return result
+
+
+def fixed_results_controller(
+    job_id: str,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> dict | tuple[str, int]:
+    """Controller for returning the results of a queued fixed target query.
+
+    Parameters
+    ----------
+    job_id : str
+        Unique job ID for the search.
+
+    limit : int, optional
+        Return at most this many observations.
+
+    cursor : str, optional
+        Continuation token from a previous response (``next_cursor``).
+
+    """
+
+    try:
+        _job_id: uuid.UUID = uuid.UUID(job_id, version=4)
+    except ValueError:
+        return "Invalid job ID", 400
+
+    try:
+        after = None if cursor is None else decode_cursor(cursor)
+    except ValueError as exc:
+        return str(exc), 400
+
+    # request one extra row to test for another page
+    results = fixed_results_service(
+        _job_id, limit=None if limit is None else limit + 1, after=after
+    )
+
+    if results is None:
+        if JobsQueue().cost(_job_id) is None:
+            return "Job not found", 404
+
+        return {
+            "job_id": _job_id.hex,
+            "version": version,
+            "complete": False,
+            "status": "in progress",
+            "message": "Query in progress, please try again later.",
+        }
+
+    data = results.pop("data")
+    next_cursor = None
+    if limit is not None and len(data) > limit:
+        data = data[:limit]
+        next_cursor = encode_cursor(data[-1])
+
+    return {
+        "job_id": _job_id.hex,
+        "version": version,
+        "complete": True,
+        **results,
+        "next_cursor": next_cursor,
+        "data": data,
+    }
+
+
+def fixed_batch_controller(body: dict) -> dict:
+    """Controller for batches of fixed target queries.
+
+    Batches with an estimated cost greater than ``ENV.FIXED_INLINE_MAX_COST``
+    seconds are queued, and the results are retrieved with
+    `fixed_batch_results_controller`.
+
+    Parameters
+    ----------
+    body : dict
+        The request body:
+        - positions: list of dict, each with ra, dec, and optionally radius, see
+          `fixed_target_query_controller`
+        - sources, start_date, stop_date, intersection_type: shared query
+          parameters, see `fixed_target_query_controller`
+
+    """
+
+    logger = get_logger()
+    job_id = uuid.uuid4()
+    messages = []
+
+    # validate all positions, and only search the valid ones
+    positions = []
+    errors = []
+    for index, position in enumerate(body["positions"]):
+        try:
+            positions.append(
+                (
+                    parse_ra(str(position["ra"])),
+                    parse_dec(str(position["dec"])),
+                    position.get("radius", 0),
+                )
+            )
+        except ValueError as exc:
+            errors.append({"index": index, "message": str(exc)})
+
+    if len(positions) == 0:
+        messages.append("No valid positions.")
+
+    sources = body.get("sources")
+    _sources = allowed_sources if sources is None else sources
+    intersection_type = body.get("intersection_type", "ImageIntersectsArea")
+
+    try:
+        sanitized_start_date = parse_date(body.get("start_date"), "start")
+        sanitized_stop_date = parse_date(body.get("stop_date"), "stop")
+    except ValueError as exc:
+        messages.append(str(exc))
+
+    if len(messages) > 0:
+        return {**invalid_query(messages), "errors": errors}
+
+    query = {
+        "sources": _sources,
+        "start_date": _format_date(sanitized_start_date),
+        "stop_date": _format_date(sanitized_stop_date),
+        "intersection_type": intersection_type,
+    }
+
+    if len(errors) > 0:
+        messages.append(f"Skipped {len(errors)} invalid position(s).")
+
+    try:
+        cost = sum(
+            [
+                estimate.total
+                for estimate in fixed_batch_cost_service(
+                    _sources,
+                    sanitized_start_date,
+                    sanitized_stop_date,
+                    [radius for _, _, radius in positions],
+                )
+            ]
+        )
+        if cost > ENV.FIXED_INLINE_MAX_COST:
+            Message.reset_t0()
+            listen_for_task_messages(job_id)
+            status = fixed_batch_job_service(
+                job_id,
+                positions,
+                sources,
+                sanitized_start_date,
+                sanitized_stop_date,
+                intersection_type,
+                query,
+                cost,
+                client=_client(),
+            )
+            stop_listening_for_task_messages(job_id)
+
+            result = _queued_result(
+                job_id,
+                status,
+                query,
+                cost,
+                ("fixed", "batch", job_id.hex),
+                errors=errors,
+            )
+            result["message"] = "  ".join(messages + [result["message"]])
+            return result
+
+        results = fixed_target_batch_service(
+            job_id,
+            positions,
+            sources,
+            sanitized_start_date,
+            sanitized_stop_date,
+            intersection_type,
+        )
+    except CatchApisException as exc:
+        logger.exception("Error during fixed target batch query.")
+        messages.append(str(exc))
+        return {**invalid_query(messages), "errors": errors}
+    except Exception:
+        logger.exception("Unexpected error during fixed target batch query.")
+        messages.append(
+            "Unexpected error.  Please contact us with the details of your query."
+        )
+        return {**invalid_query(messages), "errors": errors}
+
+    # add data to the result after logging
+    result = {
+        "error": False,
+        "message": "  ".join(messages),
+        "version": version,
+        "query": query,
+        "job_id": job_id.hex,
+        "queued": False,
+        "estimated_cost": cost,
+        "errors": errors,
+        "count": sum([position["count"] for position in results]),
+    }
+
+    logger.info(json.dumps(result))
+    result["positions"] = results
+    return result
+
+
+def fixed_batch_results_controller(job_id: str) -> dict | tuple[str, int]:
+    """Controller for returning the results of a queued batch of fixed target
+    queries.
+
+    The observations found at each position are retrieved with
+    `fixed_batch_position_controller`.
+
+    Parameters
+    ----------
+    job_id : str
+        Unique job ID for the batch.
+
+    """
+
+    try:
+        _job_id: uuid.UUID = uuid.UUID(job_id, version=4)
+    except ValueError:
+        return "Invalid job ID", 400
+
+    results = fixed_batch_results_service(_job_id)
+    if results is None:
+        return _batch_in_progress(_job_id)
+
+    for index, position in enumerate(results["positions"]):
+        position["results"] = _url("fixed", "batch", _job_id.hex, str(index))
+
+    return {
+        "job_id": _job_id.hex,
+        "version": version,
+        "complete": True,
+        **results,
+    }
+
+
+def fixed_batch_position_controller(
+    job_id: str,
+    position: int,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> dict | tuple[str, int]:
+    """Controller for returning the observations found at one position of a
+    queued batch of fixed target queries.
+
+    Parameters
+    ----------
+    job_id : str
+        Unique job ID for the batch.
+
+    position : int
+        Index of the position in the batch.
+
+    limit, cursor
+        See `fixed_results_controller`.
+
+    """
+
+    try:
+        _job_id: uuid.UUID = uuid.UUID(job_id, version=4)
+    except ValueError:
+        return "Invalid job ID", 400
+
+    try:
+        after = None if cursor is None else decode_cursor(cursor)
+    except ValueError as exc:
+        return str(exc), 400
+
+    # request one extra row to test for another page
+    try:
+        results = fixed_batch_results_service(
+            _job_id,
+            position=position,
+            limit=None if limit is None else limit + 1,
+            after=after,
+        )
+    except IndexError as exc:
+        return str(exc), 404
+
+    if results is None:
+        return _batch_in_progress(_job_id)
+
+    data = results.pop("data")
+    next_cursor = None
+    if limit is not None and len(data) > limit:
+        data = data[:limit]
+        next_cursor = encode_cursor(data[-1])
+
+    return {
+        "job_id": _job_id.hex,
+        "version": version,
+        "complete": True,
+        **results,
+        "next_cursor": next_cursor,
+        "data": data,
+    }
+
+
+def _batch_in_progress(job_id: uuid.UUID) -> dict | tuple[str, int]:
+    if JobsQueue().cost(job_id) is None:
+        return "Job not found", 404
+
+    return {
+        "job_id": job_id.hex,
+        "version": version,
+        "complete": False,
+        "status": "in progress",
+        "message": "Query in progress, please try again later.",
+    }
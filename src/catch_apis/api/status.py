@@ -5,18 +5,50 @@ Exposes results from the survey_statistics database table.
 """
 
 from uuid import UUID
-from ..services.status.sources import sources_service
+from email.utils import format_datetime
+
+from flask import request
+
+from ..services.status.cache import CachedResult, cached_result
+from ..services.status.sources import sources_service, sources_last_updated
 from ..services.status.job_id import job_id_service
 from ..services.status.updates import updates_service
 from ..services.status.queue import queue_service
 from ..services.status.queries import queries_service
+from ..services.status.connections import connections_service
 from .. import __version__ as version
 
 
-def sources_controller() -> list[dict[str, str | int | None]]:
+def _conditional_response(result: CachedResult) -> tuple[object, int, dict]:
+    """Response for a cached result, honoring conditional request headers."""
+
+    etag: str = f'"{result.etag}"'
+    headers: dict[str, str] = {"ETag": etag, "Cache-Control": "no-cache"}
+    if result.last_modified is not None:
+        headers["Last-Modified"] = format_datetime(result.last_modified, usegmt=True)
+
+    if request.if_none_match:
+        not_modified: bool = request.if_none_match.contains(result.etag)
+    else:
+        not_modified = (
+            request.if_modified_since is not None
+            and result.last_modified is not None
+            and result.last_modified.replace(microsecond=0)
+            <= request.if_modified_since
+        )
+
+    if not_modified:
+        return "", 304, headers
+
+    return result.data, 200, headers
+
+
+def sources_controller() -> tuple[object, int, dict]:
     """Controller to return survey database status."""
 
-    return sources_service()
+    return _conditional_response(
+        cached_result("sources", sources_service, sources_last_updated)
+    )
 
 
 def job_id_controller(job_id: str) -> dict | tuple[str, int]:
@@ -37,10 +69,12 @@ def job_id_controller(job_id: str) -> dict | tuple[str, int]:
     }
 
 
-def updates_controller() -> list[dict[str, str | int | None]]:
+def updates_controller() -> tuple[object, int, dict]:
     """Controller to return summary of recent updates."""
 
-    return updates_service()
+    return _conditional_response(
+        cached_result("updates", updates_service, sources_last_updated)
+    )
 
 
 def queue_controller() -> dict[str, bool | list[dict[str, str | int]]]:
@@ -49,7 +83,13 @@ def queue_controller() -> dict[str, bool | list[dict[str, str | int]]]:
     return queue_service()
 
 
-def queries_controller() -> list[dict[str, str | int]]:
+def queries_controller() -> tuple[object, int, dict]:
     """Controller to return summary of recent queries."""
 
-    return queries_service()
+    return _conditional_response(cached_result("queries", queries_service))
+
+
+def connections_controller() -> dict[str, dict[str, bool | int | float]]:
+    """Controller to return summary of connection pools."""
+
+    return connections_service()
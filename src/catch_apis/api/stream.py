@@ -0,0 +1,79 @@
+"""Task messaging streams.
+
+openapi does not support server-sent events, so the streams are served by
+Starlette routes, ahead of the connexion application (see `StreamMiddleware`).
+
+"""
+
+from uuid import UUID
+
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route, Router
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from ..services import stream as stream_service
+
+STREAM_HEADERS: dict[str, str] = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "Keep-Alive": "timeout=55",
+}
+
+
+async def stream_controller(request: Request) -> Response:
+    """Shared task messaging stream."""
+
+    return StreamingResponse(
+        stream_service.message_stream_service(),
+        media_type="text/event-stream",
+        headers=STREAM_HEADERS,
+    )
+
+
+async def job_stream_controller(request: Request) -> Response:
+    """Task messaging stream for a single job.
+
+    Closes after the job succeeds or fails.  Clients may resume the stream with
+    the Last-Event-ID header.
+
+    """
+
+    try:
+        job_id: UUID = UUID(request.path_params["job_id"], version=4)
+    except ValueError:
+        return PlainTextResponse("Invalid job ID", status_code=400)
+
+    last_event_id: str | None = request.headers.get("Last-Event-ID")
+    try:
+        if last_event_id is not None:
+            stream_service.stream_id_key(last_event_id)
+    except ValueError:
+        return PlainTextResponse("Invalid Last-Event-ID", status_code=400)
+
+    return StreamingResponse(
+        stream_service.job_message_stream_service(job_id, last_event_id),
+        media_type="text/event-stream",
+        headers=STREAM_HEADERS,
+    )
+
+
+class StreamMiddleware:
+    """Serve the message streams, passing all other requests to the app."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app: ASGIApp = app
+        self.router: Router = Router(
+            routes=[
+                Route("/stream", stream_controller),
+                Route("/stream/{job_id}", job_stream_controller),
+            ],
+            redirect_slashes=False,
+            default=app,
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            await self.router(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
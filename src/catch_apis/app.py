@@ -5,12 +5,11 @@ import logging
 import connexion
 from connexion.middleware import MiddlewarePosition
 from starlette.middleware.cors import CORSMiddleware
-from flask import Response
 
 from catch_apis.config.env import ENV
 from . import __version__ as version
 from .config import allowed_sources, get_logger
-from .services.stream import message_stream_service
+from .api.stream import StreamMiddleware
 
 logger: logging.Logger = get_logger()
 app = connexion.FlaskApp(__name__, specification_dir="api/")
@@ -24,35 +23,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# openapi does not support SSE; the /stream routes are served by middleware
+app.add_middleware(StreamMiddleware, position=MiddlewarePosition.BEFORE_SWAGGER)
+
 app.add_api(
     "openapi.yaml",
     arguments={
         "version": version,
         "base_href": ENV.BASE_HREF,
         "sources": allowed_sources,
+        "batch_max_targets": ENV.CATCH_BATCH_MAX_TARGETS,
+        "fixed_batch_max_positions": ENV.FIXED_BATCH_MAX_POSITIONS,
     },
 )
 application = app.app
 
-# openapi does not support SSE; define /stream here
-
-
-@application.route("/stream")
-def stream() -> Response:
-    """Shared task messaging stream."""
-
-    return Response(
-        message_stream_service(),
-        mimetype="text/event-stream",
-        headers={
-            "Content-Type": "text/event-stream",
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Keep-Alive": "timeout=55",
-        },
-    )
-
-
 if __name__ == "__main__":  # pragma: no cover
     # for development
     logger.info("Running " + ENV.APP_NAME)
@@ -28,4 +28,5 @@ class QueryStatus(enum.Enum):
     SUCCESS: str = "success"
     QUEUED: str = "queued"
     QUEUEFULL: str = "queue full"
+    CLIENTLIMIT: str = "client limit"
     FAILED: str = "failed"
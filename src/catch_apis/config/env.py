@@ -41,11 +41,49 @@ class ENV:
     API_PORT: int = 5000
     REDIS_PORT: int = 6379
     REDIS_JOBS_MAX_QUEUE_SIZE: int = 5
+    REDIS_JOBS_MAX_QUEUE_WORK: int = 7200  # seconds of estimated work
+    REDIS_JOBS_MAX_PER_CLIENT: int = 0  # queued jobs per client, 0 for no limit
+    TRUSTED_PROXIES: int = 0  # proxies in front of the API, see X-Forwarded-For
+    REDIS_JOBS_HIGH_PRIORITY_COST: int = 60  # seconds, see queue_priority
+    REDIS_JOBS_LOW_PRIORITY_COST: int = 600  # seconds, see queue_priority
     REDIS_TASK_MESSAGES_MAX_QUEUE_SIZE: int = 1000
+    REDIS_TASK_MESSAGES_BATCH_SIZE: int = 100  # messages per pipeline
+    REDIS_TASK_MESSAGES_FLUSH_INTERVAL: int = 250  # milliseconds
+    REDIS_MAX_CONNECTIONS: int = 100  # per process
+    REDIS_POOL_TIMEOUT: int = 20  # seconds
     STREAM_TIMEOUT: int = 60  # seconds
+    STREAM_READ_COUNT: int = 100  # messages per read from redis
+    STREAM_CLIENT_QUEUE_SIZE: int = 1000  # messages waiting for each client
+    DB_POOL_SIZE: int = 5  # 0 to disable connection pooling
+    DB_POOL_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30  # seconds
+    DB_POOL_RECYCLE: int = 3600  # seconds
+    CATCH_UNCACHED_TTL: int = 10  # seconds to remember cache misses
+    STATUS_CACHE_TTL: int = 60  # seconds
+    CATCH_COST_HISTORY: int = 100  # past queries per source for cost estimates
+    CATCH_COST_TTL: int = 600  # seconds to remember cost estimates
+    CATCH_DEFAULT_SOURCE_COST: int = 60  # seconds, for sources without history
+    CATCH_JOB_TIMEOUT_MIN: int = 1200  # seconds
+    CATCH_JOB_TIMEOUT_MAX: int = 14400  # seconds
+    CATCH_BATCH_MAX_TARGETS: int = 1000  # targets per batch query
+    FIXED_SOURCE_COST: int = 1  # seconds, point search of a full survey
+    FIXED_INLINE_MAX_COST: int = 30  # seconds, larger fixed queries are queued
+    FIXED_RESULTS_TTL: int = 86400  # seconds to keep queued fixed query results
+    FIXED_BATCH_MAX_POSITIONS: int = 1000  # positions per batch fixed query
+    FIXED_CACHE_SIZE: int = 1000  # cached fixed target searches, 0 to disable
+    FIXED_CACHE_QUANTUM: int = 1  # arcsec, fixed target search cache resolution
+    WORQER_MAX_JOBS: int = 1000  # warm woRQer restarts after this many jobs
+    WORQER_MAX_RSS: int = 2048  # MB, warm woRQer restarts above this
+    EPHEMERIS_CACHE_TTL: int = 21600  # seconds, e.g., unnumbered asteroids
+    EPHEMERIS_CACHE_TTL_COMET: int = 86400  # seconds
+    EPHEMERIS_CACHE_TTL_NUMBERED: int = 604800  # seconds, numbered asteroids
 
     # Boolean Properties
     DEBUG: bool = False
+    REDIS_TASK_MESSAGES_ASYNC: bool = True  # publish log messages in background
+    STATUS_CACHE_SHARED: bool = False  # share status responses via redis
+    WORQER_WARM: bool = False  # run jobs in the woRQer process
+    EPHEMERIS_CACHE: bool = True  # share ephemerides between woRQers via redis
 
     @staticmethod
     def _get_parameters() -> Tuple[str, str | int | bool]:
@@ -0,0 +1,347 @@
+"""Service provider for batches of moving target queries.
+
+A batch is a list of targets searched with the same parameters.  Each target
+has its own job ID, so that its results may also be retrieved with the single
+target services, but the targets are validated, checked against the cache, and
+admitted to the queue together, as one job.  Each target is searched by its own
+rq job, with its own time limit, and a final job reports the batch's status.
+The batch's jobs are recorded in the ``catch_apis_batch`` table.
+
+"""
+
+from typing import Any, Dict, List, Tuple, Union
+from uuid import UUID, uuid4
+from time import time
+
+from astropy.time import Time
+from rq.job import Dependency
+from sqlalchemy import Column, DateTime, Integer, String, func
+from catch.model import CatchQuery, Found
+
+from .catch_manager import Catch, catch_manager
+from .catch import admit, cached_queries_many
+from .caught import caught_service
+from .cost import CostEstimate, estimate_costs, job_timeout
+from .queue import JobsQueue, rq_job_id
+from .query_alias import Base, add_aliases, create_tables, queries_from_job_ids
+from ..tasks.catch import catch_task, catch_finalize_task, catch_batch_finalize_task
+from ..config import QueryStatus
+
+
+class BatchJob(Base):
+    """A moving target query in a batch."""
+
+    __tablename__ = "catch_apis_batch"
+    batch_id = Column(String(32), primary_key=True)  # hex
+    job_id = Column(String(32), primary_key=True)  # hex
+    position = Column(Integer, nullable=False)
+    target = Column(String, nullable=False)
+    created = Column(DateTime, nullable=False, server_default=func.now())
+
+
+def batch_service(
+    batch_id: UUID,
+    targets: List[str],
+    sources: List[str],
+    start_date: Union[Time, None],
+    stop_date: Union[Time, None],
+    uncertainty_ellipse: bool,
+    padding: float,
+    cached: bool,
+    client: Union[str, None] = None,
+) -> Tuple[QueryStatus, List[Dict[str, Any]]]:
+    """Enqueue a batch of queries, or refer to cached results.
+
+    Targets with cached results for all sources are not searched.  The others
+    are admitted to the queue together, according to their total estimated
+    cost.  If the batch is refused, it is not recorded.
+
+    Each target is searched by a task limited by its own estimated cost, and
+    finalized by `tasks.catch.catch_finalize_task`.  After all targets are
+    finalized, `tasks.catch.catch_batch_finalize_task` reports the batch's
+    status.  The rq jobs are grouped under the batch ID in the queue.
+
+
+    Parameters
+    ----------
+    batch_id : UUID
+        Unique batch identifier.
+
+    targets : list of str
+        The sanitized target names, see `validation.parse_target_name`.
+        Duplicates are ignored.
+
+    sources, start_date, stop_date, uncertainty_ellipse, padding, cached, client
+        See `catch.catch_service`.
+
+
+    Returns
+    -------
+    status : QueryStatus
+        ``QUEUED`` if any target is searched, ``SUCCESS`` if all are cached, or
+        else the reason the batch was refused.
+
+    jobs : list of dict
+        For each target, in order:
+        - target: target name
+        - job_id: unique job ID (hex)
+        - queued: ``True`` if the target will be searched
+
+    """
+
+    targets = list(dict.fromkeys(targets))
+    job_ids: Dict[str, UUID] = {target: uuid4() for target in targets}
+
+    with catch_manager() as catch:
+        cache: Dict[str, Dict[str, Union[int, None]]]
+        if cached:
+            cache = cached_queries_many(
+                catch,
+                targets,
+                sources,
+                start_date,
+                stop_date,
+                uncertainty_ellipse,
+                padding,
+            )
+        else:
+            cache = {target: dict.fromkeys(sources) for target in targets}
+
+        # sources to search for each target
+        queue_sources: Dict[str, List[str]] = {}
+        for target in targets:
+            uncached: List[str] = [
+                source for source in sources if cache[target][source] is None
+            ]
+            if len(uncached) > 0:
+                queue_sources[target] = uncached
+
+        estimates: Dict[str, CostEstimate] = estimate_costs(
+            catch,
+            list(queue_sources),
+            sources,
+            start_date,
+            stop_date,
+            uncertainty_ellipse,
+            padding,
+        )
+
+    costs: Dict[str, float] = {
+        target: sum([estimates[target].sources[source] for source in _sources])
+        for target, _sources in queue_sources.items()
+    }
+
+    status: QueryStatus = QueryStatus.SUCCESS
+    if len(queue_sources) > 0:
+        cost: float = sum(costs.values())
+        status, queue = admit(cost, client)
+        if status != QueryStatus.QUEUED:
+            return status, []
+
+        started: float = time()
+        rq_ids: List[str] = []
+        finalize_ids: List[str] = []
+        for target, _sources in queue_sources.items():
+            job_id: UUID = job_ids[target]
+            task_id: str = rq_job_id(batch_id, job_id.hex)
+            queue.enqueue(
+                f=catch_task,
+                args=[
+                    job_id,
+                    target,
+                    _sources,
+                    start_date,
+                    stop_date,
+                    uncertainty_ellipse,
+                    padding,
+                    False,
+                ],
+                kwargs={"finalize": False, "started": started},
+                job_timeout=job_timeout(costs[target]),
+                job_id=task_id,
+            )
+
+            finalize_ids.append(rq_job_id(batch_id, f"{job_id.hex}_finalize"))
+            queue.enqueue(
+                f=catch_finalize_task,
+                args=[job_id, _sources],
+                kwargs={"started": started},
+                job_id=finalize_ids[-1],
+                depends_on=Dependency(jobs=[task_id], allow_failure=True),
+            )
+            rq_ids.extend([task_id, finalize_ids[-1]])
+
+        rq_ids.append(rq_job_id(batch_id, "finalize"))
+        queue.enqueue(
+            f=catch_batch_finalize_task,
+            args=[
+                batch_id,
+                [
+                    (job_ids[target], target, _sources)
+                    for target, _sources in queue_sources.items()
+                ],
+            ],
+            kwargs={"started": started},
+            job_id=rq_ids[-1],
+            depends_on=Dependency(jobs=finalize_ids, allow_failure=True),
+        )
+        queue.add_work(batch_id, cost, rq_ids, client)
+
+    with catch_manager() as catch:
+        create_tables(catch.db.session)
+        catch.db.session.add_all(
+            [
+                BatchJob(
+                    batch_id=batch_id.hex,
+                    job_id=job_ids[target].hex,
+                    position=i,
+                    target=target,
+                )
+                for i, target in enumerate(targets)
+            ]
+        )
+        catch.db.session.commit()
+
+        # refer to the cached results, rather than copying them
+        for target in targets:
+            query_ids: Dict[str, Union[int, None]] = {
+                source: query_id
+                for source, query_id in cache[target].items()
+                if query_id is not None
+            }
+            if len(query_ids) > 0:
+                add_aliases(catch, job_ids[target], query_ids)
+
+    return status, [
+        {
+            "target": target,
+            "job_id": job_ids[target].hex,
+            "queued": target in queue_sources,
+        }
+        for target in targets
+    ]
+
+
+# query statuses that will not change
+COMPLETE: Tuple[str, ...] = ("finished", "errored")
+
+
+def _job_status(
+    catch: Catch, queries: List[CatchQuery], counts: Dict[int, int]
+) -> List[Dict[str, Any]]:
+    """Per-source status of a job, as for `status.job_id.job_id_service`."""
+    return [
+        {
+            "source": query.source,
+            "source_name": catch.sources[query.source].__data_source_name__,
+            "date": query.date,
+            "status": query.status,
+            "execution_time": query.execution_time,
+            "count": counts.get(query.query_id, 0),
+        }
+        for query in queries
+    ]
+
+
+def caught_batch_service(
+    batch_id: UUID, data: bool = False
+) -> Union[Dict[str, Any], None]:
+    """Status and results of a batch of queries.
+
+
+    Parameters
+    ----------
+    batch_id : UUID
+        Unique batch identifier.
+
+    data : bool, optional
+        Include the caught data of each job.  All rows are loaded at once, so
+        large batches should be paged job by job with `caught_service`.
+
+
+    Returns
+    -------
+    batch : dict or None
+        ``None`` if the batch is not found, otherwise:
+        - complete: ``True`` if all queries have finished or errored
+        - jobs: for each target, in order:
+            - target: target name
+            - job_id: unique job ID (hex)
+            - complete: ``True`` if all of the job's queries finished or errored,
+              or its task is no longer queued or running
+            - error: ``True`` if any of the job's queries errored, or its task
+              ended before they finished, e.g., it failed or was lost
+            - status: per-source status, as for `status.job_id.job_id_service`
+            - count: number of observations that caught the target
+            - data: caught data (if ``data`` is ``True``), see `caught_service`
+
+    """
+
+    jobs: List[Dict[str, Any]] = []
+    with catch_manager() as catch:
+        create_tables(catch.db.session)
+        rows: List[BatchJob] = (
+            catch.db.session.query(BatchJob)
+            .filter(BatchJob.batch_id == batch_id.hex)
+            .order_by(BatchJob.position)
+            .all()
+        )
+        if len(rows) == 0:
+            return None
+
+        queries: Dict[str, List[CatchQuery]] = queries_from_job_ids(
+            catch, [UUID(row.job_id) for row in rows]
+        )
+
+        # count detections for all queries at once
+        query_ids: List[int] = [
+            query.query_id for _queries in queries.values() for query in _queries
+        ]
+        counts: Dict[int, int] = dict(
+            catch.db.session.query(Found.query_id, func.count(Found.query_id))
+            .filter(Found.query_id.in_(query_ids))
+            .group_by(Found.query_id)
+            .all()
+        )
+
+        for row in rows:
+            status: List[Dict[str, Any]] = _job_status(
+                catch, queries[row.job_id], counts
+            )
+            jobs.append(
+                {
+                    "target": row.target,
+                    "job_id": row.job_id,
+                    "complete": len(status) > 0
+                    and all([s["status"] in COMPLETE for s in status]),
+                    "error": any([s["status"] == "errored" for s in status]),
+                    "status": status,
+                    "count": sum([s["count"] for s in status]),
+                }
+            )
+
+    # Queries of incomplete jobs will not be updated if their tasks are no
+    # longer queued or running, e.g., the task failed before it created them,
+    # or timed out.  Cached jobs have no tasks, but are complete.
+    incomplete: List[Dict[str, Any]] = [job for job in jobs if not job["complete"]]
+    active: List[bool] = JobsQueue().active(
+        [rq_job_id(batch_id, job["job_id"]) for job in incomplete]
+    )
+    for job, _active in zip(incomplete, active):
+        if _active:
+            continue
+
+        job["complete"] = True
+        job["error"] = True
+        for s in job["status"]:
+            if s["status"] not in COMPLETE:
+                s["status"] = "errored"
+
+    if data:
+        for job in jobs:
+            job["data"] = list(caught_service(UUID(job["job_id"])))
+
+    return {
+        "complete": all([job["complete"] for job in jobs]),
+        "jobs": jobs,
+    }
@@ -1,14 +1,254 @@
 """Service provider for moving target queries."""
 
 from uuid import UUID
-from typing import List, Union
+from time import monotonic, time
+from typing import Any, Dict, List, Tuple, Union
 
+import numpy as np
 from astropy.time import Time
+from rq.job import Dependency
+from catch.model import CatchQuery, SurveyStats
 
-from .catch_manager import catch_manager
-from .queue import JobsQueue
-from ..tasks.catch import catch_task
+from .catch_manager import Catch, catch_manager
+from .queue import JobsQueue, queue_priority, rq_job_id
+from .cost import TIMEOUT_FACTOR, CostEstimate, estimate_cost, job_timeout
+from .query_alias import add_aliases
+from . import inflight, invalidation
+from ..tasks.catch import catch_task, catch_finalize_task
 from ..config import QueryStatus
+from ..config.env import ENV
+
+# Recent cache misses in this process: (target, source, start_date, stop_date,
+# padding, uncertainty_ellipse) -> expiration time (monotonic clock)
+_uncached: Dict[Tuple[Any, ...], float] = {}
+
+# version of finished queries when the cache misses were found, see
+# `invalidation.QUERIES`
+_uncached_version: Union[int, None] = None
+
+
+def _parse_time(date: Any) -> Union[Time, None]:
+    """Parse a date from the database, or return ``None`` if not parsable."""
+
+    if date is None:
+        return None
+
+    try:
+        if isinstance(date, (int, float)):
+            return Time(date, format="mjd")
+        return Time(date)
+    except ValueError:
+        return None
+
+
+def _same_date(stored: Any, requested: Union[Time, None]) -> bool:
+    """Test if a stored date limit is the same as the requested one."""
+
+    if stored is None or requested is None:
+        return stored is None and requested is None
+
+    t: Union[Time, None] = _parse_time(stored)
+    return t is not None and abs((t - requested).sec) < 1
+
+
+def cached_queries(
+    catch: Catch,
+    target: str,
+    sources: List[str],
+    start_date: Union[Time, None],
+    stop_date: Union[Time, None],
+    uncertainty_ellipse: bool,
+    padding: float,
+) -> Dict[str, Union[int, None]]:
+    """Find cached queries for many sources with one database query.
+
+    A query is cached if a previous search with the same parameters finished
+    after the source was last updated.  Cache misses are remembered for
+    ``ENV.CATCH_UNCACHED_TTL`` seconds, or until any query finishes.
+
+
+    Parameters
+    ----------
+    catch : Catch
+        CATCH library instance.
+
+    target : string
+        The target target.
+
+    sources : list of str
+        Check these sources.
+
+    start_date, stop_date : Time or None
+        Search date limits.
+
+    uncertainty_ellipse : bool
+        Search using the ephemeris uncertainty ellipse.
+
+    padding : bool
+        Additional padding around the ephemeris search region, arcmin.
+
+
+    Returns
+    -------
+    cached : dict
+        The most recent cached query ID for each source, or ``None`` for
+        sources that are not cached.
+
+    """
+
+    return cached_queries_many(
+        catch, [target], sources, start_date, stop_date, uncertainty_ellipse, padding
+    )[target]
+
+
+def cached_queries_many(
+    catch: Catch,
+    targets: List[str],
+    sources: List[str],
+    start_date: Union[Time, None],
+    stop_date: Union[Time, None],
+    uncertainty_ellipse: bool,
+    padding: float,
+) -> Dict[str, Dict[str, Union[int, None]]]:
+    """Find cached queries for many targets and sources with one database query.
+
+    See `cached_queries` for details.
+
+
+    Returns
+    -------
+    cached : dict
+        For each target, the most recent cached query ID for each source, or
+        ``None`` for sources that are not cached.
+
+    """
+
+    global _uncached_version
+
+    # forget all cache misses after any query finishes, or if that cannot be
+    # determined
+    current: Union[int, None] = invalidation.version(invalidation.QUERIES)
+    if current is None or current != _uncached_version:
+        _uncached.clear()
+        _uncached_version = current
+
+    now: float = monotonic()
+    for key, expires in list(_uncached.items()):
+        if expires < now:
+            del _uncached[key]
+
+    def key(target: str, source: str) -> Tuple[Any, ...]:
+        return (
+            target,
+            source,
+            None if start_date is None else start_date.iso,
+            None if stop_date is None else stop_date.iso,
+            padding,
+            uncertainty_ellipse,
+        )
+
+    cached: Dict[str, Dict[str, Union[int, None]]] = {
+        target: dict.fromkeys(sources) for target in targets
+    }
+    lookup: List[Tuple[str, str]] = [
+        (target, source)
+        for target in targets
+        for source in sources
+        if key(target, source) not in _uncached
+    ]
+    if len(lookup) == 0:
+        return cached
+
+    rows = (
+        catch.db.session.query(
+            CatchQuery.query_id,
+            CatchQuery.query,
+            CatchQuery.source,
+            CatchQuery.date,
+            CatchQuery.padding,
+            CatchQuery.start_date,
+            CatchQuery.stop_date,
+            SurveyStats.updated,
+        )
+        .outerjoin(SurveyStats, SurveyStats.source == CatchQuery.source)
+        .filter(CatchQuery.query.in_({target for target, _ in lookup}))
+        .filter(CatchQuery.source.in_({source for _, source in lookup}))
+        .filter(CatchQuery.status == "finished")
+        .filter(CatchQuery.uncertainty_ellipse == uncertainty_ellipse)
+        .order_by(CatchQuery.query_id.desc())
+        .all()
+    )
+
+    for row in rows:
+        if row.query not in cached or row.source not in cached[row.query]:
+            continue
+
+        if cached[row.query][row.source] is not None:
+            # already found the most recent query for this target and source
+            continue
+
+        if not (
+            np.isclose(row.padding or 0, padding)
+            and _same_date(row.start_date, start_date)
+            and _same_date(row.stop_date, stop_date)
+        ):
+            continue
+
+        # do not use results from before the last survey update
+        query_date: Union[Time, None] = _parse_time(row.date)
+        updated: Union[Time, None] = _parse_time(row.updated)
+        if updated is not None and (query_date is None or query_date < updated):
+            continue
+
+        cached[row.query][row.source] = row.query_id
+
+    expires: float = now + ENV.CATCH_UNCACHED_TTL
+    for target, source in lookup:
+        if cached[target][source] is None:
+            _uncached[key(target, source)] = expires
+
+    return cached
+
+
+def admit(
+    cost: float, client: Union[str, None] = None
+) -> Tuple[QueryStatus, JobsQueue]:
+    """Decide if a new job may be enqueued, and choose its queue.
+
+
+    Parameters
+    ----------
+    cost : float
+        Estimated cost of the job, seconds.
+
+    client : str, optional
+        Identifies the requester for per-client limits, see
+        ``ENV.REDIS_JOBS_MAX_PER_CLIENT``.
+
+
+    Returns
+    -------
+    status : QueryStatus
+        ``QUEUED`` if the job may be enqueued, otherwise ``QUEUEFULL`` or
+        ``CLIENTLIMIT``.
+
+    queue : JobsQueue
+        The queue for the job's priority.
+
+    """
+
+    queue: JobsQueue = JobsQueue(queue_priority(cost))
+    if not queue.accepts(cost):
+        return QueryStatus.QUEUEFULL, queue
+
+    if (
+        client is not None
+        and ENV.REDIS_JOBS_MAX_PER_CLIENT > 0
+        and queue.client_jobs(client) >= ENV.REDIS_JOBS_MAX_PER_CLIENT
+    ):
+        return QueryStatus.CLIENTLIMIT, queue
+
+    return QueryStatus.QUEUED, queue
 
 
 def catch_service(
@@ -20,8 +260,13 @@ def catch_service(
     uncertainty_ellipse: bool,
     padding: float,
     cached: bool,
+    inflight_key: Union[str, None] = None,
+    client: Union[str, None] = None,
 ) -> QueryStatus:
-    """Enqueue a query or copy cached results.
+    """Enqueue a query or refer to cached results.
+
+    Queries are admitted, prioritized, and given time limits according to
+    their estimated cost (see `cost.estimate_cost`).
 
 
     Parameters
@@ -50,6 +295,15 @@ def catch_service(
     cached : bool
         ``True`` if it is OK to return cached results.
 
+    inflight_key : str, optional
+        The query was claimed for this job with this key (see
+        `inflight.claim`).  The claim is released when the job completes, or
+        immediately if the query is not enqueued.
+
+    client : str, optional
+        Identifies the requester for per-client limits, e.g., their IP
+        address.  See ``ENV.REDIS_JOBS_MAX_PER_CLIENT``.
+
 
     Returns
     -------
@@ -58,24 +312,28 @@ def catch_service(
     """
 
     status = QueryStatus.UNDEFINED
-    queue = JobsQueue()
 
     queue_sources = []  # sources to search in detail
     cache_sources = []  # sources to copy cached results
     if cached:
         # only check the cache if the user requested it
         with catch_manager() as catch:
-            catch.start_date = start_date
-            catch.stop_date = stop_date
-            catch.uncertainty_ellipse = uncertainty_ellipse
-            catch.padding = padding
-
-            for source in sources:
-                if catch.is_query_cached(target, sources=[source]):
-                    # copy cached results to the new job ID
-                    cache_sources.append(source)
-                else:
-                    queue_sources.append(source)
+            cache: Dict[str, Union[int, None]] = cached_queries(
+                catch,
+                target,
+                sources,
+                start_date,
+                stop_date,
+                uncertainty_ellipse,
+                padding,
+            )
+
+        for source in sources:
+            if cache[source] is not None:
+                # copy cached results to the new job ID
+                cache_sources.append(source)
+            else:
+                queue_sources.append(source)
     else:
         # user did not request cached results, search all sources
         queue_sources = sources
@@ -83,30 +341,74 @@ def catch_service(
     if len(queue_sources) == 0:
         status = QueryStatus.SUCCESS
     else:
-        if queue.full:
-            status = QueryStatus.QUEUEFULL
-        else:
-            # can parallelize search here; when this was tested on 3.0.0.dev4,
-            # the message stream got several copies of the task messages
+        with catch_manager() as catch:
+            estimate: CostEstimate = estimate_cost(
+                catch,
+                target,
+                queue_sources,
+                start_date,
+                stop_date,
+                uncertainty_ellipse,
+                padding,
+            )
+
+        cost: float = estimate.total
+        queue: JobsQueue
+        status, queue = admit(cost, client)
+        if status == QueryStatus.QUEUED:
+            # one task per source so that they may run in parallel, then a
+            # final task to report the job status; the tasks share the job's
+            # start time for the elapsed time of their messages
+            started: float = time()
+            task_ids: List[str] = []
+            timeouts: List[int] = []
+            for source in queue_sources:
+                task_ids.append(rq_job_id(job_id, source))
+                timeouts.append(job_timeout(estimate.sources[source]))
+                queue.enqueue(
+                    f=catch_task,
+                    args=[
+                        job_id,
+                        target,
+                        [source],
+                        start_date,
+                        stop_date,
+                        uncertainty_ellipse,
+                        padding,
+                        False,
+                    ],
+                    kwargs={"finalize": False, "started": started},
+                    job_timeout=timeouts[-1],
+                    job_id=task_ids[-1],
+                )
+
             queue.enqueue(
-                f=catch_task,
-                args=[
-                    job_id,
-                    target,
-                    queue_sources,
-                    start_date,
-                    stop_date,
-                    uncertainty_ellipse,
-                    padding,
-                    False,
-                ],
-                job_timeout=1200,
+                f=catch_finalize_task,
+                args=[job_id, queue_sources],
+                kwargs={"inflight_key": inflight_key, "started": started},
+                job_id=rq_job_id(job_id, "finalize"),
+                depends_on=Dependency(jobs=task_ids, allow_failure=True),
+            )
+
+            # hold the claim while the job may wait for the work ahead of it,
+            # and its tasks may run
+            inflight.extend(
+                inflight_key,
+                job_id,
+                int(TIMEOUT_FACTOR * queue.pending_work) + sum(timeouts),
             )
-            status = QueryStatus.QUEUED
+            queue.add_work(
+                job_id, cost, task_ids + [rq_job_id(job_id, "finalize")], client
+            )
+
+    if status != QueryStatus.QUEUED:
+        inflight.release(inflight_key, job_id)
 
-    # copy cached data as needed
+    # refer to the cached results, rather than copying them
     if len(cache_sources) > 0:
         with catch_manager() as catch:
-            catch.query(target, job_id, sources=cache_sources, cached=True)
+            add_aliases(
+                catch, job_id, {source: cache[source] for source in cache_sources}
+            )
 
     return status
@@ -1,18 +1,92 @@
-"""CATCH library interaction."""
+"""CATCH library interaction.
+
+By default, each `catch_manager` context creates a new database session and
+CATCH library instance.  Long-lived processes, e.g., warm woRQers, may instead
+call `keep_warm` to reuse one instance for the life of the process, avoiding
+the configuration and source model setup for each job.  The instance's state
+is reset after each outermost context, see `reset_catch`.
+
+"""
 
 from typing import Iterator
 from contextlib import contextmanager
 
+from sqlalchemy import text
+from sqlalchemy.orm.session import Session, sessionmaker
 from catch import Catch, Config
 
 from catch_apis.config.env import ENV
+from . import database_provider
 from .database_provider import data_provider_session
 
+# the persistent CATCH library instance, see `keep_warm`
+_warm: Catch | None = None
+_warm_session: Session | None = None
+_warm_depth: int = 0
+
+
+def keep_warm() -> Catch:
+    """Create a persistent CATCH library instance for this process.
+
+    The instance has its own database session, which returns its connection
+    to the pool after each `catch_manager` context.
+
+    """
+
+    global _warm, _warm_session
+
+    if _warm is None:
+        _warm_session = sessionmaker(bind=database_provider.db_engine)()
+        config = Config(database=_warm_session, log=ENV.CATCH_LOG_FILE, debug=ENV.DEBUG)
+        _warm = Catch.with_config(config)
+
+        # open a pooled connection now, rather than during the first job
+        _warm_session.execute(text("SELECT 1"))
+        _warm_session.commit()
+
+    return _warm
+
+
+def reset_catch(catch: Catch) -> None:
+    """Reset query parameters and discard database state between jobs."""
+
+    catch.start_date = None
+    catch.stop_date = None
+    catch.uncertainty_ellipse = False
+    catch.padding = 0
+    catch.db.session.rollback()
+    catch.db.session.expunge_all()
+
+
+def release_warm() -> None:
+    """Close the persistent CATCH library instance, if any."""
+
+    global _warm, _warm_session
+
+    if _warm_session is not None:
+        _warm_session.close()
+
+    _warm = None
+    _warm_session = None
+
 
 @contextmanager
 def catch_manager(save_log: bool = True) -> Iterator[Catch]:
     """Catch library session manager."""
 
+    global _warm_depth
+
+    if _warm is not None:
+        _warm_depth += 1
+        try:
+            yield _warm
+            _warm.db.session.commit()
+        finally:
+            _warm_depth -= 1
+            if _warm_depth == 0:
+                reset_catch(_warm)
+        return
+
     with data_provider_session() as session:
         config = Config(database=session, log=ENV.CATCH_LOG_FILE, debug=ENV.DEBUG)
         with Catch.with_config(config) as catch:
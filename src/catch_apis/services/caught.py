@@ -1,41 +1,223 @@
 import uuid
-from typing import Any, Dict, List, Union
+import heapq
+from itertools import islice
+from operator import itemgetter
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
-from catch.model import Found, Observation
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query, load_only
+from catch.model import CatchQuery, Found, Observation
 from . import marshal
 from .catch_manager import Catch, catch_manager
+from .filters import Filters, apply
+from .pagination import PageKey, page_key
+from .query_alias import queries_from_job_id
 
 
-def caught_service(job_id: uuid.UUID) -> List[Dict[str, Any]]:
+def found_query(
+    catch: Catch,
+    query: CatchQuery,
+    after: Optional[PageKey] = None,
+    filters: Optional[Filters] = None,
+    fields: Optional[List[str]] = None,
+) -> Query:
+    """Found objects and observations for a single CATCH query.
+
+    Rows are ordered by observation start time and product ID.
+
+
+    Parameters
+    ----------
+    catch : Catch
+        CATCH library instance.
+
+    query : CatchQuery
+        The CATCH query, i.e., one source of a job.
+
+    after : tuple, optional
+        Only return rows after this (mjd_start, product_id) key.
+
+    filters : dict, optional
+        Only return rows with quantities in these ranges, see
+        `filters.from_parameters`.
+
+    fields : list of str, optional
+        Only load the columns needed to marshal these fields, see
+        `marshal.found_observations`.
+
+
+    Returns
+    -------
+    q : sqlalchemy.orm.Query
+        Query returning (Found, Observation) rows.
+
+    """
+
+    source: type = catch.sources[query.source]
+    q: Query = (
+        catch.db.session.query(Found, source)
+        .join(source, Found.observation_id == source.observation_id)
+        .filter(Found.query_id == query.query_id)
+    )
+
+    if filters:
+        q = apply(q, filters, source, Found)
+
+    if fields is not None:
+        q = q.options(*_load_only(source, fields))
+
+    # byte-wise ordering of product IDs, consistent with Python's ordering
+    product_id = source.product_id.collate("C")
+    if after is not None:
+        q = q.filter(tuple_(source.mjd_start, product_id) > after)
+
+    return q.order_by(source.mjd_start, product_id)
+
+
+def _load_only(source: type, fields: List[str]) -> List[Any]:
+    """Query options that load only the columns needed for some fields.
+
+    Observations are fully loaded for the URL and survey-specific fields,
+    which are computed by the survey-specific classes from any of their
+    columns.
+
+    """
+
+    keys: Set[str] = set(fields).union(marshal.REQUIRED_FIELDS)
+
+    # the found object's date is computed from its mjd, its ra and dec are
+    # needed for cutout and preview URLs
+    found_columns: Set[str] = keys.intersection(marshal.FOUND_FIELDS[1:])
+    found_columns.add("mjd")
+    if keys.intersection(marshal.URL_FIELDS):
+        found_columns.update(("ra", "dec"))
+    options: List[Any] = [
+        load_only(*[getattr(Found, column) for column in sorted(found_columns)])
+    ]
+
+    if keys.intersection(marshal.URL_FIELDS) or any([":" in key for key in keys]):
+        return options
+
+    observation_columns: Set[str] = {"source", "mjd_stop"}.union(
+        key
+        for key in keys
+        if key in marshal.OBSERVATION_GETTERS and key != "source_name"
+    )
+    options.append(
+        load_only(*[getattr(source, column) for column in sorted(observation_columns)])
+    )
+    return options
+
+
+def _marshalled_rows(
+    q: Query, chunk_size: int, fields: Optional[List[str]] = None
+) -> Iterator[Tuple[PageKey, Dict[str, Any]]]:
+    """Marshal query results in chunks, yielding sort keys and rows."""
+
+    rows: Iterator[Tuple[Found, Observation]] = iter(q.yield_per(chunk_size))
+    while True:
+        chunk: List[Tuple[Found, Observation]] = list(islice(rows, chunk_size))
+        if len(chunk) == 0:
+            break
+        for row in marshal.found_observations(chunk, fields=fields):
+            yield page_key(row), row
+
+
+def _queries(
+    catch: Catch, job_id: uuid.UUID, sources: Optional[List[str]]
+) -> List[CatchQuery]:
+    """The job's queries, optionally limited to some sources."""
+
+    queries: List[CatchQuery] = queries_from_job_id(catch, job_id)
+    if sources is None:
+        return queries
+    return [query for query in queries if query.source in sources]
+
+
+def caught_count_service(
+    job_id: uuid.UUID,
+    sources: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+) -> int:
+    """Number of caught object results, see `caught_service`."""
+
+    catch: Catch
+    with catch_manager() as catch:
+        return sum(
+            [
+                found_query(catch, query, filters=filters).order_by(None).count()
+                for query in _queries(catch, job_id, sources)
+            ]
+        )
+
+
+def caught_service(
+    job_id: uuid.UUID,
+    limit: Optional[int] = None,
+    after: Optional[PageKey] = None,
+    chunk_size: int = 1000,
+    sources: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+    fields: Optional[List[str]] = None,
+) -> Iterator[Dict[str, Any]]:
     """Caught object results.
 
+    Rows are read from the database with a server-side cursor and marshalled
+    in chunks, so memory use does not depend on the number of results.  Rows
+    from all sources are merged in order of observation start time and product
+    ID.
+
 
     Parameters
     ----------
     job_id : uuid.UUID
         Unique job id for the search.
 
+    limit : int, optional
+        Return at most this many rows.
+
+    after : tuple, optional
+        Only return rows after this (mjd_start, product_id) key, see
+        `pagination.decode_cursor`.
 
-    Return
+    chunk_size : int, optional
+        Number of rows to fetch and marshal at a time.
+
+    sources : list of str, optional
+        Only return rows from these sources.
+
+    filters : dict, optional
+        Only return rows with quantities in these ranges, see
+        `filters.from_parameters`.
+
+    fields : list of str, optional
+        Only return these fields, and the `marshal.REQUIRED_FIELDS`.  Only the
+        columns needed for the fields are read from the database.
+
+
+    Yields
     ------
-    data : list of dict
+    row : dict
 
     """
 
-    # unpack into list of dictionaries for serialization
-    data: List[Dict[str, Any]] = []
+    if limit is not None:
+        chunk_size = max(min(chunk_size, limit), 1)
 
     catch: Catch
     with catch_manager() as catch:
-        found_observations: List[Any] = catch.caught(job_id)
-
-        found: Found
-        obs: Observation
-        for found, obs in found_observations:
-            row: Dict[str, Union[str, float, int, None]] = marshal.observation(
-                obs, found.ra, found.dec
+        streams: List[Iterator[Tuple[PageKey, Dict[str, Any]]]] = []
+        query: CatchQuery
+        for query in _queries(catch, job_id, sources):
+            q: Query = found_query(
+                catch, query, after=after, filters=filters, fields=fields
             )
-            row.update(marshal.found(found))
-            data.append(row)
+            if limit is not None:
+                q = q.limit(limit)
+            streams.append(_marshalled_rows(q, chunk_size, fields))
 
-    return data
+        rows: Iterator[Tuple[PageKey, Dict[str, Any]]] = heapq.merge(
+            *streams, key=itemgetter(0)
+        )
+        for key, row in islice(rows, limit):
+            yield row
@@ -0,0 +1,389 @@
+"""Cost estimates for moving target queries.
+
+The cost of a query is its expected execution time, in seconds of woRQer time,
+summed over sources.  Estimates are based on the execution times of recent
+finished queries, preferring queries of the same target.  Each past query is
+scaled to a reference query (the full survey, no padding, no uncertainty
+ellipse), and the median reference time is scaled to the requested parameters.
+
+Reference times are cached in this process for ``ENV.CATCH_COST_TTL`` seconds.
+
+Fixed target queries are estimated with a simple model, see
+`estimate_fixed_cost`.
+
+"""
+
+from typing import Any, Dict, List, NamedTuple, Tuple, Union
+from time import monotonic
+
+import numpy as np
+from astropy.time import Time
+from sqlalchemy import func
+from catch.model import CatchQuery, SurveyStats
+
+from .catch_manager import Catch
+from ..config.env import ENV
+
+# the smallest fraction of a survey that a query may cost
+MIN_SPAN_FRACTION: float = 0.05
+
+# padding (arcmin) that doubles the cost of a query
+PADDING_SCALE: float = 10.0
+
+# cost multiplier for searches with the ephemeris uncertainty ellipse
+ELLIPSE_FACTOR: float = 2.0
+
+# fixed target search radius (arcmin) that doubles the cost of a query
+RADIUS_SCALE: float = 60.0
+
+# jobs time out after this many times their estimated cost, see `job_timeout`
+TIMEOUT_FACTOR: float = 3.0
+
+# (target, source) -> (expiration time (monotonic clock), reference time)
+_reference: Dict[Tuple[str, str], Tuple[float, float]] = {}
+
+
+class CostEstimate(NamedTuple):
+    """Estimated execution time of a query, seconds, for each source."""
+
+    sources: Dict[str, float]
+
+    @property
+    def total(self) -> float:
+        """Total estimated execution time, seconds."""
+        return sum(self.sources.values())
+
+
+def _mjd(date: Any) -> Union[float, None]:
+    """Convert a date from the database or request to MJD, if possible."""
+
+    if date is None:
+        return None
+
+    try:
+        if isinstance(date, Time):
+            return float(date.mjd)
+        if isinstance(date, (int, float)):
+            return float(date)
+        return float(Time(date).mjd)
+    except ValueError:
+        return None
+
+
+def _span_fraction(
+    start: Union[float, None],
+    stop: Union[float, None],
+    survey: Tuple[Union[float, None], Union[float, None]],
+) -> float:
+    """Fraction of the survey's time span covered by the search."""
+
+    survey_start, survey_stop = survey
+    if survey_start is None or survey_stop is None or survey_stop <= survey_start:
+        return 1.0
+
+    start = survey_start if start is None else max(start, survey_start)
+    stop = survey_stop if stop is None else min(stop, survey_stop)
+    fraction: float = (stop - start) / (survey_stop - survey_start)
+    return min(max(fraction, MIN_SPAN_FRACTION), 1.0)
+
+
+def _scale(fraction: float, padding: Union[float, None], ellipse: bool) -> float:
+    """Cost of a query relative to the reference query."""
+
+    scale: float = fraction * (1 + (padding or 0) / PADDING_SCALE)
+    if ellipse:
+        scale *= ELLIPSE_FACTOR
+    return scale
+
+
+def _survey_spans(
+    catch: Catch, sources: List[str]
+) -> Dict[str, Tuple[Union[float, None], Union[float, None]]]:
+    """Time span of each survey, MJD."""
+
+    rows = (
+        catch.db.session.query(
+            SurveyStats.source, SurveyStats.start_date, SurveyStats.stop_date
+        )
+        .filter(SurveyStats.source.in_(sources))
+        .all()
+    )
+    return {row.source: (_mjd(row.start_date), _mjd(row.stop_date)) for row in rows}
+
+
+def _reference_times(
+    catch: Catch,
+    targets: List[str],
+    sources: List[str],
+    spans: Dict[str, Tuple[Union[float, None], Union[float, None]]],
+) -> Dict[Tuple[str, str], float]:
+    """Reference execution time for each target and source, from recent queries.
+
+    The last ``ENV.CATCH_COST_HISTORY`` finished queries of each source are
+    considered, so that frequently searched sources do not crowd out the
+    others.
+
+    """
+
+    recent = (
+        catch.db.session.query(
+            CatchQuery.query,
+            CatchQuery.source,
+            CatchQuery.execution_time,
+            CatchQuery.start_date,
+            CatchQuery.stop_date,
+            CatchQuery.padding,
+            CatchQuery.uncertainty_ellipse,
+            func.row_number()
+            .over(
+                partition_by=CatchQuery.source,
+                order_by=CatchQuery.query_id.desc(),
+            )
+            .label("n"),
+        )
+        .filter(CatchQuery.source.in_(sources))
+        .filter(CatchQuery.status == "finished")
+        .filter(CatchQuery.execution_time.isnot(None))
+        .subquery()
+    )
+    rows = (
+        catch.db.session.query(recent)
+        .filter(recent.c.n <= ENV.CATCH_COST_HISTORY)
+        .all()
+    )
+
+    # reference times by source, and by target and source
+    by_source: Dict[str, List[float]] = {source: [] for source in sources}
+    by_target: Dict[Tuple[str, str], List[float]] = {}
+    for row in rows:
+        scale: float = _scale(
+            _span_fraction(
+                _mjd(row.start_date),
+                _mjd(row.stop_date),
+                spans.get(row.source, (None, None)),
+            ),
+            row.padding,
+            row.uncertainty_ellipse,
+        )
+        by_source[row.source].append(row.execution_time / scale)
+        by_target.setdefault((row.query, row.source), []).append(
+            row.execution_time / scale
+        )
+
+    default: Dict[str, float] = {
+        source: (
+            float(np.median(by_source[source]))
+            if len(by_source[source]) > 0
+            else float(ENV.CATCH_DEFAULT_SOURCE_COST)
+        )
+        for source in sources
+    }
+
+    reference: Dict[Tuple[str, str], float] = {}
+    for target in targets:
+        for source in sources:
+            times: List[float] = by_target.get((target, source), [])
+            if len(times) > 0:
+                reference[(target, source)] = float(np.median(times))
+            else:
+                reference[(target, source)] = default[source]
+
+    return reference
+
+
+def estimate_cost(
+    catch: Catch,
+    target: str,
+    sources: List[str],
+    start_date: Union[Time, None],
+    stop_date: Union[Time, None],
+    uncertainty_ellipse: bool,
+    padding: float,
+) -> CostEstimate:
+    """Estimate the cost of a moving target query.
+
+
+    Parameters
+    ----------
+    catch : Catch
+        CATCH library instance.
+
+    target : string
+        The target target.
+
+    sources : list of str
+        Search these sources.
+
+    start_date, stop_date : Time or None
+        Search date limits.
+
+    uncertainty_ellipse : bool
+        Search using the ephemeris uncertainty ellipse.
+
+    padding : float
+        Additional padding around the ephemeris search region, arcmin.
+
+
+    Returns
+    -------
+    estimate : CostEstimate
+
+    """
+
+    return estimate_costs(
+        catch, [target], sources, start_date, stop_date, uncertainty_ellipse, padding
+    )[target]
+
+
+def estimate_costs(
+    catch: Catch,
+    targets: List[str],
+    sources: List[str],
+    start_date: Union[Time, None],
+    stop_date: Union[Time, None],
+    uncertainty_ellipse: bool,
+    padding: float,
+) -> Dict[str, CostEstimate]:
+    """Estimate the costs of moving target queries of many targets.
+
+    The query history is read once for all targets.  See `estimate_cost` for
+    the parameters.
+
+
+    Returns
+    -------
+    estimates : dict of CostEstimate
+        Keyed by target.
+
+    """
+
+    if len(sources) == 0:
+        return {target: CostEstimate({}) for target in targets}
+
+    now: float = monotonic()
+    for key, (expires, _) in list(_reference.items()):
+        if expires < now:
+            del _reference[key]
+
+    spans = _survey_spans(catch, sources)
+
+    lookup: List[str] = [
+        target
+        for target in targets
+        if any([(target, source) not in _reference for source in sources])
+    ]
+    if len(lookup) > 0:
+        expires: float = now + ENV.CATCH_COST_TTL
+        for key, reference in _reference_times(catch, lookup, sources, spans).items():
+            _reference[key] = (expires, reference)
+
+    start: Union[float, None] = _mjd(start_date)
+    stop: Union[float, None] = _mjd(stop_date)
+    scale: Dict[str, float] = {
+        source: _scale(
+            _span_fraction(start, stop, spans.get(source, (None, None))),
+            padding,
+            uncertainty_ellipse,
+        )
+        for source in sources
+    }
+    return {
+        target: CostEstimate(
+            {
+                source: _reference[(target, source)][1] * scale[source]
+                for source in sources
+            }
+        )
+        for target in targets
+    }
+
+
+def estimate_fixed_cost(
+    catch: Catch,
+    sources: List[str],
+    start_date: Union[Time, None],
+    stop_date: Union[Time, None],
+    radius: float,
+) -> CostEstimate:
+    """Estimate the cost of a fixed target query.
+
+    A point search of a full survey costs ``ENV.FIXED_SOURCE_COST`` seconds.
+    The cost scales with the fraction of the survey searched and with the
+    search area.
+
+
+    Parameters
+    ----------
+    catch : Catch
+        CATCH library instance.
+
+    sources : list of str
+        Search these sources.
+
+    start_date, stop_date : Time or None
+        Search date limits.
+
+    radius : float
+        Areal search around the coordinates, arcmin.
+
+
+    Returns
+    -------
+    estimate : CostEstimate
+
+    """
+
+    return estimate_fixed_costs(catch, sources, start_date, stop_date, [radius])[0]
+
+
+def estimate_fixed_costs(
+    catch: Catch,
+    sources: List[str],
+    start_date: Union[Time, None],
+    stop_date: Union[Time, None],
+    radii: List[float],
+) -> List[CostEstimate]:
+    """Estimate the costs of fixed target queries of many points.
+
+    The survey time spans are read once for all points.  See
+    `estimate_fixed_cost` for the parameters.
+
+
+    Returns
+    -------
+    estimates : list of CostEstimate
+        One for each radius.
+
+    """
+
+    if len(sources) == 0:
+        return [CostEstimate({}) for radius in radii]
+
+    spans = _survey_spans(catch, sources)
+    start: Union[float, None] = _mjd(start_date)
+    stop: Union[float, None] = _mjd(stop_date)
+    point: Dict[str, float] = {
+        source: ENV.FIXED_SOURCE_COST
+        * _span_fraction(start, stop, spans.get(source, (None, None)))
+        for source in sources
+    }
+
+    estimates: List[CostEstimate] = []
+    for radius in radii:
+        area: float = 1 + (max(radius, 0) / RADIUS_SCALE) ** 2
+        estimates.append(
+            CostEstimate({source: cost * area for source, cost in point.items()})
+        )
+    return estimates
+
+
+def job_timeout(cost: float) -> int:
+    """rq job timeout for a task with this estimated cost, seconds.
+
+    The timeout is `TIMEOUT_FACTOR` times the cost, limited to the range
+    ``ENV.CATCH_JOB_TIMEOUT_MIN`` to ``ENV.CATCH_JOB_TIMEOUT_MAX``.
+
+    """
+
+    timeout: int = int(np.ceil(TIMEOUT_FACTOR * cost))
+    return min(max(timeout, ENV.CATCH_JOB_TIMEOUT_MIN), ENV.CATCH_JOB_TIMEOUT_MAX)
@@ -2,15 +2,18 @@
     Service class for querying SQL-DB
 """
 
-from typing import Iterator
+import os
+from typing import Any, Dict, Iterator
 from contextlib import contextmanager
+from time import monotonic
 
 import sqlalchemy
+from sqlalchemy import event
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm.session import Session, sessionmaker
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.exc import SQLAlchemyError, DBAPIError
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import NullPool, QueuePool
 
 from catch_apis.config.env import ENV
 
@@ -23,12 +26,128 @@ db_engine_URI: str = (
     f"{ENV.DB_DIALECT}://{ENV.DB_USERNAME}:{ENV.DB_PASSWORD}@{ENV.DB_HOST}"
     f"/{ENV.DB_DATABASE}"
 )
-db_engine: Engine = sqlalchemy.create_engine(
-    db_engine_URI, poolclass=NullPool, pool_recycle=3600, pool_pre_ping=True
-)
+
+# connection pool metrics for this process, see `pool_status`
+pool_metrics: Dict[str, float] = {
+    "connects": 0,
+    "checkouts": 0,
+    "checkins": 0,
+    "wait_time": 0.0,
+    "max_wait_time": 0.0,
+}
+
+
+class InstrumentedQueuePool(QueuePool):
+    """Queue pool that records the time spent waiting for a connection."""
+
+    def _do_get(self):
+        t0: float = monotonic()
+        try:
+            return super()._do_get()
+        finally:
+            wait: float = monotonic() - t0
+            pool_metrics["wait_time"] += wait
+            pool_metrics["max_wait_time"] = max(pool_metrics["max_wait_time"], wait)
+
+
+def _create_engine() -> Engine:
+    """Create the database engine.
+
+    Connections are pooled unless ``ENV.DB_POOL_SIZE`` is 0.
+
+    """
+
+    if ENV.DB_POOL_SIZE > 0:
+        engine: Engine = sqlalchemy.create_engine(
+            db_engine_URI,
+            poolclass=InstrumentedQueuePool,
+            pool_size=ENV.DB_POOL_SIZE,
+            max_overflow=ENV.DB_POOL_MAX_OVERFLOW,
+            pool_timeout=ENV.DB_POOL_TIMEOUT,
+            pool_recycle=ENV.DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+    else:
+        engine = sqlalchemy.create_engine(db_engine_URI, poolclass=NullPool)
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        pool_metrics["connects"] += 1
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_metrics["checkouts"] += 1
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        pool_metrics["checkins"] += 1
+
+    return engine
+
+
+db_engine: Engine = _create_engine()
 db_session: scoped_session = scoped_session(sessionmaker(bind=db_engine))
 
 
+def _reset_after_fork() -> None:
+    """Discard connections inherited from the parent process.
+
+    gunicorn and rq fork worker processes.  Pooled connections must not be
+    shared between processes, so the child starts with an empty pool.  The
+    parent's connections are left open for the parent.
+
+    """
+
+    db_engine.dispose(close=False)
+    for key in pool_metrics:
+        pool_metrics[key] = 0
+
+
+# only register once, even if this module is reloaded
+if not globals().get("_fork_handler_registered", False):
+    os.register_at_fork(after_in_child=lambda: _reset_after_fork())
+    _fork_handler_registered: bool = True
+
+
+def pool_status() -> Dict[str, Any]:
+    """Summary of the database connection pool for this process.
+
+
+    Returns
+    -------
+    status : dict
+        - pooled: ``True`` if connections are pooled
+        - size: number of connections kept in the pool
+        - checked_out: number of connections currently in use
+        - overflow: number of connections opened beyond the pool size
+        - connects: number of new database connections
+        - checkouts: number of connections handed out by the pool
+        - checkins: number of connections returned to the pool
+        - wait_time: total time spent waiting for a connection, s
+        - max_wait_time: longest time spent waiting for a connection, s
+
+    """
+
+    pool = db_engine.pool
+    pooled: bool = isinstance(pool, QueuePool)
+    status: Dict[str, Any] = {
+        "pooled": pooled,
+        "size": pool.size() if pooled else 0,
+        "checked_out": pool.checkedout() if pooled else 0,
+        "overflow": max(pool.overflow(), 0) if pooled else 0,
+    }
+    status.update(
+        {
+            "connects": int(pool_metrics["connects"]),
+            "checkouts": int(pool_metrics["checkouts"]),
+            "checkins": int(pool_metrics["checkins"]),
+            "wait_time": round(pool_metrics["wait_time"], 6),
+            "max_wait_time": round(pool_metrics["max_wait_time"], 6),
+        }
+    )
+    return status
+
+
 @contextmanager
 def data_provider_session() -> Iterator[Session]:
     """Provide a transactional scope around a series of operations."""
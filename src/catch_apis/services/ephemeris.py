@@ -0,0 +1,159 @@
+"""Shared ephemeris cache for moving target queries.
+
+Each uncached moving target query requests an ephemeris of the target over the
+survey dates from the sbsearch ephemeris generator (JPL Horizons).  Queries of
+the same target with different sources or padding request the same ephemeris,
+so the results are cached in Redis and shared by all woRQers.
+
+Cached ephemerides expire according to how quickly the target's orbit solution
+is expected to change, see `ttl`:
+
+- numbered asteroids, ``ENV.EPHEMERIS_CACHE_TTL_NUMBERED`` seconds,
+- comets and interstellar objects, ``ENV.EPHEMERIS_CACHE_TTL_COMET`` seconds,
+- all others, e.g., recently discovered asteroids, ``ENV.EPHEMERIS_CACHE_TTL``
+  seconds.
+
+The cache wraps the generator's ``target_over_date_range`` method, see
+`install`.
+
+"""
+
+from typing import Any, Callable
+import functools
+import hashlib
+import inspect
+import json
+import pickle
+
+from ..config import get_logger
+from ..config.env import ENV
+from ..validation import SSOTargetType, parse_target_name
+from .queue import RedisConnection
+
+# the wrapped method of the ephemeris generator
+METHOD: str = "target_over_date_range"
+
+
+def _designation(target: Any) -> str:
+    """The target's designation, from an sbsearch target or a string."""
+    return str(getattr(target, "designation", target)).strip()
+
+
+def _key(
+    generator: type, observer: Any, target: Any, start: Any, stop: Any, step: Any
+) -> str:
+    """Redis key for an ephemeris."""
+
+    parameters: str = json.dumps(
+        [
+            generator.__name__,
+            str(observer),
+            _designation(target),
+            getattr(start, "iso", str(start)),
+            getattr(stop, "iso", str(stop)),
+            None if step is None else str(step),
+        ]
+    )
+    digest: str = hashlib.sha1(parameters.encode()).hexdigest()
+    return f"{ENV.REDIS_JOBS}:ephemeris:{digest}"
+
+
+def ttl(target: Any) -> int:
+    """Time to keep a target's ephemeris, seconds."""
+
+    try:
+        target_type, designation = parse_target_name(_designation(target))
+    except ValueError:
+        return ENV.EPHEMERIS_CACHE_TTL
+
+    if target_type == SSOTargetType.ASTEROID and designation.isdigit():
+        return ENV.EPHEMERIS_CACHE_TTL_NUMBERED
+    if target_type in (SSOTargetType.COMET, SSOTargetType.INTERSTELLAR_OBJECT):
+        return ENV.EPHEMERIS_CACHE_TTL_COMET
+    return ENV.EPHEMERIS_CACHE_TTL
+
+
+def cached(generator: type, method: Callable) -> Callable:
+    """Wrap an ephemeris generator method with the cache.
+
+
+    Parameters
+    ----------
+    generator : class
+        The ephemeris generator.
+
+    method : function
+        The generator's unbound ``target_over_date_range`` function, with
+        parameters (cls, observer, target, start, stop, step=None, ...).
+
+    """
+
+    signature: inspect.Signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(cls, *args, **kwargs):
+        arguments = signature.bind(cls, *args, **kwargs)
+        arguments.apply_defaults()
+        parameters = arguments.arguments
+        key: str = _key(
+            generator,
+            parameters["observer"],
+            parameters["target"],
+            parameters["start"],
+            parameters["stop"],
+            parameters.get("step"),
+        )
+
+        try:
+            value = RedisConnection().get(key)
+            if value is not None:
+                return pickle.loads(value)
+        except Exception:  # pylint: disable=broad-exception-caught
+            get_logger().exception("Error reading the ephemeris cache.")
+
+        ephemeris = method(cls, *args, **kwargs)
+
+        try:
+            RedisConnection().set(
+                key, pickle.dumps(ephemeris), ex=ttl(parameters["target"])
+            )
+        except Exception:  # pylint: disable=broad-exception-caught
+            get_logger().exception("Error writing the ephemeris cache.")
+
+        return ephemeris
+
+    wrapper._ephemeris_cache = True
+    return wrapper
+
+
+def install(generator: type | None = None) -> None:
+    """Cache the ephemerides of an ephemeris generator, in this process.
+
+    Installing the cache more than once has no further effect.
+
+
+    Parameters
+    ----------
+    generator : class, optional
+        The ephemeris generator, default is sbsearch's Horizons generator.
+
+    """
+
+    if generator is None:
+        from sbsearch.ephemeris import Horizons
+
+        generator = Horizons
+
+    method = inspect.getattr_static(generator, METHOD, None)
+    if not isinstance(method, classmethod):
+        get_logger().warning(
+            "Cannot cache ephemerides of %s: no %s class method.",
+            generator.__name__,
+            METHOD,
+        )
+        return
+
+    if getattr(method.__func__, "_ephemeris_cache", False):
+        return
+
+    setattr(generator, METHOD, classmethod(cached(generator, method.__func__)))
@@ -0,0 +1,109 @@
+"""Range filters for query results.
+
+Clients may limit the results to observations and found object positions with
+quantities in a range, e.g., images with seeing below 2 arcsec, or a target
+brighter than V=20.  The filters are applied in the database query where
+possible, see `apply`, or else to the observation objects, see `matches`.
+
+Rows with unknown (null) values of a filtered quantity are excluded.
+
+"""
+
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Query
+
+# filterable quantities, and the model that has them
+OBSERVATION_FIELDS: Tuple[str, ...] = ("maglimit", "seeing")
+FOUND_FIELDS: Tuple[str, ...] = ("vmag", "rh", "delta")
+
+# quantity -> (minimum, maximum), either may be None
+Filters = Dict[str, Tuple[Optional[float], Optional[float]]]
+
+
+def from_parameters(
+    fields: Tuple[str, ...] = OBSERVATION_FIELDS + FOUND_FIELDS,
+    **parameters: Optional[float],
+) -> Filters:
+    """Filters from ``{quantity}_min`` and ``{quantity}_max`` parameters.
+
+    Only the quantities in ``fields`` are considered.  Parameters without a
+    value are ignored.
+
+
+    Examples
+    --------
+    >>> from_parameters(seeing_max=2.0, vmag_min=None)
+    {'seeing': (None, 2.0)}
+
+    """
+
+    filters: Filters = {}
+    for field in fields:
+        limits: Tuple[Optional[float], Optional[float]] = (
+            parameters.get(f"{field}_min"),
+            parameters.get(f"{field}_max"),
+        )
+        if limits != (None, None):
+            filters[field] = limits
+    return filters
+
+
+def validate(filters: Filters) -> None:
+    """Raise ValueError if any range is empty."""
+
+    for field, (minimum, maximum) in filters.items():
+        if minimum is not None and maximum is not None and minimum > maximum:
+            raise ValueError(f"Invalid {field} range: {minimum} to {maximum}")
+
+
+def apply(q: Query, filters: Filters, observation: type, found: Any = None) -> Query:
+    """Add the filters to a database query.
+
+
+    Parameters
+    ----------
+    q : sqlalchemy.orm.Query
+        The query.
+
+    filters : dict
+        See `from_parameters`.
+
+    observation : type
+        The queried observation model.
+
+    found : type, optional
+        The queried found object model, required to filter on found object
+        quantities.
+
+    """
+
+    for field, (minimum, maximum) in filters.items():
+        if field in OBSERVATION_FIELDS:
+            column = getattr(observation, field)
+        elif found is not None:
+            column = getattr(found, field)
+        else:
+            raise ValueError(f"Cannot filter on {field}")
+
+        if minimum is not None:
+            q = q.filter(column >= minimum)
+        if maximum is not None:
+            q = q.filter(column <= maximum)
+
+    return q
+
+
+def matches(obj: Any, filters: Filters) -> bool:
+    """Test if an observation or found object passes the filters."""
+
+    for field, (minimum, maximum) in filters.items():
+        value: Optional[float] = getattr(obj, field)
+        if value is None:
+            return False
+        if minimum is not None and value < minimum:
+            return False
+        if maximum is not None and value > maximum:
+            return False
+
+    return True
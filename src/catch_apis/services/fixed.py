@@ -1,17 +1,81 @@
-"""Service provider for fixed target queries."""
+"""Service provider for fixed target queries.
 
+Queued fixed target queries (see `fixed_job`) store their results for
+``ENV.FIXED_RESULTS_TTL`` seconds.  The found observations are stored by
+reference in the ``catch_apis_fixed_result`` table (see `store_fixed_results`
+and `store_fixed_batch_results`), and the query status in redis (see
+`save_fixed_results` and `save_fixed_batch_results`).
+
+"""
+
+import json
 from uuid import UUID
-from typing import List, Union
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from astropy.time import Time
 from astropy.coordinates import Angle
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Float,
+    Integer,
+    String,
+    func,
+    tuple_,
+)
 from sbsearch.target import FixedTarget
 from catch import IntersectionType
 from catch.model import Observation
 
 from ..config import allowed_sources
-from .catch_manager import catch_manager
-from . import marshal
+from ..config.env import ENV
+from .catch_manager import Catch, catch_manager
+from .queue import RedisConnection
+from . import fixed_cache, marshal
+from .filters import Filters, matches
+from .pagination import PageKey
+from .query_alias import Base, create_tables
+
+
+class FixedResult(Base):
+    """An observation found by a queued fixed target query."""
+
+    __tablename__ = "catch_apis_fixed_result"
+    job_id = Column(String(32), primary_key=True)  # hex
+    # index of the position in a batch, 0 for single point queries
+    position = Column(Integer, primary_key=True, default=0)
+    source = Column(String(64), primary_key=True)
+    observation_id = Column(BigInteger, primary_key=True)
+    # page key, see `pagination`
+    mjd_start = Column(Float, nullable=False)
+    product_id = Column(String, nullable=False)
+    created = Column(DateTime, nullable=False, server_default=func.now(), index=True)
+
+
+def _search(
+    catch: Catch,
+    job_id: UUID,
+    ra: Angle,
+    dec: Angle,
+    sources: Union[List[str], None],
+    radius: float,
+    updated: Optional[Dict[str, str]] = None,
+) -> Tuple[FixedTarget, List[Observation]]:
+    """Search for a single point with the current date and intersection limits.
+
+    Observations are ordered by start time and product ID.  Searches are cached,
+    see `fixed_cache`.
+
+    """
+
+    target: FixedTarget = FixedTarget.from_radec(ra, dec)
+    catch.padding = min(max(radius, 0), 600)
+    observations: List[Observation] = fixed_cache.search(
+        catch, target, job_id, sources, updated=updated
+    )
+    return target, sorted(observations, key=lambda obs: (obs.mjd_start, obs.product_id))
 
 
 def fixed_target_query_service(
@@ -23,7 +87,11 @@ def fixed_target_query_service(
     stop_date: Union[str, None],
     radius: float,
     intersection_type: str,
-) -> List[dict]:
+    limit: Optional[int] = None,
+    after: Optional[PageKey] = None,
+    filters: Optional[Filters] = None,
+    fields: Optional[List[str]] = None,
+) -> Tuple[List[dict], int]:
     """Search the database for a single point.
 
 
@@ -54,27 +122,514 @@ def fixed_target_query_service(
         Type of intersections to allow between search area and data.  See
         `catch.IntersectionType` for valid names.
 
+    limit : int, optional
+        Return at most this many observations.
+
+    after : tuple, optional
+        Only return observations after this (mjd_start, product_id) key, see
+        `pagination.decode_cursor`.
+
+    filters : dict, optional
+        Only return observations with quantities in these ranges, see
+        `filters.from_parameters`.  The spatial search is done by the CATCH
+        library, so the filters are applied to its results, before
+        marshalling.
+
+    fields : list of str, optional
+        Only return these fields, and the `marshal.REQUIRED_FIELDS`.
+
 
     Returns
     -------
     data : list
-        Found observations.
+        Found observations, ordered by start time and product ID.
 
-    """
+    count : int
+        Total number of found observations that pass the filters, including
+        those outside of the requested page.
 
-    target: FixedTarget = FixedTarget.from_radec(ra, dec)
+    """
 
     observations: List[Observation] = []
     data: List[dict]
     with catch_manager() as catch:
         catch.start_date = start_date
         catch.stop_date = stop_date
-        catch.padding = min(max(radius, 0), 600)
         catch.intersection_type = IntersectionType[intersection_type]
-        observations = catch.query(target, job_id, sources)
-        data = [
-            marshal.observation(obs, target.ra.deg, target.dec.deg)
+        target, observations = _search(catch, job_id, ra, dec, sources, radius)
+        if filters:
+            observations = [obs for obs in observations if matches(obs, filters)]
+        count: int = len(observations)
+
+        # paginate before marshalling
+        if after is not None:
+            observations = [
+                obs for obs in observations if (obs.mjd_start, obs.product_id) > after
+            ]
+        if limit is not None:
+            observations = observations[:limit]
+
+        data = marshal.observations(
+            observations, target.ra.deg, target.dec.deg, fields=fields
+        )
+
+    return data, count
+
+
+def fixed_target_batch_service(
+    job_id: UUID,
+    positions: List[Tuple[Angle, Angle, float]],
+    sources: Union[List[str], None],
+    start_date: Union[Time, None],
+    stop_date: Union[Time, None],
+    intersection_type: str,
+) -> List[Dict[str, Any]]:
+    """Search the database for many points with the same parameters.
+
+    All points are searched with one CATCH library instance and database
+    session.
+
+
+    Parameters
+    ----------
+    job_id : `UUID`
+        Unique job identifier.
+
+    positions : list of tuple
+        The right ascension, declination, and search radius (arcmin) of each
+        point.
+
+    sources, start_date, stop_date, intersection_type
+        See `fixed_target_query_service`.
+
+
+    Returns
+    -------
+    results : list of dict
+        For each point, in order:
+        - ra, dec: the coordinates, degrees
+        - radius: search radius, arcmin
+        - count: number of found observations
+        - data: found observations, ordered by start time and product ID
+
+    """
+
+    results: List[Dict[str, Any]] = []
+    with catch_manager() as catch:
+        catch.start_date = start_date
+        catch.stop_date = stop_date
+        catch.intersection_type = IntersectionType[intersection_type]
+
+        # read the survey update times once for all points
+        updated: Dict[str, str] = fixed_cache.survey_updates(catch, sources)
+
+        for ra, dec, radius in positions:
+            target, observations = _search(
+                catch, job_id, ra, dec, sources, radius, updated=updated
+            )
+            results.append(
+                {
+                    "ra": target.ra.deg,
+                    "dec": target.dec.deg,
+                    "radius": radius,
+                    "count": len(observations),
+                    "data": marshal.observations(
+                        observations, target.ra.deg, target.dec.deg
+                    ),
+                }
+            )
+
+    return results
+
+
+def _results_key(job_id: UUID, batch: bool = False) -> str:
+    """Redis key for the results of a queued fixed target query."""
+    if batch:
+        return f"{ENV.REDIS_JOBS}:fixed:batch:{job_id.hex}"
+    return f"{ENV.REDIS_JOBS}:fixed:{job_id.hex}"
+
+
+def store_fixed_results(
+    job_id: UUID,
+    ra: Angle,
+    dec: Angle,
+    sources: Union[List[str], None],
+    start_date: Union[Time, None],
+    stop_date: Union[Time, None],
+    radius: float,
+    intersection_type: str,
+    filters: Optional[Filters] = None,
+) -> int:
+    """Search the database for a single point, and store the results.
+
+    The found observations are stored by reference, rather than copied, so
+    that the results of large queries may be paged through with
+    `fixed_results_service`.  Any earlier results of the job, and results
+    older than ``ENV.FIXED_RESULTS_TTL`` seconds, are deleted.
+
+
+    Parameters
+    ----------
+    job_id, ra, dec, sources, start_date, stop_date, radius, intersection_type, filters
+        See `fixed_target_query_service`.
+
+
+    Returns
+    -------
+    count : int
+        Number of found observations that pass the filters.
+
+    """
+
+    with catch_manager() as catch:
+        catch.start_date = start_date
+        catch.stop_date = stop_date
+        catch.intersection_type = IntersectionType[intersection_type]
+        _, observations = _search(catch, job_id, ra, dec, sources, radius)
+        if filters:
+            observations = [obs for obs in observations if matches(obs, filters)]
+
+        _delete_results(catch, job_id)
+        _insert_results(catch, job_id, 0, observations)
+        catch.db.session.commit()
+
+    return len(observations)
+
+
+def store_fixed_batch_results(
+    job_id: UUID,
+    positions: List[Tuple[Angle, Angle, float]],
+    sources: Union[List[str], None],
+    start_date: Union[Time, None],
+    stop_date: Union[Time, None],
+    intersection_type: str,
+) -> List[Dict[str, Any]]:
+    """Search the database for many points, and store the results.
+
+    As `store_fixed_results`, but the found observations are stored for each
+    point, and are paged through with `fixed_batch_results_service`.
+
+
+    Parameters
+    ----------
+    job_id, positions, sources, start_date, stop_date, intersection_type
+        See `fixed_target_batch_service`.
+
+
+    Returns
+    -------
+    results : list of dict
+        For each point, in order:
+        - ra, dec: the coordinates, degrees
+        - radius: search radius, arcmin
+        - count: number of found observations
+
+    """
+
+    results: List[Dict[str, Any]] = []
+    with catch_manager() as catch:
+        catch.start_date = start_date
+        catch.stop_date = stop_date
+        catch.intersection_type = IntersectionType[intersection_type]
+        updated: Dict[str, str] = fixed_cache.survey_updates(catch, sources)
+
+        _delete_results(catch, job_id)
+        for position, (ra, dec, radius) in enumerate(positions):
+            target, observations = _search(
+                catch, job_id, ra, dec, sources, radius, updated=updated
+            )
+            _insert_results(catch, job_id, position, observations)
+            results.append(
+                {
+                    "ra": target.ra.deg,
+                    "dec": target.dec.deg,
+                    "radius": radius,
+                    "count": len(observations),
+                }
+            )
+        catch.db.session.commit()
+
+    return results
+
+
+def _delete_results(catch: Catch, job_id: UUID) -> None:
+    """Delete any earlier results of the job, and all expired results."""
+
+    create_tables(catch.db.session)
+    catch.db.session.query(FixedResult).filter(
+        (FixedResult.job_id == job_id.hex)
+        | (FixedResult.created < func.now() - timedelta(seconds=ENV.FIXED_RESULTS_TTL))
+    ).delete(synchronize_session=False)
+
+
+def _insert_results(
+    catch: Catch, job_id: UUID, position: int, observations: List[Observation]
+) -> None:
+    """Store references to the found observations of a point."""
+
+    if len(observations) == 0:
+        return
+
+    catch.db.session.execute(
+        FixedResult.__table__.insert(),
+        [
+            {
+                "job_id": job_id.hex,
+                "position": position,
+                "source": obs.source,
+                "observation_id": obs.observation_id,
+                "mjd_start": obs.mjd_start,
+                "product_id": obs.product_id,
+            }
             for obs in observations
-        ]
+        ],
+    )
+
+
+def save_fixed_results(
+    job_id: UUID,
+    query: Dict[str, Any],
+    status: str,
+    message: str,
+    count: int,
+    ra: float,
+    dec: float,
+    fields: Optional[List[str]] = None,
+) -> None:
+    """Store the status of a queued fixed target query.
+
+    The found observations are stored with `store_fixed_results`.
+
+
+    Parameters
+    ----------
+    job_id : `UUID`
+        Unique job identifier.
+
+    query : dict
+        The query parameters, as reported to the user.
+
+    status : str
+        "finished" or "errored".
+
+    message : str
+        Message for the user.
+
+    count : int
+        Number of found observations.
+
+    ra, dec : float
+        Coordinates of the target, degrees, for the cutout URLs.
+
+    fields : list of str, optional
+        Only return these fields of the observations, see
+        `marshal.observations`.
+
+    """
+
+    results: Dict[str, Any] = {
+        "query": query,
+        "status": status,
+        "message": message,
+        "count": count,
+        "ra": ra,
+        "dec": dec,
+        "fields": fields,
+    }
+    RedisConnection().set(
+        _results_key(job_id), json.dumps(results), ex=ENV.FIXED_RESULTS_TTL
+    )
+
+
+def save_fixed_batch_results(
+    job_id: UUID,
+    query: Dict[str, Any],
+    status: str,
+    message: str,
+    positions: List[Dict[str, Any]],
+) -> None:
+    """Store the status of a queued batch of fixed target queries.
+
+    See `save_fixed_results` for the parameters, and
+    `store_fixed_batch_results` for the positions.  The found observations are
+    stored with `store_fixed_batch_results`.
+
+    """
+
+    results: Dict[str, Any] = {
+        "query": query,
+        "status": status,
+        "message": message,
+        "positions": positions,
+    }
+    RedisConnection().set(
+        _results_key(job_id, batch=True),
+        json.dumps(results),
+        ex=ENV.FIXED_RESULTS_TTL,
+    )
+
+
+def fixed_results_service(
+    job_id: UUID,
+    limit: Optional[int] = None,
+    after: Optional[PageKey] = None,
+) -> Union[Dict[str, Any], None]:
+    """Results of a queued fixed target query.
+
+
+    Parameters
+    ----------
+    job_id : `UUID`
+        Unique job identifier.
+
+    limit : int, optional
+        Return at most this many observations.
+
+    after : tuple, optional
+        Only return observations after this (mjd_start, product_id) key, see
+        `pagination.decode_cursor`.
+
+
+    Returns
+    -------
+    results : dict or None
+        ``None`` if the results are not found, e.g., the query is in progress
+        or the results expired, otherwise:
+        - query: the query parameters
+        - status: "finished" or "errored"
+        - message: message for the user
+        - count: total number of found observations
+        - data: found observations in the requested page
+
+    """
+
+    value = RedisConnection().get(_results_key(job_id))
+    if value is None:
+        return None
+
+    results: Dict[str, Any] = json.loads(value)
+    ra: float = results.pop("ra")
+    dec: float = results.pop("dec")
+    fields: Union[List[str], None] = results.pop("fields")
+
+    with catch_manager() as catch:
+        observations: List[Observation] = _page(catch, job_id, 0, limit, after)
+        results["data"] = marshal.observations(observations, ra, dec, fields=fields)
+
+    return results
+
+
+def _page(
+    catch: Catch,
+    job_id: UUID,
+    position: int,
+    limit: Optional[int],
+    after: Optional[PageKey],
+) -> List[Observation]:
+    """A page of the stored observations of a point."""
+
+    create_tables(catch.db.session)
+    # byte-wise ordering of product IDs, consistent with Python's ordering
+    product_id = FixedResult.product_id.collate("C")
+    q = catch.db.session.query(FixedResult.source, FixedResult.observation_id).filter(
+        FixedResult.job_id == job_id.hex, FixedResult.position == position
+    )
+    if after is not None:
+        q = q.filter(tuple_(FixedResult.mjd_start, product_id) > after)
+    q = q.order_by(FixedResult.mjd_start, product_id)
+    if limit is not None:
+        q = q.limit(limit)
+
+    return _observations(catch, q.all())
+
+
+def _observations(
+    catch: Catch, references: List[Tuple[str, int]]
+) -> List[Observation]:
+    """Load observations by source and observation ID, keeping their order.
+
+    Observations that no longer exist are skipped.
+
+    """
+
+    ids: Dict[str, List[int]] = {}
+    for source, observation_id in references:
+        ids.setdefault(source, []).append(observation_id)
+
+    loaded: Dict[Tuple[str, int], Observation] = {}
+    for source, observation_ids in ids.items():
+        model: type = catch.sources[source]
+        for obs in catch.db.session.query(model).filter(
+            model.observation_id.in_(observation_ids)
+        ):
+            loaded[(source, obs.observation_id)] = obs
+
+    return [loaded[ref] for ref in map(tuple, references) if ref in loaded]
+
+
+def fixed_batch_results_service(
+    job_id: UUID,
+    position: Optional[int] = None,
+    limit: Optional[int] = None,
+    after: Optional[PageKey] = None,
+) -> Union[Dict[str, Any], None]:
+    """Results of a queued batch of fixed target queries.
+
+    Without a position, only the number of observations found at each point
+    is returned.  The observations are paged through one point at a time.
+
+
+    Parameters
+    ----------
+    job_id : `UUID`
+        Unique job identifier.
+
+    position : int, optional
+        Return the observations found at this point, the index of the position
+        in the batch.
+
+    limit, after
+        See `fixed_results_service`.
+
+
+    Returns
+    -------
+    results : dict or None
+        ``None`` if the results are not found, otherwise:
+        - query: the query parameters
+        - status: "finished" or "errored"
+        - message: message for the user
+        - positions: results for each point, see `store_fixed_batch_results`
+
+        With a position, the positions are replaced with the results of that
+        point:
+        - position: the index of the position
+        - ra, dec, radius, count: see `store_fixed_batch_results`
+        - data: found observations in the requested page
+
+
+    Raises
+    ------
+    IndexError
+        If the position is not in the batch.
+
+    """
+
+    value = RedisConnection().get(_results_key(job_id, batch=True))
+    if value is None:
+        return None
+
+    results: Dict[str, Any] = json.loads(value)
+    if position is None:
+        return results
+
+    positions: List[Dict[str, Any]] = results.pop("positions")
+    if not 0 <= position < len(positions):
+        raise IndexError(f"Position {position} is not in the batch.")
+
+    point: Dict[str, Any] = positions[position]
+    with catch_manager() as catch:
+        observations: List[Observation] = _page(catch, job_id, position, limit, after)
+        data: List[dict] = marshal.observations(observations, point["ra"], point["dec"])
 
-    return data
+    return {**results, "position": position, **point, "data": data}
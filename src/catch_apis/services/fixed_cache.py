@@ -0,0 +1,244 @@
+"""Result cache for fixed target queries.
+
+Popular fields (e.g., calibration fields, known transients) are searched
+repeatedly.  The observations found by each fixed target search are remembered
+in this process, keyed by the search parameters, so that an identical search
+only reloads the observations by primary key rather than repeating the spatial
+search.
+
+The coordinates and radius are quantized to ``ENV.FIXED_CACHE_QUANTUM``
+arcsec, so that searches for the same field with slightly different
+coordinates share an entry.  Entries are invalidated when any of the searched
+sources are updated (`SurveyStats.updated`), and the least recently used
+entries are discarded beyond ``ENV.FIXED_CACHE_SIZE`` entries.
+
+"""
+
+from typing import Any, Dict, List, NamedTuple, Tuple, Union
+from collections import OrderedDict
+from uuid import UUID
+import threading
+
+from sbsearch.target import FixedTarget
+from catch.model import Observation, SurveyStats
+
+from ..config.env import ENV
+from .catch_manager import Catch
+
+
+class CachedSearch(NamedTuple):
+    # update time of each searched source
+    updated: Dict[str, str]
+
+    # (source, observation_id) of each found observation
+    found: List[Tuple[str, int]]
+
+
+# key -> cached search, least recently used first
+_cache: "OrderedDict[Tuple[Any, ...], CachedSearch]" = OrderedDict()
+_cache_lock: threading.Lock = threading.Lock()
+
+
+def _quantize(value: float) -> int:
+    """Quantize an angle (arcsec) to ``ENV.FIXED_CACHE_QUANTUM``."""
+    return round(value / max(ENV.FIXED_CACHE_QUANTUM, 1))
+
+
+def _date(date: Any) -> Union[str, None]:
+    return None if date is None else getattr(date, "iso", str(date))
+
+
+def key(
+    ra: float,
+    dec: float,
+    radius: float,
+    intersection_type: str,
+    sources: Union[List[str], None],
+    start_date: Any,
+    stop_date: Any,
+) -> Tuple[Any, ...]:
+    """Cache key for a fixed target search.
+
+
+    Parameters
+    ----------
+    ra, dec : float
+        Coordinates, degrees.
+
+    radius : float
+        Search radius, arcmin.
+
+    intersection_type : str
+        Name of the intersection type.
+
+    sources : list of str or ``None``
+        Searched sources, or ``None`` for all sources.
+
+    start_date, stop_date : Time, str, or None
+        Search date limits.
+
+    """
+
+    return (
+        _quantize((ra % 360) * 3600),
+        _quantize(dec * 3600),
+        _quantize(radius * 60),
+        intersection_type,
+        None if sources is None else tuple(sorted(sources)),
+        _date(start_date),
+        _date(stop_date),
+    )
+
+
+def survey_updates(catch: Catch, sources: Union[List[str], None]) -> Dict[str, str]:
+    """Last update time of each source, or of all sources."""
+
+    q = catch.db.session.query(SurveyStats.source, SurveyStats.updated)
+    if sources is not None:
+        q = q.filter(SurveyStats.source.in_(sources))
+    return {row.source: str(row.updated) for row in q.all()}
+
+
+def get(
+    catch: Catch, cache_key: Tuple[Any, ...], updated: Dict[str, str]
+) -> Union[List[Observation], None]:
+    """Observations found by a cached search, or ``None``.
+
+    Entries with outdated survey update times are discarded.
+
+
+    Parameters
+    ----------
+    catch : Catch
+        CATCH library instance.
+
+    cache_key : tuple
+        See `key`.
+
+    updated : dict
+        The current update time of each searched source, see
+        `survey_updates`.
+
+    """
+
+    if ENV.FIXED_CACHE_SIZE <= 0:
+        return None
+
+    with _cache_lock:
+        entry: Union[CachedSearch, None] = _cache.get(cache_key)
+        if entry is None:
+            return None
+
+        if entry.updated != updated:
+            del _cache[cache_key]
+            return None
+
+        _cache.move_to_end(cache_key)
+
+    # reload the observations by primary key, one query per source
+    ids: Dict[str, List[int]] = {}
+    for source, observation_id in entry.found:
+        ids.setdefault(source, []).append(observation_id)
+
+    observations: List[Observation] = []
+    for source, observation_ids in ids.items():
+        model: type = catch.sources[source]
+        observations.extend(
+            catch.db.session.query(model)
+            .filter(model.observation_id.in_(observation_ids))
+            .all()
+        )
+
+    return observations
+
+
+def put(
+    cache_key: Tuple[Any, ...],
+    updated: Dict[str, str],
+    observations: List[Observation],
+) -> None:
+    """Remember the observations found by a search.
+
+    See `get` for the parameters.
+
+    """
+
+    if ENV.FIXED_CACHE_SIZE <= 0:
+        return
+
+    entry: CachedSearch = CachedSearch(
+        updated, [(obs.source, obs.observation_id) for obs in observations]
+    )
+    with _cache_lock:
+        _cache[cache_key] = entry
+        _cache.move_to_end(cache_key)
+        while len(_cache) > ENV.FIXED_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def search(
+    catch: Catch,
+    target: FixedTarget,
+    job_id: UUID,
+    sources: Union[List[str], None],
+    updated: Union[Dict[str, str], None] = None,
+) -> List[Observation]:
+    """Search for a fixed target, unless the search is cached.
+
+    The search radius, date limits, and intersection type are taken from the
+    CATCH library instance.
+
+
+    Parameters
+    ----------
+    catch : Catch
+        CATCH library instance.
+
+    target : FixedTarget
+        The target.
+
+    job_id : `UUID`
+        Unique job identifier.
+
+    sources : list of str or ``None``
+        Search these sources, or else ``None`` to search all sources.
+
+    updated : dict, optional
+        The current update time of each source, see `survey_updates`.  Pass
+        this to avoid reading the survey statistics for each of many searches.
+
+
+    Returns
+    -------
+    observations : list of Observation
+
+    """
+
+    if ENV.FIXED_CACHE_SIZE <= 0:
+        return catch.query(target, job_id, sources)
+
+    if updated is None:
+        updated = survey_updates(catch, sources)
+
+    cache_key: Tuple[Any, ...] = key(
+        target.ra.deg,
+        target.dec.deg,
+        catch.padding,
+        catch.intersection_type.name,
+        sources,
+        catch.start_date,
+        catch.stop_date,
+    )
+
+    observations: Union[List[Observation], None] = get(catch, cache_key, updated)
+    if observations is None:
+        observations = catch.query(target, job_id, sources)
+        put(cache_key, updated, observations)
+
+    return observations
+
+
+def clear() -> None:
+    """Forget all cached searches."""
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,195 @@
+"""Service provider for queued fixed target queries.
+
+Fixed target queries with a small estimated cost are run by the API, see
+`fixed.fixed_target_query_service` and `fixed.fixed_target_batch_service`.
+Others are queued as for moving target queries, and their results are retrieved
+with `fixed.fixed_results_service` or `fixed.fixed_batch_results_service`.
+
+"""
+
+from uuid import UUID
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+from astropy.time import Time
+from astropy.coordinates import Angle
+
+from .catch_manager import catch_manager
+from .catch import admit
+from .filters import Filters
+from .queue import rq_job_id
+from .cost import CostEstimate, estimate_fixed_cost, estimate_fixed_costs, job_timeout
+from ..tasks.fixed import fixed_task, fixed_batch_task
+from ..config import QueryStatus
+
+
+def fixed_cost_service(
+    sources: List[str],
+    start_date: Union[Time, None],
+    stop_date: Union[Time, None],
+    radius: float,
+) -> CostEstimate:
+    """Estimate the cost of a fixed target query.
+
+    See `cost.estimate_fixed_cost` for the parameters.
+
+    """
+
+    with catch_manager() as catch:
+        return estimate_fixed_cost(catch, sources, start_date, stop_date, radius)
+
+
+def fixed_batch_cost_service(
+    sources: List[str],
+    start_date: Union[Time, None],
+    stop_date: Union[Time, None],
+    radii: List[float],
+) -> List[CostEstimate]:
+    """Estimate the costs of fixed target queries of many points.
+
+    See `cost.estimate_fixed_costs` for the parameters.
+
+    """
+
+    with catch_manager() as catch:
+        return estimate_fixed_costs(catch, sources, start_date, stop_date, radii)
+
+
+def _enqueue(
+    job_id: UUID,
+    f: Callable,
+    args: List[Any],
+    cost: float,
+    client: Union[str, None],
+) -> QueryStatus:
+    """Admit and enqueue a task, tracking its estimated work."""
+
+    status, queue = admit(cost, client)
+    if status != QueryStatus.QUEUED:
+        return status
+
+    queue.enqueue(
+        f=f,
+        args=args,
+        job_timeout=job_timeout(cost),
+        job_id=rq_job_id(job_id, "fixed"),
+    )
+    queue.add_work(job_id, cost, [rq_job_id(job_id, "fixed")], client)
+
+    return status
+
+
+def fixed_job_service(
+    job_id: UUID,
+    ra: Angle,
+    dec: Angle,
+    sources: Union[List[str], None],
+    start_date: Union[Time, None],
+    stop_date: Union[Time, None],
+    radius: float,
+    intersection_type: str,
+    query: Dict[str, Any],
+    cost: float,
+    client: Union[str, None] = None,
+    filters: Union[Filters, None] = None,
+    fields: Union[List[str], None] = None,
+) -> QueryStatus:
+    """Enqueue a fixed target query.
+
+
+    Parameters
+    ----------
+    job_id : `UUID`
+        Unique job identifier.
+
+    ra, dec, sources, start_date, stop_date, radius, intersection_type
+        See `fixed.fixed_target_query_service`.
+
+    query : dict
+        The query parameters, stored with the results.
+
+    cost : float
+        Estimated cost of the query, seconds, see `fixed_cost_service`.
+
+    client : str, optional
+        Identifies the requester for per-client limits.
+
+    filters, fields : optional
+        See `fixed.fixed_target_query_service`.
+
+
+    Returns
+    -------
+    status : QueryStatus
+        ``QUEUED``, or else the reason the query was refused.
+
+    """
+
+    return _enqueue(
+        job_id,
+        fixed_task,
+        [
+            job_id,
+            float(ra.deg),
+            float(dec.deg),
+            sources,
+            None if start_date is None else start_date.iso,
+            None if stop_date is None else stop_date.iso,
+            radius,
+            intersection_type,
+            query,
+            filters,
+            fields,
+        ],
+        cost,
+        client,
+    )
+
+
+def fixed_batch_job_service(
+    job_id: UUID,
+    positions: List[Tuple[Angle, Angle, float]],
+    sources: Union[List[str], None],
+    start_date: Union[Time, None],
+    stop_date: Union[Time, None],
+    intersection_type: str,
+    query: Dict[str, Any],
+    cost: float,
+    client: Union[str, None] = None,
+) -> QueryStatus:
+    """Enqueue a batch of fixed target queries.
+
+
+    Parameters
+    ----------
+    job_id : `UUID`
+        Unique job identifier.
+
+    positions, sources, start_date, stop_date, intersection_type
+        See `fixed.fixed_target_batch_service`.
+
+    query, cost, client
+        See `fixed_job_service`.
+
+
+    Returns
+    -------
+    status : QueryStatus
+        ``QUEUED``, or else the reason the batch was refused.
+
+    """
+
+    return _enqueue(
+        job_id,
+        fixed_batch_task,
+        [
+            job_id,
+            [(float(ra.deg), float(dec.deg), radius) for ra, dec, radius in positions],
+            sources,
+            None if start_date is None else start_date.iso,
+            None if stop_date is None else stop_date.iso,
+            intersection_type,
+            query,
+        ],
+        cost,
+        client,
+    )
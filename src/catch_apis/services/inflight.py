@@ -0,0 +1,177 @@
+"""Coalesce identical moving target queries.
+
+While a query is queued or running, its job ID is stored in Redis under a key
+derived from the normalized query parameters.  An identical query submitted in
+the meantime attaches to the running job, rather than enqueuing a new one.
+
+Claims are made and released atomically with Lua scripts.  A new claim expires
+quickly, and is extended when the job is enqueued, according to the job's
+timeouts and the work queued ahead of it.  The job releases the claim when it
+completes.
+
+"""
+
+from typing import List, Union
+from uuid import UUID
+import hashlib
+import json
+
+from astropy.time import Time
+from rq.utils import as_text
+
+from ..config.env import ENV
+from .queue import RedisConnection
+
+
+def query_key(
+    target: str,
+    sources: List[str],
+    start_date: Union[Time, None],
+    stop_date: Union[Time, None],
+    uncertainty_ellipse: bool,
+    padding: float,
+) -> str:
+    """Redis key for a moving target query.
+
+
+    Parameters
+    ----------
+    target : str
+        The sanitized target name, see `validation.parse_target_name`.
+
+    sources : list of str
+        Search these sources.
+
+    start_date, stop_date : Time or None
+        Search date limits.
+
+    uncertainty_ellipse : bool
+        Search using the ephemeris uncertainty ellipse.
+
+    padding : float
+        Additional padding around the ephemeris search region, arcmin.
+
+
+    Returns
+    -------
+    key : str
+
+    """
+
+    parameters: str = json.dumps(
+        [
+            target,
+            sorted(sources),
+            None if start_date is None else start_date.iso,
+            None if stop_date is None else stop_date.iso,
+            bool(uncertainty_ellipse),
+            round(float(padding), 6),
+        ]
+    )
+    digest: str = hashlib.sha1(parameters.encode()).hexdigest()
+    return f"{ENV.REDIS_JOBS}:inflight:{digest}"
+
+
+# seconds, a claim expires if the query is not enqueued in this time
+CLAIM_TTL: int = 600
+
+# KEYS[1]: query key, ARGV[1]: job ID, ARGV[2]: TTL
+_CLAIM: str = """
+local running = redis.call('GET', KEYS[1])
+if running then
+    return running
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return false
+"""
+
+# KEYS[1]: query key, ARGV[1]: job ID, ARGV[2]: TTL
+_EXTEND: str = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# KEYS[1]: query key, ARGV[1]: job ID
+_RELEASE: str = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def claim(key: str, job_id: UUID) -> Union[UUID, None]:
+    """Claim a query for a job.
+
+    The claim is made, or the current claim is read, atomically.  It expires
+    after `CLAIM_TTL` seconds, unless it is extended with `extend` when the job
+    is enqueued.
+
+
+    Parameters
+    ----------
+    key : str
+        Query key, see `query_key`.
+
+    job_id : UUID
+        The job that will run the query.
+
+
+    Returns
+    -------
+    running : UUID or None
+        The job ID of an identical query in progress, or ``None`` if the query
+        was claimed for ``job_id``.
+
+    """
+
+    running = RedisConnection().eval(_CLAIM, 1, key, job_id.hex, CLAIM_TTL)
+    return None if running is None else UUID(as_text(running), version=4)
+
+
+def extend(key: Union[str, None], job_id: UUID, ttl: int) -> None:
+    """Extend a query claimed by a job.
+
+
+    Parameters
+    ----------
+    key : str or None
+        Query key, see `query_key`.  Nothing is done if ``None``.
+
+    job_id : UUID
+        The job that claimed the query.  The claim is only extended if it is
+        still held by this job.
+
+    ttl : int
+        Expire the claim after this many seconds, e.g., the longest time the
+        job may wait in the queue and run.
+
+    """
+
+    if key is None:
+        return
+
+    RedisConnection().eval(_EXTEND, 1, key, job_id.hex, max(int(ttl), 1))
+
+
+def release(key: Union[str, None], job_id: UUID) -> None:
+    """Release a query claimed by a job.
+
+
+    Parameters
+    ----------
+    key : str or None
+        Query key, see `query_key`.  Nothing is done if ``None``.
+
+    job_id : UUID
+        The job that claimed the query.  The claim is only released if it is
+        still held by this job.
+
+    """
+
+    if key is None:
+        return
+
+    RedisConnection().eval(_RELEASE, 1, key, job_id.hex)
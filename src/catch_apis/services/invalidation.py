@@ -0,0 +1,47 @@
+"""Invalidate in-process caches in all processes.
+
+Some results are cached by each API process, e.g., moving target query cache
+misses (see `catch.cached_queries`) and status summaries (see `status.cache`).
+The processes that make them out of date, e.g., woRQers finishing queries,
+increment a version counter in Redis with `bump`.  The caches compare the
+`version` with the one their entries were made with, and discard the entries
+when it has changed.
+
+"""
+
+from typing import Union
+
+from ..config import get_logger
+from ..config.env import ENV
+from .queue import RedisConnection
+
+# version names
+QUERIES: str = "queries"  # a moving target query finished
+
+
+def _redis_key(name: str) -> str:
+    return f"{ENV.REDIS_JOBS}:version:{name}"
+
+
+def version(name: str) -> Union[int, None]:
+    """Current version, or ``None`` if it cannot be read."""
+
+    try:
+        value = RedisConnection().get(_redis_key(name))
+    except Exception:  # pylint: disable=broad-exception-caught
+        get_logger().exception("Error reading the cache version.")
+        return None
+
+    return 0 if value is None else int(value)
+
+
+def bump(*names: str) -> None:
+    """Increment versions, invalidating the caches that depend on them."""
+
+    try:
+        pipeline = RedisConnection().pipeline(transaction=False)
+        for name in names:
+            pipeline.incr(_redis_key(name))
+        pipeline.execute()
+    except Exception:  # pylint: disable=broad-exception-caught
+        get_logger().exception("Error incrementing the cache version.")
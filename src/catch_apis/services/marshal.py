@@ -1,6 +1,16 @@
-"""Object marshalling."""
+"""Object marshalling.
 
-from typing import Dict, List, Optional, Union
+Rows may be limited to a subset of fields (a projection), in which case only
+those fields are computed.  The `REQUIRED_FIELDS` identify and page the rows,
+and are always included.
+
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from functools import lru_cache
+from operator import attrgetter
+
+import numpy as np
 from astropy.time import Time
 from catch.model import Found, Observation, SkyMapperDR4
 
@@ -28,6 +38,96 @@ SURVEY_SPECIFIC_FIELDS: Dict[str, List[str]] = {
 }
 
 
+# fields of marshalled observations, in order, excluding survey-specific fields
+OBSERVATION_FIELDS: Tuple[str, ...] = (
+    "product_id",
+    "source",
+    "source_name",
+    "mjd_start",
+    "mjd_stop",
+    "fov",
+    "filter",
+    "exposure",
+    "seeing",
+    "airmass",
+    "maglimit",
+    "date",
+    "archive_url",
+    "diff_url",
+    "cutout_url",
+    "preview_url",
+)
+
+# fields of marshalled found objects, in order
+FOUND_FIELDS: Tuple[str, ...] = (
+    "date",
+    "rh",
+    "delta",
+    "phase",
+    "drh",
+    "true_anomaly",
+    "ra",
+    "dec",
+    "dra",
+    "ddec",
+    "unc_a",
+    "unc_b",
+    "unc_theta",
+    "elong",
+    "sangle",
+    "vangle",
+    "vmag",
+)
+
+# fields that are always marshalled, see `pagination.page_key`
+REQUIRED_FIELDS: Tuple[str, ...] = ("product_id", "mjd_start")
+
+# fields computed by the survey-specific observation classes
+URL_FIELDS: Tuple[str, ...] = ("archive_url", "diff_url", "cutout_url", "preview_url")
+
+# getters of the observation fields, other than date and the cutout URLs
+OBSERVATION_GETTERS: Dict[str, Callable[[Observation], Any]] = {
+    "product_id": attrgetter("product_id"),
+    "source": attrgetter("source"),
+    "source_name": attrgetter("__data_source_name__"),
+    "mjd_start": attrgetter("mjd_start"),
+    "mjd_stop": attrgetter("mjd_stop"),
+    "fov": attrgetter("fov"),
+    "filter": attrgetter("filter"),
+    "exposure": attrgetter("exposure"),
+    "seeing": attrgetter("seeing"),
+    "airmass": attrgetter("airmass"),
+    "maglimit": attrgetter("maglimit"),
+    "archive_url": attrgetter("archive_url"),
+    "diff_url": lambda o: getattr(o, "diff_url", None),
+}
+
+
+def survey_specific_keys() -> Tuple[str, ...]:
+    """Prefixed keys of all survey-specific fields."""
+    return tuple(
+        f"{prefix}:{field}"
+        for prefix, fields in SURVEY_SPECIFIC_FIELDS.items()
+        for field in fields
+    )
+
+
+def check_fields(fields: Optional[Sequence[str]], allowed: Sequence[str]) -> None:
+    """Raise ValueError if any of the requested fields are not allowed."""
+
+    if fields is None:
+        return
+
+    invalid: List[str] = [field for field in fields if field not in allowed]
+    if len(invalid) > 0:
+        raise ValueError(f"Invalid fields: {', '.join(invalid)}")
+
+
+def _projection(fields: Optional[Sequence[str]]) -> Optional[frozenset]:
+    """The set of fields to marshal, or ``None`` for all fields."""
+    return None if fields is None else frozenset(fields).union(REQUIRED_FIELDS)
+
+
 def skymapper_image_type(obs):
     if isinstance(obs, SkyMapperDR4):
         return SKYMAPPER_IMAGE_TYPES.get(obs.image_type)
@@ -35,6 +135,295 @@ def skymapper_image_type(obs):
         return None
 
 
+@lru_cache(maxsize=None)
+def survey_specific_fields(
+    cls: type,
+) -> Tuple[Tuple[str, Callable[[Observation], Any]], ...]:
+    """Survey-specific keys and attribute getters for an observation class.
+
+    Resolved once per class rather than once per row.
+
+
+    Parameters
+    ----------
+    cls : type
+        `Observation` sub-class.
+
+
+    Returns
+    -------
+    fields : tuple of (str, callable)
+        Prefixed keys and the functions that retrieve their values.
+
+    """
+
+    prefix: str = getattr(cls, "__field_prefix__")
+    fields: List[Tuple[str, Callable[[Observation], Any]]] = []
+    for field in SURVEY_SPECIFIC_FIELDS.get(prefix, []):
+        key = f"{prefix}:{field}"
+        if key == "skymapper:image_type":
+            fields.append((key, skymapper_image_type))
+        else:
+            fields.append((key, attrgetter(field)))
+    return tuple(fields)
+
+
+def iso_dates(mjd: Sequence[float]) -> List[str]:
+    """Convert modified Julian dates to ISO strings in one vectorized pass."""
+
+    if len(mjd) == 0:
+        return []
+
+    return Time(np.array(mjd, dtype=float), format="mjd").iso.tolist()
+
+
+def to_columns(rows: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Convert a list of rows into a dictionary of columns.
+
+    Keys missing from a row (e.g., survey-specific fields) are filled with
+    ``None``.
+
+    """
+
+    keys: Dict[str, None] = {}
+    for row in rows:
+        keys.update(dict.fromkeys(row))
+
+    return {key: [row.get(key) for row in rows] for key in keys}
+
+
+def _broadcast(
+    value: Optional[Union[float, Sequence[float]]], n: int
+) -> Sequence[Optional[float]]:
+    if value is None or np.isscalar(value):
+        return [value] * n
+    return value
+
+
+def observations(
+    obs: Sequence[Observation],
+    ra: Optional[Union[float, Sequence[float]]] = None,
+    dec: Optional[Union[float, Sequence[float]]] = None,
+    columnar: bool = False,
+    fields: Optional[Sequence[str]] = None,
+) -> Union[List[Dict[str, Any]], Dict[str, List[Any]]]:
+    """Transform observation objects into dictionaries.
+
+    Survey specific items are prefixed (see `SURVEY_SPECIFIC_FIELDS`).
+
+
+    Parameters
+    ----------
+    obs : list of Observation
+        The observation objects from sqlalchemy.
+
+    ra, dec : float or list of float, optional
+        Coordinates for cutout and preview URLs, in units of degree.  Either a
+        single position for all observations, or one per observation.
+
+    columnar : bool, optional
+        Return a dictionary of columns rather than a list of rows.
+
+    fields : list of str, optional
+        Only marshal these fields, and the `REQUIRED_FIELDS`.
+
+
+    Returns
+    -------
+    data : list of dict, or dict of lists
+
+    """
+
+    if fields is not None:
+        rows = _projected_observations(obs, ra, dec, _projection(fields))
+        return to_columns(rows) if columnar else rows
+
+    n: int = len(obs)
+    dates: List[str] = iso_dates([(o.mjd_start + o.mjd_stop) / 2 for o in obs])
+
+    rows: List[Dict[str, Any]] = []
+    for o, date, _ra, _dec in zip(obs, dates, _broadcast(ra, n), _broadcast(dec, n)):
+        row: Dict[str, Union[str, float, int, None]] = {
+            "product_id": o.product_id,
+            "source": o.source,
+            "source_name": o.__data_source_name__,
+            "mjd_start": o.mjd_start,
+            "mjd_stop": o.mjd_stop,
+            "fov": o.fov,
+            "filter": o.filter,
+            "exposure": o.exposure,
+            "seeing": o.seeing,
+            "airmass": o.airmass,
+            "maglimit": o.maglimit,
+            "date": date,
+            "archive_url": o.archive_url,
+            "diff_url": getattr(o, "diff_url", None),
+        }
+
+        if _ra is not None and _dec is not None:
+            row["cutout_url"] = o.cutout_url(_ra, _dec)
+            row["preview_url"] = o.preview_url(_ra, _dec)
+
+        # survey-specific fields
+        for key, getter in survey_specific_fields(type(o)):
+            row[key] = getter(o)
+
+        rows.append(row)
+
+    return to_columns(rows) if columnar else rows
+
+
+def _projected_observations(
+    obs: Sequence[Observation],
+    ra: Optional[Union[float, Sequence[float]]],
+    dec: Optional[Union[float, Sequence[float]]],
+    keys: frozenset,
+) -> List[Dict[str, Any]]:
+    """Transform observation objects into dictionaries of some fields."""
+
+    n: int = len(obs)
+    getters: List[Tuple[str, Callable[[Observation], Any]]] = [
+        (key, getter) for key, getter in OBSERVATION_GETTERS.items() if key in keys
+    ]
+
+    dates: Sequence[Optional[str]] = [None] * n
+    if "date" in keys:
+        dates = iso_dates([(o.mjd_start + o.mjd_stop) / 2 for o in obs])
+
+    rows: List[Dict[str, Any]] = []
+    for o, date, _ra, _dec in zip(obs, dates, _broadcast(ra, n), _broadcast(dec, n)):
+        row: Dict[str, Any] = {key: getter(o) for key, getter in getters}
+        if date is not None:
+            row["date"] = date
+
+        if _ra is not None and _dec is not None:
+            if "cutout_url" in keys:
+                row["cutout_url"] = o.cutout_url(_ra, _dec)
+            if "preview_url" in keys:
+                row["preview_url"] = o.preview_url(_ra, _dec)
+
+        for key, getter in survey_specific_fields(type(o)):
+            if key in keys:
+                row[key] = getter(o)
+
+        rows.append(row)
+
+    return rows
+
+
+def found_observations(
+    found_obs: Sequence[Tuple[Found, Observation]],
+    columnar: bool = False,
+    fields: Optional[Sequence[str]] = None,
+) -> Union[List[Dict[str, Any]], Dict[str, List[Any]]]:
+    """Transform found and observation object pairs into dictionaries.
+
+    Cutout and preview URLs are centered on the found object's position.
+
+
+    Parameters
+    ----------
+    found_obs : list of (Found, Observation)
+        The found and observation objects from sqlalchemy.
+
+    columnar : bool, optional
+        Return a dictionary of columns rather than a list of rows.
+
+    fields : list of str, optional
+        Only marshal these fields, and the `REQUIRED_FIELDS`.
+
+
+    Returns
+    -------
+    data : list of dict, or dict of lists
+
+    """
+
+    found_list: List[Found] = [f for f, obs in found_obs]
+
+    # the found object's date replaces the observation's
+    observation_fields: Optional[List[str]] = None
+    if fields is not None:
+        observation_fields = [field for field in fields if field != "date"]
+
+    # positions are only needed for the cutout and preview URLs, and may not
+    # be loaded for other projections
+    ra: Optional[List[float]] = None
+    dec: Optional[List[float]] = None
+    if fields is None or {"cutout_url", "preview_url"}.intersection(fields):
+        ra = [f.ra for f in found_list]
+        dec = [f.dec for f in found_list]
+
+    rows: List[Dict[str, Any]] = observations(
+        [obs for f, obs in found_obs], ra, dec, fields=observation_fields
+    )
+    for row, data in zip(rows, founds(found_list, fields=fields)):
+        row.update(data)
+
+    return to_columns(rows) if columnar else rows
+
+
+def founds(
+    found_list: Sequence[Found], fields: Optional[Sequence[str]] = None
+) -> List[Dict[str, Any]]:
+    """Transform found objects into dictionaries.
+
+
+    Parameters
+    ----------
+    found_list : list of Found
+        The found objects from sqlalchmey.
+
+    fields : list of str, optional
+        Only marshal these fields.
+
+
+    Returns
+    -------
+    data : list of dict
+
+    """
+
+    if fields is not None:
+        keys: frozenset = frozenset(fields)
+        attributes: List[str] = [key for key in FOUND_FIELDS[1:] if key in keys]
+        rows: List[Dict[str, Any]] = [
+            {key: getattr(f, key) for key in attributes} for f in found_list
+        ]
+        if "date" in keys:
+            for row, date in zip(rows, iso_dates([f.mjd for f in found_list])):
+                row["date"] = date
+        return rows
+
+    dates: List[str] = iso_dates([f.mjd for f in found_list])
+
+    rows: List[Dict[str, Any]] = []
+    for f, date in zip(found_list, dates):
+        rows.append(
+            {
+                "date": date,
+                "rh": f.rh,
+                "delta": f.delta,
+                "phase": f.phase,
+                "drh": f.drh,
+                "true_anomaly": f.true_anomaly,
+                "ra": f.ra,
+                "dec": f.dec,
+                "dra": f.dra,
+                "ddec": f.ddec,
+                "unc_a": f.unc_a,
+                "unc_b": f.unc_b,
+                "unc_theta": f.unc_theta,
+                "elong": f.elong,
+                "sangle": f.sangle,
+                "vangle": f.vangle,
+                "vmag": f.vmag,
+            }
+        )
+
+    return rows
+
+
 def observation(
     obs: Observation,
     ra: Optional[float] = None,
@@ -42,7 +431,7 @@ def observation(
 ) -> Dict[str, Union[str, float, int, None]]:
     """Transform observation object into a dictionary.
 
-    Survey specific items are prefixed (see `SURVEY_SPECIFIC_FIELDS`).
+    See `observations` to transform many objects at once.
 
 
     Parameters
@@ -60,44 +449,14 @@ def observation(
 
     """
 
-    data: Dict[str, Union[str, float, int, None]] = {
-        "product_id": obs.product_id,
-        "source": obs.source,
-        "source_name": obs.__data_source_name__,
-        "mjd_start": obs.mjd_start,
-        "mjd_stop": obs.mjd_stop,
-        "fov": obs.fov,
-        "filter": obs.filter,
-        "exposure": obs.exposure,
-        "seeing": obs.seeing,
-        "airmass": obs.airmass,
-        "maglimit": obs.maglimit,
-        "date": Time((obs.mjd_start + obs.mjd_stop) / 2, format="mjd").iso,
-        "archive_url": obs.archive_url,
-        "diff_url": getattr(obs, "diff_url", None),
-    }
-
-    if ra is not None and dec is not None:
-        data["cutout_url"] = obs.cutout_url(ra, dec)
-        data["preview_url"] = obs.preview_url(ra, dec)
-
-    # survey-specific fields
-    prefix: str = getattr(obs, "__field_prefix__")
-    for field in SURVEY_SPECIFIC_FIELDS.get(prefix, []):
-        key = f"{prefix}:{field}"
-        if key == "skymapper:image_type":
-            value = skymapper_image_type(obs)
-        else:
-            value = getattr(obs, field)
-
-        data[key] = value
-
-    return data
+    return observations([obs], ra, dec)[0]
 
 
 def found(f: Found) -> Dict[str, Union[str, float, int, None]]:
     """Transform found object into a dictionary.
 
+    See `founds` to transform many objects at once.
+
 
     Parameters
     ----------
@@ -111,24 +470,4 @@ def found(f: Found) -> Dict[str, Union[str, float, int, None]]:
 
     """
 
-    data: Dict[str, Union[str, float, int, None]] = {
-        "date": Time(f.mjd, format="mjd").iso,
-        "rh": f.rh,
-        "delta": f.delta,
-        "phase": f.phase,
-        "drh": f.drh,
-        "true_anomaly": f.true_anomaly,
-        "ra": f.ra,
-        "dec": f.dec,
-        "dra": f.dra,
-        "ddec": f.ddec,
-        "unc_a": f.unc_a,
-        "unc_b": f.unc_b,
-        "unc_theta": f.unc_theta,
-        "elong": f.elong,
-        "sangle": f.sangle,
-        "vangle": f.vangle,
-        "vmag": f.vmag,
-    }
-
-    return data
+    return founds([f])[0]
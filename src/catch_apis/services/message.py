@@ -16,12 +16,22 @@ keys are currently supported:
 The `tasks.message.Message` class should be used to ensure proper
 message formatting.
 
+Each Redis stream entry also has the full job ID in its ``job_id`` field, so
+that the messages of a single job may be selected without relying on the
+prefix.  The full ID is not part of the message sent to all users.
+
 This module also defines an interface to the task messaging stream via
 the Python logging facility.  Use `listen_to_task_messenger` to register
 a logging handler with a given job ID.  When info messages are sent to
 the logger (e.g., via the catch library), they will be published to the
 stream.
 
+Messages from the logging interface are buffered and published in batches
+by a background thread (see `MessagePublisher`), so that a verbose task is
+not slowed down by Redis round trips.  Messages are always published in the
+order they were created.  `Message.publish` and
+`stop_listening_for_task_messages` flush the buffer before returning.
+
 
 Examples
 --------
@@ -41,15 +51,19 @@ Examples
 
 """
 
-from typing import Union, Dict
+import os
+from typing import Union, Dict, List, Tuple
 from uuid import UUID
 from enum import Enum
-from time import monotonic
+from time import monotonic, time
+from collections import defaultdict
+import threading
 import logging
 import json
 
 from .queue import RedisConnection
 from catch_apis.config.env import ENV
+from ..config import get_logger
 
 
 class TaskStatus(Enum):
@@ -93,12 +107,23 @@ class Message:
         self.job_id = UUID(str(job_id), version=4)
         self.text = text
         self.status = TaskStatus(status)
-        self._redis = RedisConnection()
 
     @classmethod
-    def reset_t0(cls):
-        """Reset the reference time."""
+    def reset_t0(cls, started: Union[float, None] = None):
+        """Reset the reference time.
+
+
+        Parameters
+        ----------
+        started : float, optional
+            Use this UNIX time as the reference time, e.g., when a job split
+            into several tasks was enqueued.  Otherwise, use the current time.
+
+        """
+
         cls.t0 = monotonic()
+        if started is not None:
+            cls.t0 -= max(time() - started, 0)
 
     @property
     def job_id(self) -> UUID:
@@ -140,13 +165,127 @@ class Message:
         return "<Message: {}>".format(str(self))
 
     def publish(self):
-        """Publish this message to the user message stream."""
-        self._redis.xadd(
-            ENV.REDIS_TASK_MESSAGES,
-            {"data": str(self)},
-            maxlen=ENV.REDIS_TASK_MESSAGES_MAX_QUEUE_SIZE,
-            approximate=True,
-        )
+        """Publish this message to the user message stream.
+
+        Any buffered messages are published first.
+
+        """
+        publisher.publish(self, wait=True)
+
+
+class MessagePublisher:
+    """Publish messages to the task messaging stream in batches.
+
+    Messages are serialized when they are added to the buffer, and published
+    with a Redis pipeline by a background thread.  The buffer is flushed when
+    it holds ``ENV.REDIS_TASK_MESSAGES_BATCH_SIZE`` messages, every
+    ``ENV.REDIS_TASK_MESSAGES_FLUSH_INTERVAL`` milliseconds, and immediately
+    after a success or error message.
+
+    """
+
+    def __init__(self) -> None:
+        self._reset()
+
+    def _reset(self) -> None:
+        # (job ID, message data)
+        self._buffer: List[Tuple[str, str]] = []
+        # guards the buffer and wakes up the background thread
+        self._condition: threading.Condition = threading.Condition()
+        # serializes flushes, which keeps messages in order
+        self._flush_lock: threading.Lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._pid: int = os.getpid()
+
+    def _check_fork(self) -> None:
+        """Reset the publisher in a forked process.
+
+        The parent's thread does not exist in the child, and its locks may be
+        held.  Must be called before the locks are used.
+
+        """
+
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _start(self) -> None:
+        """Start the background thread, if needed."""
+
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="MessagePublisher", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        interval: float = ENV.REDIS_TASK_MESSAGES_FLUSH_INTERVAL / 1000
+        while True:
+            with self._condition:
+                if len(self._buffer) < ENV.REDIS_TASK_MESSAGES_BATCH_SIZE:
+                    self._condition.wait(interval)
+
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-exception-caught
+                # keep the thread alive; the messages are lost
+                get_logger().exception("Error publishing task messages.")
+
+    def publish(self, msg: Message, wait: bool = False) -> None:
+        """Add a message to the buffer.
+
+
+        Parameters
+        ----------
+        msg : Message
+            The message to publish.
+
+        wait : bool, optional
+            Flush the buffer before returning.
+
+        """
+
+        self._check_fork()
+        data: str = str(msg)
+        with self._condition:
+            self._buffer.append((msg.job_id.hex, data))
+            wait = wait or not ENV.REDIS_TASK_MESSAGES_ASYNC
+            if not wait:
+                self._start()
+                if msg.status in (TaskStatus.SUCCESS, TaskStatus.ERROR) or (
+                    len(self._buffer) >= ENV.REDIS_TASK_MESSAGES_BATCH_SIZE
+                ):
+                    self._condition.notify()
+
+        if wait:
+            self.flush()
+
+    def flush(self) -> None:
+        """Publish all buffered messages."""
+
+        self._check_fork()
+        with self._flush_lock:
+            with self._condition:
+                buffer: List[Tuple[str, str]] = self._buffer
+                self._buffer = []
+
+            if len(buffer) == 0:
+                return
+
+            pipeline = RedisConnection().pipeline(transaction=False)
+            job_id: str
+            data: str
+            for job_id, data in buffer:
+                pipeline.xadd(
+                    ENV.REDIS_TASK_MESSAGES,
+                    {"data": data, "job_id": job_id},
+                    maxlen=ENV.REDIS_TASK_MESSAGES_MAX_QUEUE_SIZE,
+                    approximate=True,
+                )
+            pipeline.execute()
+
+
+# shared by all messages in this process
+publisher: MessagePublisher = MessagePublisher()
 
 
 class MessageHandler(logging.Handler):
@@ -162,7 +301,6 @@ class MessageHandler(logging.Handler):
 
     def __init__(self, job_id: Union[str, UUID], level: int = logging.INFO) -> None:
         self.job_id = UUID(str(job_id), version=4)
-        self._redis = RedisConnection()
         super().__init__(level)
 
     @property
@@ -177,7 +315,15 @@ class MessageHandler(logging.Handler):
         msg = Message(self.job_id)
         msg.text = record.msg % record.args
         msg.status = TaskStatus.RUNNING
-        msg.publish()
+        publisher.publish(msg)
+
+
+# Number of active listeners for each job ID in this process.  Several tasks for
+# the same job may run in one process (e.g., per-source searches), but they must
+# share a single message handler, otherwise each message is published once per
+# task.
+_listeners: Dict[UUID, int] = defaultdict(int)
+_listeners_lock: threading.Lock = threading.Lock()
 
 
 def listen_for_task_messages(job_id: Union[str, UUID]) -> None:
@@ -185,6 +331,9 @@ def listen_for_task_messages(job_id: Union[str, UUID]) -> None:
 
     Intended for messages with `status='running'`.
 
+    Calls are counted: the message handler is removed after the same number of
+    calls to `stop_listening_for_task_messages`.
+
 
     Parameters
     ----------
@@ -196,20 +345,29 @@ def listen_for_task_messages(job_id: Union[str, UUID]) -> None:
     job_id = UUID(str(job_id), version=4)
     logger: logging.Logger = logging.getLogger(f"CATCH-APIs {job_id.hex}")
 
-    # avoid duplicating messages by removing and re-adding the message handler
-    handler: logging.Handler
-    for handler in logger.handlers:
-        logger.removeHandler(handler)
+    with _listeners_lock:
+        _listeners[job_id] += 1
+        if _listeners[job_id] > 1 and len(logger.handlers) == 1:
+            # already listening
+            return
+
+        # avoid duplicating messages by removing and re-adding the message
+        # handler; iterate over a copy since the list is being modified
+        handler: logging.Handler
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
 
-    # logger.setLevel not working for MessageHandler, so must pass log level
-    # directly to the handler
-    level: int = logging.DEBUG if ENV.DEBUG else logging.INFO
-    logger.addHandler(MessageHandler(job_id, level=level))
+        # logger.setLevel not working for MessageHandler, so must pass log
+        # level directly to the handler
+        level: int = logging.DEBUG if ENV.DEBUG else logging.INFO
+        logger.addHandler(MessageHandler(job_id, level=level))
 
 
 def stop_listening_for_task_messages(job_id: Union[str, UUID]) -> None:
     """Stop publishing messages for this job ID to the task messaging stream.
 
+    Buffered messages are published before returning.
+
 
     Parameters
     ----------
@@ -220,8 +378,17 @@ def stop_listening_for_task_messages(job_id: Union[str, UUID]) -> None:
 
     job_id = UUID(str(job_id), version=4)
     logger: logging.Logger = logging.getLogger(f"CATCH-APIs {job_id.hex}")
-    handler: logging.Handler
-    for handler in logger.handlers:
-        if getattr(handler, "job_id", None) == job_id:
-            logger.removeHandler(handler)
-            break
+
+    publisher.flush()
+
+    with _listeners_lock:
+        _listeners[job_id] -= 1
+        if _listeners[job_id] > 0:
+            # another task is still listening
+            return
+
+        del _listeners[job_id]
+        handler: logging.Handler
+        for handler in list(logger.handlers):
+            if getattr(handler, "job_id", None) == job_id:
+                logger.removeHandler(handler)
@@ -0,0 +1,39 @@
+"""Keyset pagination of query results.
+
+Results are ordered by observation start time and product ID.  A page ends with
+the key of its last row, encoded as an opaque cursor.  The next page starts
+with the first row after that key.
+
+"""
+
+import json
+import base64
+import binascii
+from typing import Any, Dict, Tuple
+
+# (mjd_start, product_id)
+PageKey = Tuple[float, str]
+
+
+def page_key(row: Dict[str, Any]) -> PageKey:
+    """Sort key of a marshalled observation."""
+    return (row["mjd_start"], row["product_id"])
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Continuation token for the results following this row."""
+    return base64.urlsafe_b64encode(json.dumps(page_key(row)).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> PageKey:
+    """Decode a continuation token.
+
+    Raises ValueError if the token is invalid.
+
+    """
+
+    try:
+        mjd_start, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(mjd_start), str(product_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}")
@@ -0,0 +1,166 @@
+"""Job ID aliases for cached moving target queries.
+
+When a query is cached, the new job refers to the earlier query's results,
+rather than copying them to new database rows.  The references are stored in
+the ``catch_apis_query_alias`` table, which is created on first use.
+
+"""
+
+from typing import Dict, List, Set, Union
+from uuid import UUID
+
+from sqlalchemy import BigInteger, Column, DateTime, String, func, inspect
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session, declarative_base
+from catch.model import CatchQuery
+
+from .catch_manager import Catch
+
+Base = declarative_base()
+
+
+class QueryAlias(Base):
+    """A job's reference to the results of an earlier query."""
+
+    __tablename__ = "catch_apis_query_alias"
+    job_id = Column(String(32), primary_key=True)  # hex
+    source = Column(String(64), primary_key=True)
+    query_id = Column(BigInteger, nullable=False, index=True)
+    created = Column(DateTime, nullable=False, server_default=func.now())
+
+
+# database URLs with a verified alias table
+_tables_created: Set[str] = set()
+
+
+def create_tables(session: Session) -> None:
+    """Create the CATCH-APIs tables (``Base.metadata``), if needed."""
+
+    bind = session.get_bind()
+    url: str = str(bind.engine.url)
+    if url in _tables_created:
+        return
+
+    try:
+        Base.metadata.create_all(bind.engine, checkfirst=True)
+    except DBAPIError:
+        # another process may have created the table at the same time
+        if not inspect(bind.engine).has_table(QueryAlias.__tablename__):
+            raise
+
+    _tables_created.add(url)
+
+
+def add_aliases(
+    catch: Catch, job_id: UUID, query_ids: Dict[str, Union[int, None]]
+) -> None:
+    """Refer a job to earlier queries.
+
+
+    Parameters
+    ----------
+    catch : Catch
+        CATCH library instance.
+
+    job_id : UUID
+        Unique job ID.
+
+    query_ids : dict
+        Cached query ID for each source, e.g., from
+        `services.catch.cached_queries`.  Sources without a query ID are
+        skipped.
+
+    """
+
+    create_tables(catch.db.session)
+    catch.db.session.add_all(
+        [
+            QueryAlias(job_id=job_id.hex, source=source, query_id=query_id)
+            for source, query_id in query_ids.items()
+            if query_id is not None
+        ]
+    )
+    catch.db.session.commit()
+
+
+def queries_from_job_id(catch: Catch, job_id: UUID) -> List[CatchQuery]:
+    """All queries for a job, including the earlier queries it refers to.
+
+    Replaces ``Catch.queries_from_job_id``.  Queries from aliases keep their
+    original job ID.
+
+
+    Parameters
+    ----------
+    catch : Catch
+        CATCH library instance.
+
+    job_id : UUID
+        Unique job ID.
+
+
+    Returns
+    -------
+    queries : list of CatchQuery
+
+    """
+
+    queries: List[CatchQuery] = list(catch.queries_from_job_id(job_id))
+
+    create_tables(catch.db.session)
+    queries.extend(
+        catch.db.session.query(CatchQuery)
+        .join(QueryAlias, QueryAlias.query_id == CatchQuery.query_id)
+        .filter(QueryAlias.job_id == job_id.hex)
+        .order_by(QueryAlias.source)
+        .all()
+    )
+
+    return queries
+
+
+def queries_from_job_ids(
+    catch: Catch, job_ids: List[UUID]
+) -> Dict[str, List[CatchQuery]]:
+    """All queries for many jobs, with two database queries.
+
+    See `queries_from_job_id`.
+
+
+    Parameters
+    ----------
+    catch : Catch
+        CATCH library instance.
+
+    job_ids : list of UUID
+        Unique job IDs.
+
+
+    Returns
+    -------
+    queries : dict of lists of CatchQuery
+        Keyed by job ID (hex).
+
+    """
+
+    hexes: List[str] = [job_id.hex for job_id in job_ids]
+    queries: Dict[str, List[CatchQuery]] = {job_id: [] for job_id in hexes}
+
+    query: CatchQuery
+    for query in (
+        catch.db.session.query(CatchQuery)
+        .filter(CatchQuery.job_id.in_(hexes))
+        .order_by(CatchQuery.query_id)
+    ):
+        queries[query.job_id].append(query)
+
+    create_tables(catch.db.session)
+    for job_id, query in (
+        catch.db.session.query(QueryAlias.job_id, CatchQuery)
+        .join(CatchQuery, QueryAlias.query_id == CatchQuery.query_id)
+        .filter(QueryAlias.job_id.in_(hexes))
+        .order_by(QueryAlias.source)
+    ):
+        queries[job_id].append(query)
+
+    return queries
@@ -1,40 +1,421 @@
 """Message and jobs queues via Redis."""
 
-from redis import StrictRedis
+import threading
+import json
+import time
+import re
+from typing import Any
+from uuid import UUID
+
+from redis import StrictRedis, BlockingConnectionPool
+import redis.asyncio
 from rq import Queue
+from rq.job import JobStatus
+from rq.utils import as_text, str_to_date
 from catch_apis.config.env import ENV
 
+_connection_pool: BlockingConnectionPool | None = None
+_connection_pool_lock: threading.Lock = threading.Lock()
+
+
+def connection_pool() -> BlockingConnectionPool:
+    """Redis connection pool shared by all connections in this process.
+
+    The pool is created on first use.  After a fork, the pool discards the
+    parent's connections and the child opens its own.  When all connections
+    are in use, clients wait up to ``ENV.REDIS_POOL_TIMEOUT`` seconds for one
+    to be returned.
+
+    """
+
+    global _connection_pool
+
+    with _connection_pool_lock:
+        if _connection_pool is None:
+            _connection_pool = BlockingConnectionPool(
+                host=ENV.REDIS_HOST,
+                port=ENV.REDIS_PORT,
+                encoding="utf-8",
+                max_connections=ENV.REDIS_MAX_CONNECTIONS,
+                timeout=ENV.REDIS_POOL_TIMEOUT,
+            )
+
+    return _connection_pool
+
+
+def connection_pool_status() -> dict[str, int]:
+    """Summary of the Redis connection pool for this process.
+
+
+    Returns
+    -------
+    status : dict
+        - max_connections: the maximum number of connections
+        - created: number of open connections
+        - in_use: number of connections currently in use
+
+    """
+
+    pool: BlockingConnectionPool = connection_pool()
+    with pool._lock:
+        created: int = len(pool._connections)
+        available: int = len(
+            [connection for connection in pool.pool.queue if connection is not None]
+        )
+
+    return {
+        "max_connections": pool.max_connections,
+        "created": created,
+        "in_use": created - available,
+    }
+
 
 class RedisConnection(StrictRedis):
-    """Connect to Redis."""
+    """Connect to Redis.
+
+    All instances share one connection pool, see `connection_pool`.
+
+    """
 
     def __init__(self):
         # note: rq is incompatible with decode_responses=True
+        super().__init__(connection_pool=connection_pool())
+
+
+class AsyncRedisConnection(redis.asyncio.StrictRedis):
+    """Connect to Redis with asyncio.
+
+    asyncio connections are bound to an event loop, so they are not shared
+    with `RedisConnection`.  Close the connection with ``aclose()``.
+
+    """
+
+    def __init__(self):
         super().__init__(
             host=ENV.REDIS_HOST,
             port=ENV.REDIS_PORT,
-            charset="utf-8",
+            encoding="utf-8",
+            max_connections=ENV.REDIS_MAX_CONNECTIONS,
         )
 
 
+# queue priorities, in the order that workers drain them
+PRIORITIES: tuple[str, ...] = ("high", "normal", "low")
+
+
+def queue_priority(cost: float) -> str:
+    """Queue priority for a job with this estimated cost, seconds."""
+
+    if cost <= ENV.REDIS_JOBS_HIGH_PRIORITY_COST:
+        return "high"
+    if cost >= ENV.REDIS_JOBS_LOW_PRIORITY_COST:
+        return "low"
+    return "normal"
+
+
+# rq job statuses of jobs that will run, or are running; deferred jobs are not
+# included, they only run after other jobs
+_RQ_ACTIVE: tuple[str, ...] = (
+    JobStatus.CREATED.value,
+    JobStatus.QUEUED.value,
+    JobStatus.SCHEDULED.value,
+    JobStatus.STARTED.value,
+)
+
+# rq job IDs of CATCH jobs: "{catch job ID (hex)}-{part}"
+_RQ_JOB_PART: re.Pattern = re.compile("[A-Za-z0-9_]+")
+_RQ_JOB_ID: re.Pattern = re.compile("([0-9a-f]{32})-([A-Za-z0-9_]+)")
+
+
+def rq_job_id(job_id: UUID, part: str) -> str:
+    """rq job ID for a part of a CATCH job.
+
+
+    Parameters
+    ----------
+    job_id : UUID
+        CATCH job ID.
+
+    part : str
+        Name of the part, e.g., a source or "finalize".  Letters, numbers, and
+        underscores only.
+
+    """
+
+    if _RQ_JOB_PART.fullmatch(part) is None:
+        raise ValueError(f"Invalid job part: {part}")
+
+    return f"{job_id.hex}-{part}"
+
+
+def catch_job_id(job_id: str) -> str:
+    """CATCH job ID (hex) of an rq job.
+
+    rq job IDs that are not formatted by `rq_job_id` are considered to be
+    CATCH jobs of their own.
+
+    """
+
+    match: re.Match | None = _RQ_JOB_ID.fullmatch(job_id)
+    return job_id if match is None else match.group(1)
+
+
 class JobsQueue(Queue):
     """Jobs queue.
 
+    Jobs are queued by priority (see `PRIORITIES`), and workers drain the
+    queues in that order.  Queue-wide properties (e.g., `catch_job_ids`, `full`)
+    consider all priorities, in that order.
+
     Examples
     --------
     >>> queue = JobsQueue()
-    >>> print(len(queue.jobs), 'jobs queued')
+    >>> print(len(queue.catch_job_ids), 'CATCH jobs queued')
     >>> print('Queue filled?', queue.full)
-    >>> queue.enqueue(func, *args)
+    >>> print('Position of my job:', queue.position(job_id))
+    >>> JobsQueue(queue_priority(cost)).enqueue(func, *args)
+
+    A CATCH job may be split into several rq jobs.  The rq job IDs are prefixed
+    with the CATCH job ID, e.g., "{catch_job_id.hex}-{source}", see `rq_job_id`.
+
+    The estimated work of queued and running CATCH jobs is tracked separately,
+    see `add_work`.
+
+
+    Parameters
+    ----------
+    priority : str, optional
+        Queue priority, one of `PRIORITIES`.
+
+    connection : StrictRedis, optional
+        Redis connection.  Default is a new `RedisConnection`.
 
     """
 
-    def __init__(self):
+    def __init__(self, priority: str = "normal", connection: StrictRedis | None = None):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Invalid priority: {priority}")
+
+        # the normal priority queue keeps the original queue name
+        name: str = ENV.REDIS_JOBS
+        if priority != "normal":
+            name = f"{ENV.REDIS_JOBS}-{priority}"
+
         super().__init__(
-            ENV.REDIS_JOBS,
-            connection=RedisConnection(),
+            name, connection=RedisConnection() if connection is None else connection
         )
+        self.priority: str = priority
+
+    @property
+    def queues(self) -> list["JobsQueue"]:
+        """The queues of all priorities, in priority order."""
+        return [
+            (
+                self
+                if priority == self.priority
+                else type(self)(priority, connection=self.connection)
+            )
+            for priority in PRIORITIES
+        ]
+
+    def _all_job_ids(self) -> list[str]:
+        """rq job IDs of all queues, in priority and queue order."""
+        pipeline = self.connection.pipeline(transaction=False)
+        for queue in self.queues:
+            pipeline.lrange(queue.key, 0, -1)
+        return [as_text(job_id) for job_ids in pipeline.execute() for job_id in job_ids]
+
+    @property
+    def catch_job_ids(self) -> list[str]:
+        """Queued CATCH job IDs (hex), in priority and queue order."""
+        return list(
+            dict.fromkeys([catch_job_id(job_id) for job_id in self._all_job_ids()])
+        )
+
+    @property
+    def full(self) -> bool:
+        """``True`` if no more jobs are accepted, see `accepts`."""
+        return not self.accepts(0)
+
+    def accepts(self, cost: float) -> bool:
+        """Test if a new job with this estimated cost is accepted.
+
+        The number of queued CATCH jobs is limited to
+        ``ENV.REDIS_JOBS_MAX_QUEUE_SIZE``, and the estimated work of queued and
+        running jobs to ``ENV.REDIS_JOBS_MAX_QUEUE_WORK`` seconds.  A job is
+        always accepted if there is no other work, whatever its cost.
+
+        """
+
+        if len(self.catch_job_ids) >= ENV.REDIS_JOBS_MAX_QUEUE_SIZE:
+            return False
+
+        pending: float = self.pending_work
+        return pending == 0 or pending + cost < ENV.REDIS_JOBS_MAX_QUEUE_WORK
+
+    @property
+    def _work_key(self) -> str:
+        return f"{ENV.REDIS_JOBS}:work"
+
+    def work(self) -> dict[str, dict[str, Any]]:
+        """Estimated work of queued and running CATCH jobs.
+
+        An entry is abandoned when none of its rq jobs are queued or running,
+        e.g., a worker was killed before `remove_work` was called.  Deferred
+        jobs are not considered: they depend on the entry's other jobs, and
+        will not run if those were lost.  Abandoned entries are removed.  The
+        rq job statuses are fetched with a single pipelined request.
+
+
+        Returns
+        -------
+        work : dict
+            Keyed by CATCH job ID (hex):
+            - cost: estimated cost, seconds
+            - client: client identifier, or ``None``
+            - time: time the job was added (UNIX time)
+            - jobs: rq job IDs
+
+        """
+
+        entries: dict[str, dict[str, Any]] = {
+            as_text(job_id): json.loads(value)
+            for job_id, value in self.connection.hgetall(self._work_key).items()
+        }
+
+        active: list[bool] = self.active(
+            [rq_id for entry in entries.values() for rq_id in entry.get("jobs", [])]
+        )
+
+        work: dict[str, dict[str, Any]] = {}
+        abandoned: list[str] = []
+        i: int = 0
+        for job_id, entry in entries.items():
+            n: int = len(entry.get("jobs", []))
+            if any(active[i : i + n]):
+                work[job_id] = entry
+            else:
+                abandoned.append(job_id)
+            i += n
+
+        if len(abandoned) > 0:
+            self.connection.hdel(self._work_key, *abandoned)
+
+        return work
+
+    def active(self, rq_ids: list[str]) -> list[bool]:
+        """Test if rq jobs are queued or running.
+
+        Deferred jobs are not active, nor are missing jobs, which have expired
+        or were deleted.  The statuses are fetched with a single pipelined
+        request.
+
+        """
+
+        pipeline = self.connection.pipeline(transaction=False)
+        for rq_id in rq_ids:
+            pipeline.hget(self.job_class.key_for(rq_id), "status")
+
+        return [
+            status is not None and as_text(status) in _RQ_ACTIVE
+            for status in pipeline.execute()
+        ]
 
     @property
-    def full(self):
-        return len(self) >= ENV.REDIS_JOBS_MAX_QUEUE_SIZE
+    def pending_work(self) -> float:
+        """Total estimated cost of queued and running CATCH jobs, seconds."""
+        return sum([entry["cost"] for entry in self.work().values()])
+
+    def client_jobs(self, client: str) -> int:
+        """Number of queued and running CATCH jobs for this client."""
+        return len(
+            [entry for entry in self.work().values() if entry["client"] == client]
+        )
+
+    def cost(self, job_id: UUID) -> float | None:
+        """Estimated cost of a queued or running CATCH job, if known."""
+        value = self.connection.hget(self._work_key, job_id.hex)
+        return None if value is None else json.loads(value)["cost"]
+
+    def add_work(
+        self, job_id: UUID, cost: float, jobs: list[str], client: str | None = None
+    ) -> None:
+        """Track the estimated work of a CATCH job.
+
+        The work is tracked until `remove_work`, or until none of the job's rq
+        jobs will run, see `work`.
+
+
+        Parameters
+        ----------
+        job_id : UUID
+            CATCH job ID.
+
+        cost : float
+            Estimated cost, seconds.
+
+        jobs : list of str
+            The job's rq job IDs.
+
+        client : str, optional
+            Client identifier.
+
+        """
+
+        self.connection.hset(
+            self._work_key,
+            job_id.hex,
+            json.dumps(
+                {"cost": cost, "client": client, "time": time.time(), "jobs": jobs}
+            ),
+        )
+
+    def remove_work(self, job_id: UUID) -> None:
+        """Stop tracking the work of a CATCH job."""
+        self.connection.hdel(self._work_key, job_id.hex)
+
+    def catch_jobs(self) -> list[dict[str, Any]]:
+        """Summarize the queued CATCH jobs.
+
+        The job statuses and enqueue times are fetched with a single pipelined
+        request, rather than loading each job.
+
+
+        Returns
+        -------
+        jobs : list of dict
+            In priority and queue order:
+            - job_id: CATCH job ID (hex)
+            - position: queue position, counted in CATCH jobs
+            - status: status of the CATCH job's first queued rq job
+            - enqueued_at: enqueue time (datetime) or ``None``
+
+        """
+
+        job_ids: list[str] = self._all_job_ids()
+        pipeline = self.connection.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipeline.hmget(self.job_class.key_for(job_id), "status", "enqueued_at")
+
+        jobs: dict[str, dict[str, Any]] = {}
+        for job_id, (status, enqueued_at) in zip(job_ids, pipeline.execute()):
+            catch_id: str = catch_job_id(job_id)
+            if catch_id in jobs or status is None:
+                # already summarized, or the job no longer exists
+                continue
+
+            jobs[catch_id] = {
+                "job_id": catch_id,
+                "position": len(jobs),
+                "status": as_text(status),
+                "enqueued_at": str_to_date(enqueued_at) if enqueued_at else None,
+            }
+
+        return list(jobs.values())
+
+    def position(self, job_id: UUID) -> int | None:
+        """Queue position of a CATCH job, or ``None`` if it is not queued."""
+        try:
+            return self.catch_job_ids.index(job_id.hex)
+        except ValueError:
+            return None
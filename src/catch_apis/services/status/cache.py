@@ -0,0 +1,191 @@
+"""Response cache for the status services.
+
+Survey summaries only change when data are ingested, and query summaries
+change as queries finish, but the status page polls them constantly.  Results
+are cached in this process for ``ENV.STATUS_CACHE_TTL`` seconds.  When
+``ENV.STATUS_CACHE_SHARED`` is true, they are also shared between processes
+via Redis.
+
+Cached results are labeled with an entity tag (a hash of the data) and an
+optional modification time, for conditional requests.
+
+Use `invalidate` to discard results that are known to be out of date, e.g.,
+after a query finishes or new data are ingested.  Invalidation reaches all
+processes: it increments a version counter in Redis (see `invalidation`), and
+cached results made with an older version are discarded.
+
+"""
+
+from typing import Any, Callable, Dict, NamedTuple, Tuple
+from datetime import datetime
+from time import monotonic
+import threading
+import hashlib
+import json
+
+from ...config import get_logger
+from ...config.env import ENV
+from ..queue import RedisConnection
+from .. import invalidation
+
+
+class CachedResult(NamedTuple):
+    data: Any
+    etag: str
+    last_modified: datetime | None
+    version: int | None = None  # invalidation version of the data
+
+
+# keys used by the status services
+KEYS: Tuple[str, ...] = ("sources", "updates", "queries")
+
+# key -> (expiration time (monotonic clock), result)
+_cache: Dict[str, Tuple[float, CachedResult]] = {}
+_cache_lock: threading.Lock = threading.Lock()
+
+
+def _redis_key(key: str) -> str:
+    return f"{ENV.REDIS_JOBS}:status-cache:{key}"
+
+
+def _version_name(key: str) -> str:
+    return f"status-cache:{key}"
+
+
+def _etag(data: Any) -> str:
+    """Hash the serialized data."""
+    serialized: bytes = json.dumps(data, sort_keys=True, default=str).encode()
+    return hashlib.sha1(serialized).hexdigest()
+
+
+def _get_shared(key: str) -> CachedResult | None:
+    try:
+        value = RedisConnection().get(_redis_key(key))
+    except Exception:  # pylint: disable=broad-exception-caught
+        get_logger().exception("Error reading the shared status cache.")
+        return None
+
+    if value is None:
+        return None
+
+    content: Dict[str, Any] = json.loads(value)
+    last_modified: str | None = content["last_modified"]
+    return CachedResult(
+        content["data"],
+        content["etag"],
+        None if last_modified is None else datetime.fromisoformat(last_modified),
+        content.get("version"),
+    )
+
+
+def _set_shared(key: str, result: CachedResult) -> None:
+    value: str = json.dumps(
+        {
+            "data": result.data,
+            "etag": result.etag,
+            "last_modified": (
+                None
+                if result.last_modified is None
+                else result.last_modified.isoformat()
+            ),
+            "version": result.version,
+        },
+        default=str,
+    )
+    try:
+        RedisConnection().set(_redis_key(key), value, ex=ENV.STATUS_CACHE_TTL)
+    except Exception:  # pylint: disable=broad-exception-caught
+        get_logger().exception("Error writing the shared status cache.")
+
+
+def cached_result(
+    key: str,
+    service: Callable[[], Any],
+    last_modified: Callable[[], datetime | None] | None = None,
+) -> CachedResult:
+    """Return a cached service result, or call the service and cache it.
+
+
+    Parameters
+    ----------
+    key : str
+        Cache key.
+
+    service : callable
+        Function that returns the data.
+
+    last_modified : callable, optional
+        Function that returns the data's modification time.
+
+
+    Returns
+    -------
+    result : CachedResult
+
+    Cached results are discarded if they expired, or were invalidated by any
+    process.  If the invalidation version cannot be read, only the expiration
+    time is considered.
+
+    """
+
+    now: float = monotonic()
+    # read before calling the service, so that invalidations while it runs are
+    # not missed
+    version: int | None = invalidation.version(_version_name(key))
+
+    def current(result: CachedResult | None) -> bool:
+        return result is not None and (version is None or result.version == version)
+
+    with _cache_lock:
+        entry: Tuple[float, CachedResult] | None = _cache.get(key)
+    if entry is not None and entry[0] > now and current(entry[1]):
+        return entry[1]
+
+    result: CachedResult | None = None
+    if ENV.STATUS_CACHE_SHARED:
+        result = _get_shared(key)
+        if not current(result):
+            result = None
+
+    if result is None:
+        data: Any = service()
+        result = CachedResult(
+            data,
+            _etag(data),
+            None if last_modified is None else last_modified(),
+            version,
+        )
+        if ENV.STATUS_CACHE_SHARED:
+            _set_shared(key, result)
+
+    with _cache_lock:
+        _cache[key] = (now + ENV.STATUS_CACHE_TTL, result)
+
+    return result
+
+
+def invalidate(*keys: str) -> None:
+    """Discard cached results, in all processes.
+
+
+    Parameters
+    ----------
+    *keys : str
+        Cache keys to discard, see `KEYS`.  If none are given, discard all.
+
+    """
+
+    if len(keys) == 0:
+        keys = KEYS
+
+    invalidation.bump(*[_version_name(key) for key in keys])
+
+    with _cache_lock:
+        for key in keys:
+            _cache.pop(key, None)
+
+    if ENV.STATUS_CACHE_SHARED:
+        try:
+            RedisConnection().delete(*[_redis_key(key) for key in keys])
+        except Exception:  # pylint: disable=broad-exception-caught
+            get_logger().exception("Error invalidating the shared status cache.")
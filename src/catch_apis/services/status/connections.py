@@ -0,0 +1,19 @@
+from ..database_provider import pool_status
+from ..queue import connection_pool_status
+
+
+def connections_service() -> dict[str, dict[str, bool | int | float]]:
+    """Summary of this process's connection pools.
+
+
+    Returns
+    -------
+    status : dict
+        - database: database connection pool summary, see
+          `database_provider.pool_status`
+        - redis: redis connection pool summary, see
+          `queue.connection_pool_status`
+
+    """
+
+    return {"database": pool_status(), "redis": connection_pool_status()}
@@ -4,6 +4,7 @@ from sqlalchemy import func
 from catch.model import CatchQuery, Found
 
 from ..catch_manager import Catch, catch_manager
+from ..query_alias import queries_from_job_id
 
 
 def job_id_service(job_id: UUID) -> tuple[dict, list[dict]]:
@@ -31,7 +32,7 @@ def job_id_service(job_id: UUID) -> tuple[dict, list[dict]]:
 
     catch: Catch
     with catch_manager() as catch:
-        queries = catch.queries_from_job_id(job_id)
+        queries = queries_from_job_id(catch, job_id)
         if len(queries) == 0:
             return {"message": "No jobs found with requested ID"}, []
 
@@ -39,7 +40,7 @@ def job_id_service(job_id: UUID) -> tuple[dict, list[dict]]:
         counts = {}
         counts.update(
             catch.db.session.query(CatchQuery.source, func.count(CatchQuery.source))
-            .filter(CatchQuery.job_id == job_id.hex)
+            .filter(CatchQuery.query_id.in_([query.query_id for query in queries]))
             .join(Found)
             .group_by(CatchQuery.source)
             .all()
@@ -14,24 +14,27 @@ def queue_service() -> dict[str, bool | list[dict[str, str | int]]]:
         - full: True if the queue is full
         - jobs: list of job summaries
             - prefix: job ID prefix
-            - position: queue position
+            - position: queue position, counted in jobs
             - enqueued_at: time the query was added to the queue
             - status: the job's status
 
     """
 
-    jobs = []
     queue = JobsQueue()
-    for job in queue.jobs:
-        catch_job_id = job.args[0]
-
-        jobs.append(
-            {
-                "prefix": catch_job_id.hex[:8],
-                "position": job.get_position(),
-                "enqueued_at": Time(job.enqueued_at).iso,
-                "status": job.get_status(),
-            }
-        )
-
-    return {"depth": ENV.REDIS_JOBS_MAX_QUEUE_SIZE, "full": queue.full, "jobs": jobs}
+    jobs = [
+        {
+            "prefix": job["job_id"][:8],
+            "position": job["position"],
+            "enqueued_at": (
+                None if job["enqueued_at"] is None else Time(job["enqueued_at"]).iso
+            ),
+            "status": job["status"],
+        }
+        for job in queue.catch_jobs()
+    ]
+
+    return {
+        "depth": ENV.REDIS_JOBS_MAX_QUEUE_SIZE,
+        "full": queue.full,
+        "jobs": jobs,
+    }
@@ -1,3 +1,7 @@
+from datetime import datetime, timezone
+
+from astropy.time import Time
+from sqlalchemy import func
 from catch.model import SurveyStats
 
 from ..catch_manager import Catch, catch_manager
@@ -28,3 +32,23 @@ def sources_service() -> list[dict[str, str | int | None]]:
                     }
                 )
     return data
+
+
+def sources_last_updated() -> datetime | None:
+    """Most recent update time of the allowed sources, or ``None`` if unknown."""
+
+    catch: Catch
+    with catch_manager() as catch:
+        updated: str | None = (
+            catch.db.session.query(func.max(SurveyStats.updated))
+            .filter(SurveyStats.source.in_(allowed_sources))
+            .scalar()
+        )
+
+    if updated is None:
+        return None
+
+    try:
+        return Time(updated).to_datetime(timezone=timezone.utc)
+    except ValueError:
+        return None
@@ -1,52 +1,371 @@
-"""Message stream data."""
+"""Message stream data.
 
-from typing import Iterator
+The streams are served with asyncio.  Each process reads the Redis task
+messaging stream with a single task (see `MessageBroadcaster`), and fans out the
+messages to all connected clients through bounded in-memory queues.  Clients
+that do not keep up are disconnected.
+
+Clients may receive all messages (`message_stream_service`), or only those for
+a single job (`job_message_stream_service`).  Job streams first replay the job's
+messages from the Redis stream, so that clients may resume after any message
+still in Redis, then follow the broadcaster.
+
+"""
+
+from typing import Any, AsyncIterator, List, NamedTuple, Set, Tuple
+from collections import deque
+from uuid import UUID
+import asyncio
+import json
 import time
 
 from catch_apis.config.env import ENV
-from .queue import RedisConnection
+from ..config import get_logger
+from .message import TaskStatus
+from .queue import AsyncRedisConnection
 
 
-def message_stream_service(timeout: int = 0) -> Iterator[str]:
-    """Iterator for all CATCH-APIs task messages.
+class StreamMessage(NamedTuple):
+    """Task message read from the Redis stream."""
+
+    id: str  # Redis stream ID
+    data: str
+    job_id: str | None  # job ID, hex format
+    status: str | None
+
+    @classmethod
+    def parse(
+        cls, stream_id: Any, data: str, job_id: str | None = None
+    ) -> "StreamMessage":
+        if isinstance(stream_id, bytes):
+            stream_id = stream_id.decode()
+
+        try:
+            content: dict = json.loads(data)
+        except ValueError:
+            content = {}
+
+        return cls(str(stream_id), data, job_id, content.get("status"))
+
+    @classmethod
+    def read(cls, stream_id: Any, entry: dict) -> "StreamMessage | None":
+        """Parse a Redis stream entry, or ``None`` if it has no data."""
+
+        fields: dict = {
+            (k.decode() if isinstance(k, bytes) else k): (
+                v.decode() if isinstance(v, bytes) else v
+            )
+            for k, v in entry.items()
+        }
+
+        data: str = fields.get("data", "")
+        if data == "":
+            return None
+
+        return cls.parse(stream_id, data, fields.get("job_id"))
 
-    Listens to redis task messaging stream, prints the messages.
+
+def stream_id_key(stream_id: str) -> Tuple[int, int]:
+    """Sort key for a Redis stream ID, e.g., "1700000000000-0".
+
+    Raises ``ValueError`` for invalid IDs.
+
+    """
+
+    ms, _, seq = stream_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class Subscription:
+    """A client's view of the task messaging stream.
 
 
     Parameters
     ----------
-    timeout : int, optional
-        Number of seconds to loop before timing out.  If 0, then only time out
-        after ENV.STREAM_TIMEOUT seconds of continuous keep alive messages.
+    replay : list
+        Messages received before the client subscribed.
+
+    maxsize : int
+        Maximum number of messages waiting for the client.
+
+    job_id : str, optional
+        Only receive messages for this job ID, hex format.
+
+    """
+
+    def __init__(
+        self,
+        replay: List[StreamMessage],
+        maxsize: int,
+        job_id: str | None = None,
+    ) -> None:
+        self.replay: List[StreamMessage] = replay
+        self.job_id: str | None = job_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        # set when the client could not keep up with the stream
+        self.dropped: bool = False
+
+    def wants(self, message: StreamMessage) -> bool:
+        """Test if this message is for this subscriber."""
+        return self.job_id is None or message.job_id == self.job_id
+
+    async def get(self, timeout: float) -> StreamMessage | None:
+        """Next message, or ``None`` if there is none within ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class MessageBroadcaster:
+    """Fan out the task messaging stream to many clients.
+
+    A single task reads the Redis stream, up to ``ENV.STREAM_READ_COUNT``
+    messages at a time, and copies them to each subscriber's queue.  If a
+    subscriber's queue is full, the subscriber is dropped.  The task is
+    started by the first subscriber, and stops when there are none left.
+
+    Subscribers must be in the same event loop.
+
+    Recent messages are kept, so that new subscribers may replay the stream,
+    as clients reading the Redis stream from the beginning would.
 
     """
 
-    redis = RedisConnection()
+    def __init__(self) -> None:
+        self._subscribers: Set[Subscription] = set()
+        self._history: deque[StreamMessage] = deque(
+            maxlen=ENV.REDIS_TASK_MESSAGES_MAX_QUEUE_SIZE
+        )
+        self._task: asyncio.Task | None = None
+        # ID of the last message read from the Redis stream
+        self._last: Any = b"0"
+
+    @property
+    def subscribers(self) -> int:
+        """Number of subscribers."""
+        return len(self._subscribers)
+
+    def subscribe(
+        self, job_id: str | None = None, replay: bool = True
+    ) -> Subscription:
+        """Subscribe to the stream, starting the reader task as needed.
+
+
+        Parameters
+        ----------
+        job_id : str, optional
+            Only receive messages for this job ID, hex format.
+
+        replay : bool, optional
+            Replay the recent messages read by this process.
+
+        """
+
+        subscription: Subscription = Subscription(
+            [], ENV.STREAM_CLIENT_QUEUE_SIZE, job_id=job_id
+        )
+        if replay:
+            subscription.replay = [
+                message for message in self._history if subscription.wants(message)
+            ]
+        self._subscribers.add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Remove a subscriber."""
+        self._subscribers.discard(subscription)
+
+    def _drop(self, subscription: Subscription) -> None:
+        subscription.dropped = True
+        self._subscribers.discard(subscription)
+
+    async def _run(self) -> None:
+        redis = AsyncRedisConnection()
+        try:
+            while len(self._subscribers) > 0:
+                try:
+                    messages = await redis.xread(
+                        {ENV.REDIS_TASK_MESSAGES: self._last},
+                        count=ENV.STREAM_READ_COUNT,
+                        block=1000,
+                    )
+                except Exception:  # pylint: disable=broad-exception-caught
+                    get_logger().exception("Error reading the task messaging stream.")
+                    for subscription in list(self._subscribers):
+                        self._drop(subscription)
+                    return
+
+                for stream_id, content in [
+                    message for stream in messages for message in stream[1]
+                ]:
+                    self._last = stream_id
+                    message: StreamMessage | None = StreamMessage.read(
+                        stream_id, content
+                    )
+                    if message is None:
+                        continue
+
+                    self._history.append(message)
+                    subscription: Subscription
+                    for subscription in list(self._subscribers):
+                        if not subscription.wants(message):
+                            continue
+                        try:
+                            subscription.queue.put_nowait(message)
+                        except asyncio.QueueFull:
+                            self._drop(subscription)
+        finally:
+            await redis.aclose()
+
+
+# shared by all clients in this process
+broadcaster: MessageBroadcaster = MessageBroadcaster()
+
+
+async def _job_history(job_id: str, after: str | None) -> List[StreamMessage]:
+    """A job's messages in the Redis stream, after this stream ID."""
+
+    redis = AsyncRedisConnection()
+    try:
+        entries = await redis.xrange(
+            ENV.REDIS_TASK_MESSAGES, min="-" if after is None else f"({after}"
+        )
+    finally:
+        await redis.aclose()
+
+    messages: List[StreamMessage] = []
+    for stream_id, content in entries:
+        message: StreamMessage | None = StreamMessage.read(stream_id, content)
+        if message is not None and message.job_id == job_id:
+            messages.append(message)
+
+    return messages
+
+
+async def _message_stream(
+    timeout: int, job_id: str | None = None, after: str | None = None
+) -> AsyncIterator[str]:
+    """Subscribe to the stream and format the messages as server-sent events.
+
+    Job streams label the messages with their IDs, replay the job's messages
+    from the Redis stream (after ``after``), and end after the job succeeds or
+    fails.
+
+    """
+
+    job_stream: bool = job_id is not None
+    # subscribe before reading the job's history so that no message is missed;
+    # messages in both are skipped, below
+    subscription: Subscription = broadcaster.subscribe(
+        job_id=job_id, replay=not job_stream
+    )
+    last: Tuple[int, int] | None = None if after is None else stream_id_key(after)
 
-    last = b"0"
     start_time = time.monotonic()
     wait = 3  # seconds between keep alive messages
     count = 0  # number of consecutive keep alive messages
-    while True:
-        message = redis.xread(
-            {ENV.REDIS_TASK_MESSAGES: last}, count=1, block=wait * 1000
-        )
+    terminal: Tuple[str, str] = (TaskStatus.SUCCESS.value, TaskStatus.ERROR.value)
 
-        if timeout > 0 and (time.monotonic() - start_time) > timeout:
-            break
+    def event(message: StreamMessage) -> str:
+        if job_stream:
+            return f"id: {message.id}\ndata: {message.data}\n\n"
+        return f"data: {message.data}\n\n"
 
-        if len(message) == 0:
-            count += 1
-            if count > (ENV.STREAM_TIMEOUT // wait):
-                yield ": timeout\n\n"
+    try:
+        if job_stream:
+            try:
+                subscription.replay = await _job_history(str(job_id), after)
+            except Exception:  # pylint: disable=broad-exception-caught
+                get_logger().exception("Error reading the task messaging stream.")
+                yield ": dropped\n\n"
                 return
+
+            if len(subscription.replay) > 0:
+                last = stream_id_key(subscription.replay[-1].id)
+
+        message: StreamMessage | None
+        for message in subscription.replay:
+            yield event(message)
+            if job_stream and message.status in terminal:
+                return
+
+        while True:
+            if subscription.dropped:
+                yield ": dropped\n\n"
+                return
+
+            if timeout > 0:
+                remaining = timeout - (time.monotonic() - start_time)
+                message = await subscription.get(max(min(wait, remaining), 0))
+                if (time.monotonic() - start_time) > timeout:
+                    break
             else:
-                yield ": stayin' alive\n\n"
-                continue
+                message = await subscription.get(wait)
 
-        last, content = message[0][1][0]
+            if message is None:
+                count += 1
+                if count > (ENV.STREAM_TIMEOUT // wait):
+                    yield ": timeout\n\n"
+                    return
+                else:
+                    yield ": stayin' alive\n\n"
+                    continue
 
-        data = content.get("data", "")
-        if data != "":
             count = 0
-            yield f"data: {data}\n\n"
+            if last is not None and stream_id_key(message.id) <= last:
+                # already replayed
+                continue
+
+            yield event(message)
+            if job_stream and message.status in terminal:
+                return
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+def message_stream_service(timeout: int = 0) -> AsyncIterator[str]:
+    """Iterator for all CATCH-APIs task messages.
+
+    Listens to redis task messaging stream, prints the messages.
+
+
+    Parameters
+    ----------
+    timeout : int, optional
+        Number of seconds to loop before timing out.  If 0, then only time out
+        after ENV.STREAM_TIMEOUT seconds of continuous keep alive messages.
+
+    """
+
+    return _message_stream(timeout)
+
+
+def job_message_stream_service(
+    job_id: UUID, last_event_id: str | None = None, timeout: int = 0
+) -> AsyncIterator[str]:
+    """Iterator for the task messages of a single job.
+
+    Each message is labeled with its Redis stream ID, and the stream ends after
+    the job succeeds or fails.
+
+
+    Parameters
+    ----------
+    job_id : UUID
+        Unique job ID.
+
+    last_event_id : str, optional
+        Resume the stream after this message ID.  The ID must be valid, see
+        `stream_id_key`.  Messages are replayed from the Redis stream, so any
+        process may resume the stream.
+
+    timeout : int, optional
+        See `message_stream_service`.
+
+    """
+
+    return _message_stream(timeout, job_id=job_id.hex, after=last_event_id)
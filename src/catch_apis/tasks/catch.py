@@ -1,13 +1,16 @@
-from typing import Union, List
+from typing import Dict, Union, List, Tuple
 import uuid
 import logging
-from time import monotonic
 
 from astropy.time import Time
 from sbsearch.exceptions import SBSException
 from catch.exceptions import CatchException
+from catch.model import CatchQuery
 
 from ..services.catch_manager import catch_manager
+from ..services.status.cache import invalidate
+from ..services.queue import JobsQueue
+from ..services import inflight, invalidation
 from ..services.message import (
     Message,
     listen_for_task_messages,
@@ -26,6 +29,8 @@ def catch_task(
     uncertainty_ellipse: bool,
     padding: float,
     cached: bool,
+    finalize: bool = True,
+    started: Union[float, None] = None,
 ) -> None:
     """Search for target in CATCH surveys.
 
@@ -56,6 +61,16 @@ def catch_task(
     cached : bool
         ``True`` if it is OK to return cached results.
 
+    finalize : bool, optional
+        Publish the final task status.  Set to ``False`` when this task is one
+        part of a larger job, in which case `catch_finalize_task` publishes the
+        final status.
+
+    started : float, optional
+        UNIX time that the job started, the reference time for the elapsed
+        time of the task messages.  Set this when the task is one part of a
+        larger job.  Otherwise, the task's start time is used.
+
     """
 
     logger: logging.Logger = get_logger()
@@ -63,14 +78,15 @@ def catch_task(
     # subscribe the logger and task messenger to this job_id
     listen_for_task_messages(job_id)
 
-    Message.t0 = monotonic()
-    msg: Message = Message(
-        job_id, status=TaskStatus.RUNNING, text="Starting moving target query."
-    )
-    msg.publish()
-
+    Message.reset_t0(started)
     _sources: List[str] = allowed_sources if sources is None else sources
 
+    text: str = "Starting moving target query."
+    if not finalize:
+        text = f"Starting moving target query of {', '.join(_sources)}."
+    msg: Message = Message(job_id, status=TaskStatus.RUNNING, text=text)
+    msg.publish()
+
     exc: Exception
     try:
         with catch_manager() as catch:
@@ -80,15 +96,149 @@ def catch_task(
             catch.padding = padding
             catch.query(target, job_id, sources=_sources, cached=cached)
 
-        msg: Message = Message(job_id, status=TaskStatus.SUCCESS, text="Task complete.")
+        if finalize:
+            msg: Message = Message(
+                job_id, status=TaskStatus.SUCCESS, text="Task complete."
+            )
+        else:
+            msg: Message = Message(
+                job_id,
+                status=TaskStatus.RUNNING,
+                text=f"Finished query of {', '.join(_sources)}.",
+            )
     except (CatchException, SBSException) as exc:  # noqa: F841
         logger.exception("catch error.")
-        msg.status = TaskStatus.ERROR
+        msg.status = TaskStatus.ERROR if finalize else TaskStatus.RUNNING
         msg.text = str(exc)
     except Exception:
         logger.exception("An unexpected error occurred.")
-        msg.status = TaskStatus.ERROR
+        msg.status = TaskStatus.ERROR if finalize else TaskStatus.RUNNING
         msg.text = "An unexpected error occurred.  Contact us if this problem persists."
     finally:
+        # cache misses of this query are out of date
+        invalidation.bump(invalidation.QUERIES)
+        if finalize:
+            # the recent queries summary is out of date
+            invalidate("queries")
         msg.publish()
         stop_listening_for_task_messages(job_id)
+
+
+def catch_finalize_task(
+    job_id: uuid.UUID,
+    sources: List[str],
+    inflight_key: Union[str, None] = None,
+    started: Union[float, None] = None,
+) -> None:
+    """Publish the final status of a job split into several tasks.
+
+    Runs after all of the job's tasks have completed, successfully or not.
+
+
+    Parameters
+    ----------
+    job_id : uuid.UUID
+        Unique ID for job.
+
+    sources : list of str
+        The sources searched by the job's tasks.
+
+    inflight_key : str, optional
+        Release this query claim, see `services.inflight`.
+
+    started : float, optional
+        See `catch_task`.
+
+    """
+
+    logger: logging.Logger = get_logger()
+
+    Message.reset_t0(started)
+    msg: Message = Message(job_id, status=TaskStatus.SUCCESS, text="Task complete.")
+    try:
+        with catch_manager() as catch:
+            status: Dict[str, str] = {
+                query.source: query.status
+                for query in catch.queries_from_job_id(job_id)
+            }
+
+        failed: List[str] = [
+            source for source in sources if status.get(source) != "finished"
+        ]
+        if len(failed) > 0:
+            msg.status = TaskStatus.ERROR
+            msg.text = f"Query failed for {', '.join(failed)}."
+    except Exception:
+        logger.exception("An unexpected error occurred.")
+        msg.status = TaskStatus.ERROR
+        msg.text = "An unexpected error occurred.  Contact us if this problem persists."
+    finally:
+        # the recent queries summary is out of date
+        invalidate("queries")
+        try:
+            inflight.release(inflight_key, job_id)
+            JobsQueue().remove_work(job_id)
+        except Exception:
+            logger.exception("Error releasing the query claim or queued work.")
+        msg.publish()
+
+
+def catch_batch_finalize_task(
+    batch_id: uuid.UUID,
+    jobs: List[Tuple[uuid.UUID, str, List[str]]],
+    started: Union[float, None] = None,
+) -> None:
+    """Publish the final status of a batch of moving target queries.
+
+    Each target is searched by its own tasks (see `catch_task` and
+    `catch_finalize_task`), which publish its progress with its own job ID.
+    This task runs after all targets have completed, successfully or not, and
+    publishes the batch's status with the batch ID.
+
+
+    Parameters
+    ----------
+    batch_id : uuid.UUID
+        Unique ID for the batch.
+
+    jobs : list of tuple
+        The job ID, target, and sources to search for each target.
+
+    started : float, optional
+        See `catch_task`.
+
+    """
+
+    logger: logging.Logger = get_logger()
+
+    Message.reset_t0(started)
+    msg: Message = Message(batch_id, status=TaskStatus.SUCCESS, text="Batch complete.")
+    try:
+        # a job failed if any of its sources were not searched
+        finished: Dict[str, List[bool]] = {job[0].hex: [] for job in jobs}
+        with catch_manager() as catch:
+            for job_id, status in catch.db.session.query(
+                CatchQuery.job_id, CatchQuery.status
+            ).filter(CatchQuery.job_id.in_(list(finished))):
+                finished[job_id].append(status == "finished")
+
+        failed: int = len(
+            [
+                job_id
+                for job_id, _, sources in jobs
+                if finished[job_id.hex].count(True) < len(sources)
+            ]
+        )
+
+        if failed > 0:
+            msg.text = f"Batch complete, {failed} of {len(jobs)} queries failed."
+    except Exception:
+        logger.exception("An unexpected error occurred.")
+        msg.status = TaskStatus.ERROR
+        msg.text = "An unexpected error occurred.  Contact us if this problem persists."
+    finally:
+        try:
+            JobsQueue().remove_work(batch_id)
+        except Exception:
+            logger.exception("Error releasing the queued work.")
+        msg.publish()
@@ -0,0 +1,220 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+import uuid
+import logging
+
+import astropy.units as u
+from astropy.time import Time
+from astropy.coordinates import Angle
+from sbsearch.exceptions import SBSException
+from catch.exceptions import CatchException
+
+from ..services.fixed import (
+    store_fixed_results,
+    store_fixed_batch_results,
+    save_fixed_results,
+    save_fixed_batch_results,
+)
+from ..services.filters import Filters
+from ..services.queue import JobsQueue
+from ..services.message import (
+    Message,
+    listen_for_task_messages,
+    stop_listening_for_task_messages,
+    TaskStatus,
+)
+from ..config import CatchApisException, get_logger
+
+
+def fixed_task(
+    job_id: uuid.UUID,
+    ra: float,
+    dec: float,
+    sources: Union[List[str], None],
+    start_date: Union[str, None],
+    stop_date: Union[str, None],
+    radius: float,
+    intersection_type: str,
+    query: Dict[str, Any],
+    filters: Optional[Filters] = None,
+    fields: Optional[List[str]] = None,
+) -> None:
+    """Search for a fixed target in CATCH surveys, and store the results.
+
+
+    Parameters
+    ----------
+    job_id : uuid.UUID
+        Unique ID for job.
+
+    ra, dec : float
+        Coordinates of the target, degrees.
+
+    sources : list of str
+        Search these sources, or, if ``None``, all sources.
+
+    start_date : str or None
+        Search after this date/time.
+
+    stop_date : str or None
+        Search before this date/time.
+
+    radius: float
+        Areal search around the coordinates, arcmin.
+
+    intersection_type : str
+        Type of intersections to allow between search area and data.
+
+    query : dict
+        The query parameters, stored with the results.
+
+    filters : dict, optional
+        Only store observations with quantities in these ranges, see
+        `services.filters.from_parameters`.
+
+    fields : list of str, optional
+        Only return these fields of the stored observations, see
+        `services.marshal.observations`.
+
+    """
+
+    logger: logging.Logger = get_logger()
+
+    # subscribe the logger and task messenger to this job_id
+    listen_for_task_messages(job_id)
+
+    Message.reset_t0()
+    msg: Message = Message(
+        job_id, status=TaskStatus.RUNNING, text="Starting fixed target query."
+    )
+    msg.publish()
+
+    count: int = 0
+    try:
+        count = store_fixed_results(
+            job_id,
+            Angle(ra, u.deg),
+            Angle(dec, u.deg),
+            sources,
+            None if start_date is None else Time(start_date),
+            None if stop_date is None else Time(stop_date),
+            radius,
+            intersection_type,
+            filters=filters,
+        )
+        msg = Message(job_id, status=TaskStatus.SUCCESS, text="Task complete.")
+    except (CatchApisException, CatchException, SBSException) as exc:
+        logger.exception("catch error.")
+        msg.status = TaskStatus.ERROR
+        msg.text = str(exc)
+    except Exception:
+        logger.exception("An unexpected error occurred.")
+        msg.status = TaskStatus.ERROR
+        msg.text = "An unexpected error occurred.  Contact us if this problem persists."
+    finally:
+        try:
+            save_fixed_results(
+                job_id,
+                query,
+                "finished" if msg.status == TaskStatus.SUCCESS else "errored",
+                "" if msg.status == TaskStatus.SUCCESS else msg.text,
+                count,
+                ra,
+                dec,
+                fields=fields,
+            )
+        except Exception:
+            logger.exception("Error saving the fixed target query results.")
+            msg.status = TaskStatus.ERROR
+            msg.text = "Error saving the query results."
+
+        try:
+            JobsQueue().remove_work(job_id)
+        except Exception:
+            logger.exception("Error releasing the queued work.")
+
+        msg.publish()
+        stop_listening_for_task_messages(job_id)
+
+
+def fixed_batch_task(
+    job_id: uuid.UUID,
+    positions: List[Tuple[float, float, float]],
+    sources: Union[List[str], None],
+    start_date: Union[str, None],
+    stop_date: Union[str, None],
+    intersection_type: str,
+    query: Dict[str, Any],
+) -> None:
+    """Search for many fixed targets in CATCH surveys, and store the results.
+
+
+    Parameters
+    ----------
+    job_id : uuid.UUID
+        Unique ID for job.
+
+    positions : list of tuple
+        The right ascension and declination (degrees), and search radius
+        (arcmin) of each target.
+
+    sources, start_date, stop_date, intersection_type, query
+        See `fixed_task`.
+
+    """
+
+    logger: logging.Logger = get_logger()
+
+    # subscribe the logger and task messenger to this job_id
+    listen_for_task_messages(job_id)
+
+    Message.reset_t0()
+    msg: Message = Message(
+        job_id,
+        status=TaskStatus.RUNNING,
+        text=f"Starting batch of {len(positions)} fixed target queries.",
+    )
+    msg.publish()
+
+    results: List[Dict[str, Any]] = []
+    try:
+        results = store_fixed_batch_results(
+            job_id,
+            [
+                (Angle(ra, u.deg), Angle(dec, u.deg), radius)
+                for ra, dec, radius in positions
+            ],
+            sources,
+            None if start_date is None else Time(start_date),
+            None if stop_date is None else Time(stop_date),
+            intersection_type,
+        )
+        msg = Message(job_id, status=TaskStatus.SUCCESS, text="Batch complete.")
+    except (CatchApisException, CatchException, SBSException) as exc:
+        logger.exception("catch error.")
+        msg.status = TaskStatus.ERROR
+        msg.text = str(exc)
+    except Exception:
+        logger.exception("An unexpected error occurred.")
+        msg.status = TaskStatus.ERROR
+        msg.text = "An unexpected error occurred.  Contact us if this problem persists."
+    finally:
+        try:
+            save_fixed_batch_results(
+                job_id,
+                query,
+                "finished" if msg.status == TaskStatus.SUCCESS else "errored",
+                "" if msg.status == TaskStatus.SUCCESS else msg.text,
+                results,
+            )
+        except Exception:
+            logger.exception("Error saving the fixed target query results.")
+            msg.status = TaskStatus.ERROR
+            msg.text = "Error saving the query results."
+
+        try:
+            JobsQueue().remove_work(job_id)
+        except Exception:
+            logger.exception("Error releasing the queued work.")
+
+        msg.publish()
+        stop_listening_for_task_messages(job_id)
@@ -1,18 +1,100 @@
 """
-Script to launch a new rq worker listening to JOBS queue.
+Script to launch a new rq worker listening to the JOBS queues.
+
+The worker drains the queues in priority order.
+
+By default, each job runs in a new work horse process forked from the worker.
+With ``ENV.WORQER_WARM``, jobs run in the worker process itself (see
+`WarmWoRQer`), which keeps the CATCH library instance, database connections,
+and imported modules between jobs.  Warm woRQers restart themselves after
+``ENV.WORQER_MAX_JOBS`` jobs, or when their memory use exceeds
+``ENV.WORQER_MAX_RSS`` MB.
+
+With ``ENV.EPHEMERIS_CACHE``, target ephemerides are shared between woRQers,
+see `services.ephemeris`.
 """
 
-from rq import Worker as WoRQer
+import os
+import sys
+import resource
+
+from rq import Worker as WoRQer, SimpleWorker
+
+from .config import get_logger
+from .config.env import ENV
+from .services.queue import JobsQueue, PRIORITIES
+from .services.catch_manager import keep_warm, release_warm
+from .services import ephemeris
+
+
+def max_rss() -> float:
+    """Peak memory use (resident set size) of this process, MB."""
+
+    rss: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return rss / 1024**2 if sys.platform == "darwin" else rss / 1024
+
+
+class WarmWoRQer(SimpleWorker):
+    """Run jobs in the worker process, keeping the CATCH library warm.
+
+    After each job, the worker stops to be restarted (see `recycle`) if it has
+    run ``ENV.WORQER_MAX_JOBS`` jobs, or if its peak memory use exceeds
+    ``ENV.WORQER_MAX_RSS`` MB.  Either limit is disabled with 0.
+
+    """
+
+    # number of jobs run by this worker
+    jobs_run: int = 0
+
+    # set when the worker stopped to be restarted
+    recycle: bool = False
+
+    def execute_job(self, job, queue):
+        try:
+            return super().execute_job(job, queue)
+        finally:
+            self.jobs_run += 1
+            rss: float = max_rss()
+            reason: str | None = None
+            if ENV.WORQER_MAX_JOBS > 0 and self.jobs_run >= ENV.WORQER_MAX_JOBS:
+                reason = f"woRQer ran {self.jobs_run} jobs"
+            elif ENV.WORQER_MAX_RSS > 0 and rss > ENV.WORQER_MAX_RSS:
+                reason = f"woRQer peak memory use {rss:.0f} MB exceeds the limit"
+
+            if reason is not None:
+                get_logger().info("%s, restarting.", reason)
+                self.recycle = True
+                self._stop_requested = True
+
+
+def run(burst: bool = False) -> bool:
+    """Set burst to True and the worker will quit when the queue is empty.
+
+    Returns ``True`` if a warm worker stopped to be restarted.
+
+    """
+
+    if ENV.EPHEMERIS_CACHE:
+        ephemeris.install()
 
-from .services.queue import JobsQueue
+    queues = [JobsQueue(priority) for priority in PRIORITIES]
+    if not ENV.WORQER_WARM:
+        woRQer = WoRQer(queues, worker_ttl=1000)
+        woRQer.work(burst=burst)
+        return False
 
+    keep_warm()
+    woRQer = WarmWoRQer(queues, worker_ttl=1000)
+    try:
+        woRQer.work(burst=burst)
+    finally:
+        release_warm()
 
-def run(burst: bool = False):
-    """Set burst to True and the worker will quit when the queue is empty."""
-    queue = JobsQueue()
-    woRQer = WoRQer(queue, worker_ttl=1000)
-    woRQer.work(burst=burst)
+    return woRQer.recycle
 
 
 if __name__ == "__main__":
-    run()
+    if run():
+        # start over in a new process image to release memory
+        os.execv(sys.executable, [sys.executable, "-m", "catch_apis.woRQer"])
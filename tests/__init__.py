@@ -4,6 +4,10 @@ import pytest
 from importlib import reload
 from urllib.parse import urlparse
 from collections import defaultdict
+import asyncio
+
+import fakeredis
+from rq.utils import now, utcformat
 
 import testing.postgresql
 from starlette.testclient import TestClient
@@ -46,6 +50,8 @@ ENV.update(
     }
 )
 
+from catch_apis.services.queue import JobsQueue  # noqa: E402
+
 # test survey parameters
 SURVEY_START: float = 56000.0
 EXPTIME: float = 30 / 86400
@@ -90,7 +96,20 @@ Postgresql = testing.postgresql.PostgresqlFactory(
 def fixture_test_client():
     # deferred imports so that the testing environment is up to date
     import catch_apis.app
+    import catch_apis.services.catch
+    import catch_apis.services.cost
     import catch_apis.services.database_provider
+    import catch_apis.services.fixed_cache
+    import catch_apis.services.query_alias
+    import catch_apis.services.status.cache
+
+    # forget cache misses, cost estimates, cached responses and searches, and
+    # database state from other tests
+    catch_apis.services.catch._uncached.clear()
+    catch_apis.services.cost._reference.clear()
+    catch_apis.services.fixed_cache.clear()
+    catch_apis.services.query_alias._tables_created.clear()
+    catch_apis.services.status.cache.invalidate()
 
     with Postgresql() as postgresql:
         url = urlparse(postgresql.url())
@@ -106,48 +125,128 @@ def fixture_test_client():
 
         yield TestClient(catch_apis.app.app)
 
+        # close pooled connections before the database is shut down
+        catch_apis.services.database_provider.db_engine.dispose()
+
 
 class MockedJob:
-    def __init__(self, f, args, position):
+    def __init__(self, f, args, id=None, depends_on=None, kwargs=None):
         self.f = f
         self.args = args
-        self.position = position
-        self.enqueued_at = Time.now().iso
+        self.kwargs = {} if kwargs is None else kwargs
+        self.id = id
+        self.depends_on = depends_on
 
-    def get_position(self):
-        return self.position
 
-    def get_status(self):
-        return "queued"
+class MockedJobsQueue(JobsQueue):
+    """Jobs queue with a fake Redis server.
 
+    Enqueued jobs are recorded, rather than serialized, so that tests may run
+    them.  Their queue state is written to Redis as rq would, so that the
+    `JobsQueue` methods are tested as they are.  All priorities share the
+    recorded jobs.
 
-class MockedJobsQueue:
-    def __init__(self, *args, **kwargs):
-        self.jobs = []
+    """
+
+    server = fakeredis.FakeServer()
+    jobs = []
+    deferred_jobs = []
+
+    def __init__(self, priority="normal", connection=None):
+        super().__init__(
+            priority, connection=fakeredis.FakeStrictRedis(server=self.server)
+        )
+
+    @classmethod
+    def reset(cls, monkeypatch):
+        monkeypatch.setattr(cls, "server", fakeredis.FakeServer())
+        monkeypatch.setattr(cls, "jobs", [])
+        monkeypatch.setattr(cls, "deferred_jobs", [])
 
     @property
-    def full(self):
-        return len(self.jobs) >= ENV.REDIS_JOBS_MAX_QUEUE_SIZE
+    def job_ids(self):
+        return [job.id for job in self.jobs]
+
+    def enqueue(self, f, args=None, kwargs=None, job_id=None, depends_on=None, **_):
+        job = MockedJob(f, args, id=job_id, depends_on=depends_on, kwargs=kwargs)
+
+        # jobs with dependencies wait outside of the queue
+        if job.depends_on is None:
+            self.jobs.append(job)
+            self.connection.rpush(self.key, job_id)
+        else:
+            self.deferred_jobs.append(job)
+
+        self.connection.hset(
+            self.job_class.key_for(job_id),
+            mapping={
+                "status": "queued" if job.depends_on is None else "deferred",
+                "enqueued_at": utcformat(now()),
+            },
+        )
 
-    def enqueue(self, **kwargs):
-        self.jobs.append(MockedJob(kwargs["f"], kwargs["args"], len(self.jobs)))
+        return job
 
 
 class MockedRedisConnection:
     def __init__(self, *args, **kwargs):
         self.items = defaultdict(list)
+        self.ids = defaultdict(list)
+        self.values = {}
+        self.count = 0
         self.last = None
 
+    def set(self, name, value, nx=False, **kwargs):
+        if nx and name in self.values:
+            return None
+        self.values[name] = value
+        return True
+
+    def get(self, name):
+        return self.values.get(name)
+
+    def delete(self, *names):
+        return len([self.values.pop(name) for name in names if name in self.values])
+
+    def incr(self, name):
+        self.values[name] = int(self.values.get(name, 0)) + 1
+        return self.values[name]
+
     def xadd(self, name, data, **kwargs):
+        self.count += 1
         self.items[name].append(data)
-
-    def xread(self, streams, **kwargs):
-        # very sloppy, but getting accurate and precise is not important for our
-        # testing
-        name = list(streams.keys())[0]
-        if len(self.items[name]) == 0:
+        self.ids[name].append(f"{self.count}-0".encode())
+
+    def pipeline(self, *args, **kwargs):
+        # commands are executed immediately
+        return self
+
+    def execute(self):
+        pass
+
+    def _entries(self, name, after, inclusive=False):
+        # stream IDs are "{count}-0"
+        after = int(after.decode() if isinstance(after, bytes) else after)
+        return [
+            (stream_id, item)
+            for stream_id, item in zip(self.ids[name], self.items[name])
+            if int(stream_id.decode().split("-")[0]) > after - int(inclusive)
+        ]
+
+    def xread(self, streams, count=None, **kwargs):
+        name, last = list(streams.items())[0]
+        if isinstance(last, bytes):
+            last = last.decode()
+        entries = self._entries(name, last.split("-")[0])[:count]
+        if len(entries) == 0:
             return []
-        return [[b"0", [(b"1", self.items[name].pop(0))]]]
+        return [[name.encode(), entries]]
+
+    def xrange(self, name, min="-", max="+", **kwargs):
+        if min == "-":
+            return self._entries(name, 0)
+        inclusive = not min.startswith("(")
+        return self._entries(name, min.strip("(").split("-")[0], inclusive)
 
     def llen(self, name, *args, **kwargs):
         return len(self.items[name])
@@ -160,24 +259,90 @@ class MockedRedisConnection:
             break
 
 
+class LocalEphemeris:
+    """Offline stand-in for the Horizons ephemeris generator.
+
+    The target moves 1 deg/day in RA along the equator.
+
+    """
+
+    calls = 0
+
+    @classmethod
+    def target_over_date_range(
+        cls, observer, target, start, stop, step=None, cache=False
+    ):
+        cls.calls += 1
+        mjd = np.arange(start.mjd, stop.mjd + 1)
+        return [{"mjd": t, "ra": (t - start.mjd) % 360, "dec": 0.0} for t in mjd]
+
+
+class MockedAsyncRedisConnection:
+    def __init__(self, redis_connection):
+        self.redis_connection = redis_connection
+
+    async def xread(self, streams, **kwargs):
+        messages = self.redis_connection.xread(streams)
+        if len(messages) == 0:
+            # briefly block, as redis would
+            await asyncio.sleep(min(kwargs.get("block", 0), 100) / 1000)
+        return messages
+
+    async def xrange(self, name, **kwargs):
+        return self.redis_connection.xrange(name, **kwargs)
+
+    async def aclose(self):
+        pass
+
+
 @pytest.fixture
 def mock_redis(monkeypatch):
     """Mocked classes to avoid any interaction with redis."""
 
+    import catch_apis.api.catch
+    import catch_apis.api.fixed
+    import catch_apis.services.batch
     import catch_apis.services.catch
+    import catch_apis.services.ephemeris
+    import catch_apis.services.fixed
+    import catch_apis.services.inflight
+    import catch_apis.services.invalidation
     import catch_apis.services.message
     import catch_apis.services.status.queue
+    import catch_apis.tasks.catch
+    import catch_apis.tasks.fixed
 
-    jobs_queue = MockedJobsQueue()
+    MockedJobsQueue.reset(monkeypatch)
+    redis_connection = MockedRedisConnection()
 
-    monkeypatch.setattr(
-        catch_apis.services.status.queue, "JobsQueue", lambda: jobs_queue
-    )
-    monkeypatch.setattr(catch_apis.services.catch, "JobsQueue", lambda: jobs_queue)
+    for module in (
+        catch_apis.api.catch,
+        catch_apis.api.fixed,
+        catch_apis.services.status.queue,
+        catch_apis.services.batch,
+        catch_apis.services.catch,
+        catch_apis.tasks.catch,
+        catch_apis.tasks.fixed,
+    ):
+        monkeypatch.setattr(module, "JobsQueue", MockedJobsQueue)
 
     monkeypatch.setattr(
         catch_apis.services.message, "RedisConnection", MockedRedisConnection
     )
+    monkeypatch.setattr(
+        catch_apis.services.inflight,
+        "RedisConnection",
+        lambda: fakeredis.FakeStrictRedis(server=MockedJobsQueue.server),
+    )
+    monkeypatch.setattr(
+        catch_apis.services.invalidation, "RedisConnection", lambda: redis_connection
+    )
+    monkeypatch.setattr(
+        catch_apis.services.ephemeris, "RedisConnection", lambda: redis_connection
+    )
+    monkeypatch.setattr(
+        catch_apis.services.fixed, "RedisConnection", lambda: redis_connection
+    )
 
 
 @pytest.fixture
@@ -185,11 +350,15 @@ def mock_flask_request(monkeypatch):
     """Mocked flask.request"""
 
     import catch_apis.api.catch
+    import catch_apis.api.fixed
 
     class Request:
         url_root = "http://testserver/"
+        remote_addr = "127.0.0.1"
+        headers = {}
 
     monkeypatch.setattr(catch_apis.api.catch, "request", Request)
+    monkeypatch.setattr(catch_apis.api.fixed, "request", Request)
 
 
 @pytest.fixture
@@ -203,5 +372,12 @@ def mock_messages(monkeypatch):
         catch_apis.services.message, "RedisConnection", lambda: redis_connection
     )
     monkeypatch.setattr(
-        catch_apis.services.stream, "RedisConnection", lambda: redis_connection
+        catch_apis.services.stream,
+        "AsyncRedisConnection",
+        lambda: MockedAsyncRedisConnection(redis_connection),
+    )
+    monkeypatch.setattr(
+        catch_apis.services.stream,
+        "broadcaster",
+        catch_apis.services.stream.MessageBroadcaster(),
     )
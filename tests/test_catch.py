@@ -1,15 +1,35 @@
 # Licensed with the 3-clause BSD license.  See LICENSE for details.
 
+import json
 import uuid
 import pytest
+import fakeredis
 import numpy as np
+from astropy.time import Time
 from starlette.testclient import TestClient
-from catch_apis.api.catch import catch_controller
-from catch_apis.tasks.catch import catch_task
-from catch_apis.services.catch import catch_service
+import catch_apis.api.catch
+import catch_apis.services.catch
+import catch_apis.services.message
+from catch_apis.api.catch import _client, catch_controller, catch_batch_controller
+from catch_apis.tasks.catch import catch_task, catch_finalize_task
+from catch_apis.services.catch import catch_service, cached_queries
+from catch_apis.services.cost import estimate_cost, job_timeout
+from catch_apis.services.queue import queue_priority, rq_job_id
+from catch_apis.services import ephemeris
+from catch_apis.services.catch_manager import catch_manager, keep_warm, release_warm
+from catch_apis.services.caught import caught_service
+from catch_apis.services.query_alias import queries_from_job_id
+from catch_apis.services.status.job_id import job_id_service
 from catch_apis.config.env import ENV
 from catch_apis.config import QueryStatus, allowed_sources
-from . import fixture_test_client, mock_flask_request, mock_redis, MockedJobsQueue
+from . import (
+    fixture_test_client,
+    mock_flask_request,
+    mock_redis,
+    mock_messages,
+    MockedJobsQueue,
+    LocalEphemeris,
+)
 
 
 class TestCatchController:
@@ -97,6 +117,215 @@ class TestCatchController:
                 assert result["queue_position"] is None
 
 
+    def test_coalescing(
+        self,
+        test_client: TestClient,
+        mock_redis,
+        mock_flask_request,
+    ):
+        first = catch_controller("65P", sources=["neat_palomar_tricam"])
+        assert first["queued"]
+
+        # identical query attaches to the first job
+        second = catch_controller("65P", sources=["neat_palomar_tricam"])
+        assert second["queued"]
+        assert second["job_id"] == first["job_id"]
+        assert second["queue_position"] == first["queue_position"]
+        assert len(catch_apis.services.catch.JobsQueue().catch_job_ids) == 1
+
+        # the claim is held for as long as the job may take
+        redis = fakeredis.FakeStrictRedis(server=MockedJobsQueue.server)
+        (key,) = redis.keys(f"{ENV.REDIS_JOBS}:inflight:*")
+        assert redis.ttl(key) >= ENV.CATCH_JOB_TIMEOUT_MIN
+
+        # but not if the user does not accept cached results, or the
+        # parameters differ
+        third = catch_controller("65P", sources=["neat_palomar_tricam"], cached=False)
+        assert third["job_id"] != first["job_id"]
+        fourth = catch_controller("65P", sources=["neat_palomar_tricam"], padding=1)
+        assert fourth["job_id"] != first["job_id"]
+
+        # the claim is released when the job completes
+        queue = catch_apis.services.catch.JobsQueue()
+        (finalize,) = [
+            job
+            for job in queue.deferred_jobs
+            if job.args[0] == uuid.UUID(first["job_id"])
+        ]
+        finalize.f(*finalize.args, **finalize.kwargs)
+        fifth = catch_controller("65P", sources=["neat_palomar_tricam"])
+        assert fifth["job_id"] != first["job_id"]
+
+    def test_client_limit(
+        self,
+        test_client: TestClient,
+        mock_redis,
+        mock_flask_request,
+        monkeypatch,
+    ):
+        monkeypatch.setattr(ENV, "REDIS_JOBS_MAX_PER_CLIENT", 2)
+        for i in range(2):
+            result = catch_controller("65P", cached=False)
+            assert result["queued"]
+
+        result = catch_controller("65P", cached=False)
+        assert result["error"]
+        assert not result["queued"]
+        assert not result["queue_full"]
+        assert result["message"].startswith("Too many of your queries")
+
+        # another client is not limited
+        monkeypatch.setattr(catch_apis.api.catch.request, "remote_addr", "192.0.2.1")
+        result = catch_controller("65P", cached=False)
+        assert result["queued"]
+
+    def test_client_key(self, mock_flask_request, monkeypatch):
+        request = catch_apis.api.catch.request
+        monkeypatch.setattr(request, "remote_addr", "10.0.0.2")
+        monkeypatch.setattr(
+            request, "headers", {"X-Forwarded-For": "198.51.100.1, 192.0.2.1"}
+        )
+
+        # without trusted proxies, forwarded addresses are ignored
+        assert _client() == "10.0.0.2"
+
+        # the address added by the trusted proxy identifies the client
+        monkeypatch.setattr(ENV, "TRUSTED_PROXIES", 1)
+        assert _client() == "192.0.2.1"
+
+        # spoofed addresses do not change the client
+        monkeypatch.setattr(
+            request, "headers", {"X-Forwarded-For": "203.0.113.9, 192.0.2.1"}
+        )
+        assert _client() == "192.0.2.1"
+
+        # behind two proxies
+        monkeypatch.setattr(ENV, "TRUSTED_PROXIES", 2)
+        assert _client() == "203.0.113.9"
+
+        # fewer forwarded addresses than proxies
+        monkeypatch.setattr(request, "headers", {"X-Forwarded-For": "192.0.2.1"})
+        assert _client() == "10.0.0.2"
+
+
+class TestCatchBatch:
+    def test_batch(self, test_client: TestClient, mock_redis, mock_flask_request):
+        sources = ["neat_palomar_tricam"]
+        result = catch_batch_controller(
+            {"targets": ["3910", "2P", "Encke"], "sources": sources, "cached": False}
+        )
+        assert result["queued"]
+        assert not result["error"]
+        assert result["query"]["targets"] == ["3910", "2P"]
+        assert [job["target"] for job in result["jobs"]] == ["3910", "2P"]
+        assert all([job["queued"] for job in result["jobs"]])
+        assert [error["target"] for error in result["errors"]] == ["Encke"]
+        assert result["queue_position"] == 0
+        assert result["estimated_cost"] == 2 * ENV.CATCH_DEFAULT_SOURCE_COST
+
+        batch_id = result["batch_id"]
+        assert result["results"] == f"http://testserver/caught/batch/{batch_id}"
+
+        # one task per target, grouped under the batch ID, with its own time
+        # limit; then each target and the batch are finalized
+        queue = catch_apis.services.catch.JobsQueue()
+        assert queue.catch_job_ids == [batch_id]
+        assert [job.args[1] for job in queue.jobs] == ["3910", "2P"]
+        assert len(queue.deferred_jobs) == 3
+        assert queue.deferred_jobs[-1].id == rq_job_id(
+            uuid.UUID(batch_id), "finalize"
+        )
+
+        response = test_client.get(f"/caught/batch/{batch_id}")
+        response.raise_for_status()
+        assert not response.json()["complete"]
+
+        # run the batch (mocked redis does not run queries)
+        for job in queue.jobs + queue.deferred_jobs:
+            job.f(*job.args, **job.kwargs)
+        assert queue.pending_work == 0
+
+        response = test_client.get(f"/caught/batch/{batch_id}")
+        response.raise_for_status()
+        batch = response.json()
+        assert batch["complete"]
+        assert "data" not in batch["jobs"][0]
+
+        response = test_client.get(f"/caught/batch/{batch_id}", params={"data": True})
+        response.raise_for_status()
+        batch = response.json()
+        assert [job["target"] for job in batch["jobs"]] == ["3910", "2P"]
+        assert batch["jobs"][0]["count"] == len(batch["jobs"][0]["data"])
+        assert batch["jobs"][0]["data"] == list(
+            caught_service(uuid.UUID(batch["jobs"][0]["job_id"]))
+        )
+
+        # the same batch is now cached
+        cached = catch_batch_controller({"targets": ["3910", "2P"], "sources": sources})
+        assert not cached["queued"]
+        assert not any([job["queued"] for job in cached["jobs"]])
+        response = test_client.get(f"/caught/batch/{cached['batch_id']}")
+        assert response.json()["complete"]
+        assert "data" not in response.json()["jobs"][0]
+
+    def test_failed_batch_job(
+        self, test_client: TestClient, mock_redis, mock_flask_request
+    ):
+        sources = ["neat_palomar_tricam"]
+        result = catch_batch_controller(
+            {"targets": ["3910", "2P"], "sources": sources, "cached": False}
+        )
+        batch_id = uuid.UUID(result["batch_id"])
+        job_ids = [job["job_id"] for job in result["jobs"]]
+
+        # the first target is searched, the second target's task fails before
+        # it creates any queries
+        queue = catch_apis.services.catch.JobsQueue()
+        job = queue.jobs[0]
+        job.f(*job.args, **job.kwargs)
+        queue.connection.hset(
+            queue.job_class.key_for(rq_job_id(batch_id, job_ids[1])),
+            "status",
+            "failed",
+        )
+
+        response = test_client.get(f"/caught/batch/{batch_id.hex}")
+        response.raise_for_status()
+        batch = response.json()
+        assert batch["complete"]
+        assert [job["complete"] for job in batch["jobs"]] == [True, True]
+        assert [job["error"] for job in batch["jobs"]] == [False, True]
+        assert batch["jobs"][1]["status"] == []
+
+        # lost tasks are missing from redis
+        result = catch_batch_controller(
+            {"targets": ["3910"], "sources": sources, "cached": False}
+        )
+        batch_id = uuid.UUID(result["batch_id"])
+        response = test_client.get(f"/caught/batch/{batch_id.hex}")
+        assert not response.json()["complete"]
+
+        queue.connection.delete(
+            queue.job_class.key_for(rq_job_id(batch_id, result["jobs"][0]["job_id"]))
+        )
+        response = test_client.get(f"/caught/batch/{batch_id.hex}")
+        batch = response.json()
+        assert batch["complete"]
+        assert batch["jobs"][0]["error"]
+
+    def test_invalid_batch(
+        self, test_client: TestClient, mock_redis, mock_flask_request
+    ):
+        result = catch_batch_controller({"targets": ["Encke"]})
+        assert result["error"]
+        assert not result["queued"]
+
+        response = test_client.get(f"/caught/batch/{uuid.uuid4().hex}")
+        assert response.status_code == 404
+        response = test_client.get("/caught/batch/asdf")
+        assert response.status_code == 400
+
+
 class TestCatchService:
     def test_queuing_caching(self, test_client: TestClient, mock_redis):
         # queue a query
@@ -116,6 +345,58 @@ class TestCatchService:
         )
         assert status == QueryStatus.SUCCESS
 
+    def test_cached_queries(self, test_client: TestClient, mock_redis):
+        job_id = uuid.uuid4()
+        catch_task(job_id, "3910", ["neat_palomar_tricam"], None, None, False, 0, False)
+
+        sources = ["neat_palomar_tricam", "neat_maui_geodss"]
+        with catch_manager() as catch:
+            cached = cached_queries(catch, "3910", sources, None, None, False, 0)
+            assert cached["neat_palomar_tricam"] is not None
+            assert cached["neat_maui_geodss"] is None
+
+            # different parameters are not cached
+            cached = cached_queries(catch, "3910", sources, None, None, False, 1)
+            assert cached == {source: None for source in sources}
+
+        # cache misses are remembered
+        miss = ("3910", "neat_maui_geodss", None, None, 0, False)
+        assert miss in catch_apis.services.catch._uncached
+
+        # until a query finishes
+        catch_task(
+            uuid.uuid4(), "3910", ["neat_maui_geodss"], None, None, False, 0, False
+        )
+        with catch_manager() as catch:
+            cached = cached_queries(catch, "3910", sources, None, None, False, 0)
+            assert cached["neat_maui_geodss"] is not None
+        assert miss not in catch_apis.services.catch._uncached
+
+    def test_cached_aliases(self, test_client: TestClient, mock_redis):
+        job_id = uuid.uuid4()
+        catch_task(job_id, "3910", ["neat_palomar_tricam"], None, None, False, 0, False)
+
+        cached_job_id = uuid.uuid4()
+        status = catch_service(
+            cached_job_id, "3910", ["neat_palomar_tricam"], None, None, False, 0, True
+        )
+        assert status == QueryStatus.SUCCESS
+
+        # the new job refers to the earlier query, nothing is copied
+        with catch_manager() as catch:
+            assert len(catch.queries_from_job_id(cached_job_id)) == 0
+            queries = queries_from_job_id(catch, cached_job_id)
+            assert len(queries) == 1
+            assert queries[0].job_id == job_id.hex
+
+        rows = list(caught_service(cached_job_id))
+        assert len(rows) == 4
+        assert rows == list(caught_service(job_id))
+
+        parameters, status = job_id_service(cached_job_id)
+        assert parameters["target"] == "3910"
+        assert status[0]["count"] == 4
+
     def test_filling_queue(self, test_client: TestClient, mock_redis):
         for i in range(ENV.REDIS_JOBS_MAX_QUEUE_SIZE + 2):
             job_id = uuid.uuid4()
@@ -126,3 +407,171 @@ class TestCatchService:
                 assert status == QueryStatus.QUEUED
             else:
                 assert status == QueryStatus.QUEUEFULL
+
+    def test_queue_work(self, test_client: TestClient, mock_redis, monkeypatch):
+        # without history, each source has the default cost
+        one_source = ENV.CATCH_DEFAULT_SOURCE_COST
+        assert queue_priority(one_source) == "high"
+        assert queue_priority(len(allowed_sources) * one_source) == "low"
+
+        # the queue is full when the estimated work reaches the limit
+        monkeypatch.setattr(ENV, "REDIS_JOBS_MAX_QUEUE_WORK", int(2.5 * one_source))
+        statuses = []
+        for i in range(4):
+            statuses.append(
+                catch_service(
+                    uuid.uuid4(),
+                    "3910",
+                    ["neat_palomar_tricam"],
+                    None,
+                    None,
+                    False,
+                    0,
+                    False,
+                )
+            )
+        assert statuses == [QueryStatus.QUEUED] * 2 + [QueryStatus.QUEUEFULL] * 2
+
+        # but there is room again after a job completes
+        queue = catch_apis.services.catch.JobsQueue()
+        finalize = queue.deferred_jobs[0]
+        finalize.f(*finalize.args, **finalize.kwargs)
+        assert queue.pending_work == one_source
+
+    def test_estimate_cost(
+        self, test_client: TestClient, mock_redis, mock_flask_request
+    ):
+        source = "neat_palomar_tricam"
+        with catch_manager() as catch:
+            estimate = estimate_cost(catch, "3910", [source], None, None, False, 0)
+        assert estimate.sources == {source: ENV.CATCH_DEFAULT_SOURCE_COST}
+        catch_apis.services.cost._reference.clear()
+
+        job_id = uuid.uuid4()
+        catch_task(job_id, "3910", [source], None, None, False, 0, False)
+        with catch_manager() as catch:
+            (query,) = catch.queries_from_job_id(job_id)
+
+            # same parameters, same cost
+            estimate = estimate_cost(catch, "3910", [source], None, None, False, 0)
+            assert np.isclose(estimate.total, query.execution_time)
+
+            # padding and the uncertainty ellipse are more expensive
+            padded = estimate_cost(catch, "3910", [source], None, None, True, 10)
+            assert np.isclose(padded.total, 4 * query.execution_time)
+
+        assert job_timeout(0) == ENV.CATCH_JOB_TIMEOUT_MIN
+        assert job_timeout(1e9) == ENV.CATCH_JOB_TIMEOUT_MAX
+
+        result = catch_controller("3910", sources=[source], cached=False)
+        assert np.isclose(result["estimated_cost"], query.execution_time)
+
+    def test_estimate_cost_history(
+        self, test_client: TestClient, mock_redis, monkeypatch
+    ):
+        # each source has its own window of recent queries
+        monkeypatch.setattr(ENV, "CATCH_COST_HISTORY", 1)
+        sources = ["neat_maui_geodss", "neat_palomar_tricam"]
+        catch_task(uuid.uuid4(), "3910", sources[:1], None, None, False, 0, False)
+        for i in range(2):
+            catch_task(uuid.uuid4(), "3910", sources[1:], None, None, False, 0, False)
+
+        catch_apis.services.cost._reference.clear()
+        with catch_manager() as catch:
+            estimate = estimate_cost(catch, "3910", sources, None, None, False, 0)
+        assert estimate.sources["neat_maui_geodss"] != ENV.CATCH_DEFAULT_SOURCE_COST
+
+    def test_warm_catch(self, test_client: TestClient, mock_redis):
+        keep_warm()
+        try:
+            with catch_manager() as catch:
+                with catch_manager() as inner:
+                    assert inner is catch
+                catch.padding = 1
+                # not reset until the outermost context exits
+                assert catch.padding == 1
+
+            assert catch.padding == 0
+
+            # jobs run with the persistent instance
+            job_id = uuid.uuid4()
+            catch_task(
+                job_id, "3910", ["neat_palomar_tricam"], None, None, False, 0, False
+            )
+            with catch_manager() as warm:
+                assert warm is catch
+                assert len(warm.queries_from_job_id(job_id)) == 1
+        finally:
+            release_warm()
+
+        with catch_manager() as cold:
+            assert cold is not catch
+
+    def test_per_source_tasks(self, test_client: TestClient, mock_redis, mock_messages):
+        sources = ["neat_palomar_tricam", "neat_maui_geodss"]
+        job_id = uuid.uuid4()
+        status = catch_service(job_id, "3910", sources, None, None, False, 0, False)
+        assert status == QueryStatus.QUEUED
+
+        # one task per source, and a final task that waits for the others
+        queue = catch_apis.services.catch.JobsQueue()
+        task_ids = [rq_job_id(job_id, source) for source in sources]
+        assert queue.job_ids == task_ids
+        assert queue.catch_job_ids == [job_id.hex]
+        assert len(queue.deferred_jobs) == 1
+        finalize = queue.deferred_jobs[0]
+        assert finalize.id == rq_job_id(job_id, "finalize")
+        assert finalize.f is catch_finalize_task
+        assert finalize.depends_on.dependencies == task_ids
+        assert finalize.depends_on.allow_failure
+
+        # run the tasks (mocked redis does not run queries)
+        for job in queue.jobs:
+            job.f(*job.args, **job.kwargs)
+        finalize.f(*finalize.args, **finalize.kwargs)
+
+        redis = catch_apis.services.message.RedisConnection()
+        messages = [
+            json.loads(item["data"])
+            for item in redis.items[ENV.REDIS_TASK_MESSAGES]
+        ]
+
+        # only one final status message
+        assert all(
+            [message["status"] == "running" for message in messages[:-1]]
+        )
+        assert messages[-1]["status"] == "success"
+        assert len(set([message["job_prefix"] for message in messages])) == 1
+
+        # elapsed time is measured from the start of the job, not of each task
+        elapsed = [message["elapsed"] for message in messages]
+        assert elapsed == sorted(elapsed)
+
+
+def test_ephemeris_cache(mock_redis):
+    ephemeris.install(LocalEphemeris)
+    ephemeris.install(LocalEphemeris)  # no effect
+    start = Time("2020-01-01")
+    stop = Time("2020-01-11")
+
+    calls = LocalEphemeris.calls
+    eph = LocalEphemeris.target_over_date_range("500", "2P", start, stop)
+    assert len(eph) == 11
+    assert LocalEphemeris.calls == calls + 1
+
+    # same ephemeris, with the arguments passed differently
+    cached = LocalEphemeris.target_over_date_range(
+        "500", target="2P", start=start, stop=stop, step=None
+    )
+    assert cached == eph
+    assert LocalEphemeris.calls == calls + 1
+
+    # different parameters are not cached
+    LocalEphemeris.target_over_date_range("500", "2P", start, Time("2020-01-12"))
+    assert LocalEphemeris.calls == calls + 2
+
+    # orbits of numbered asteroids change less often than those of comets and
+    # unnumbered asteroids
+    assert ephemeris.ttl("2P") == ENV.EPHEMERIS_CACHE_TTL_COMET
+    assert ephemeris.ttl("3910") == ENV.EPHEMERIS_CACHE_TTL_NUMBERED
+    assert ephemeris.ttl("2024 YR4") == ENV.EPHEMERIS_CACHE_TTL
@@ -3,6 +3,8 @@
 import uuid
 import pytest
 import numpy as np
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from starlette.testclient import TestClient
 from catch_apis.api.caught import caught_controller
 from catch_apis.tasks.catch import catch_task
@@ -66,7 +68,149 @@ def test_caught(test_client: TestClient, mock_redis):
             assert expected[k] == v
 
 
+def test_caught_stream(test_client: TestClient, mock_redis):
+    job_id = uuid.uuid4()
+    catch_task(job_id, "3910", ["neat_palomar_tricam"], None, None, False, 0, True)
+
+    response = test_client.get(f"/caught/{job_id.hex}")
+    response.raise_for_status()
+    expected = response.json()
+
+    response = test_client.get(f"/caught/{job_id.hex}", params={"stream": True})
+    response.raise_for_status()
+    assert response.headers["content-type"].startswith("application/json")
+    results = response.json()
+
+    assert results["count"] == 4
+    assert results == expected
+
+
+def test_caught_pagination(test_client: TestClient, mock_redis):
+    job_id = uuid.uuid4()
+    catch_task(job_id, "3910", ["neat_palomar_tricam"], None, None, False, 0, True)
+
+    response = test_client.get(f"/caught/{job_id.hex}")
+    response.raise_for_status()
+    expected = [row["product_id"] for row in response.json()["data"]]
+
+    params = {"limit": 3}
+    for stream in [False, True]:
+        params["stream"] = stream
+        product_ids = []
+        while True:
+            response = test_client.get(f"/caught/{job_id.hex}", params=params)
+            response.raise_for_status()
+            results = response.json()
+            assert results["count"] == 4
+            assert len(results["data"]) <= 3
+            product_ids.extend([row["product_id"] for row in results["data"]])
+            if results["next_cursor"] is None:
+                break
+            params["cursor"] = results["next_cursor"]
+        params.pop("cursor", None)
+
+        # all rows, in time order
+        assert product_ids == expected
+
+    response = test_client.get(
+        f"/caught/{job_id.hex}", params={"cursor": "invalid cursor"}
+    )
+    assert response.status_code == 400
+
+
 def test_invalid_job_id(test_client: TestClient):
     response = test_client.get(f"/caught/invalid_job_id")
     assert response.status_code == 400
     assert response.content == b'"Invalid job ID"\n'
+
+
+def test_caught_filters(test_client: TestClient, mock_redis):
+    job_id = uuid.uuid4()
+    catch_task(job_id, "3910", ["neat_palomar_tricam"], None, None, False, 0, True)
+
+    response = test_client.get(f"/caught/{job_id.hex}")
+    response.raise_for_status()
+    vmag = sorted([row["vmag"] for row in response.json()["data"]])
+
+    response = test_client.get(f"/caught/{job_id.hex}", params={"vmag_max": vmag[1]})
+    response.raise_for_status()
+    results = response.json()
+    expected = len([v for v in vmag if v <= vmag[1]])
+    assert results["count"] == expected
+    assert len(results["data"]) == expected
+    assert all([row["vmag"] <= vmag[1] for row in results["data"]])
+
+    # per-source counts are not filtered
+    assert results["status"][0]["count"] == 4
+
+    response = test_client.get(
+        f"/caught/{job_id.hex}", params={"vmag_min": vmag[1], "rh_max": 100}
+    )
+    response.raise_for_status()
+    assert response.json()["count"] == len([v for v in vmag if v >= vmag[1]])
+
+    # observations without a value are excluded
+    response = test_client.get(f"/caught/{job_id.hex}", params={"seeing_max": 10})
+    response.raise_for_status()
+    assert response.json()["count"] == 0
+
+    response = test_client.get(
+        f"/caught/{job_id.hex}", params={"sources": ["neat_maui_geodss"]}
+    )
+    response.raise_for_status()
+    assert response.json()["count"] == 0
+    assert response.json()["data"] == []
+
+    response = test_client.get(
+        f"/caught/{job_id.hex}", params={"delta_min": 2, "delta_max": 1}
+    )
+    assert response.status_code == 400
+
+
+def test_caught_fields(test_client: TestClient, mock_redis):
+    job_id = uuid.uuid4()
+    catch_task(job_id, "3910", ["neat_palomar_tricam"], None, None, False, 0, True)
+
+    response = test_client.get(f"/caught/{job_id.hex}")
+    response.raise_for_status()
+    full = {row["product_id"]: row for row in response.json()["data"]}
+
+    response = test_client.get(
+        f"/caught/{job_id.hex}", params={"fields": "date,ra,dec,vmag"}
+    )
+    response.raise_for_status()
+    results = response.json()
+    assert results["count"] == 4
+    for row in results["data"]:
+        assert set(row) == {"product_id", "mjd_start", "date", "ra", "dec", "vmag"}
+        assert row == {k: full[row["product_id"]][k] for k in row}
+
+    # projections without the URLs do not lazy load the found object's position,
+    # i.e., they take as many statements as projections that include it
+    statements = []
+
+    def count(*args):
+        statements[-1] += 1
+
+    event.listen(Engine, "before_cursor_execute", count)
+    try:
+        for fields in ("vmag", "ra,dec,vmag"):
+            statements.append(0)
+            response = test_client.get(
+                f"/caught/{job_id.hex}", params={"fields": fields}
+            )
+            response.raise_for_status()
+    finally:
+        event.remove(Engine, "before_cursor_execute", count)
+    assert statements[0] == statements[1]
+
+    # survey URLs load the full observation
+    response = test_client.get(
+        f"/caught/{job_id.hex}", params={"fields": "cutout_url", "stream": True}
+    )
+    response.raise_for_status()
+    for row in response.json()["data"]:
+        assert row["cutout_url"] == full[row["product_id"]]["cutout_url"]
+
+    response = test_client.get(f"/caught/{job_id.hex}", params={"fields": "magnitude"})
+    assert response.status_code == 400
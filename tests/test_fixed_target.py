@@ -1,10 +1,24 @@
 # Licensed with the 3-clause BSD license.  See LICENSE for details.
 
+import json
+import uuid
 import numpy as np
+from astropy.time import Time
 from starlette.testclient import TestClient
-from . import fixture_test_client  # noqa F401
+from catch.catch import Catch
+from catch.model import SurveyStats
+from . import fixture_test_client, mock_flask_request, mock_redis  # noqa F401
 import catch_apis.api.fixed
-from catch_apis.api.fixed import fixed_target_query_controller, CatchApisException
+import catch_apis.services.fixed
+from catch_apis.api.fixed import (
+    fixed_target_query_controller,
+    fixed_batch_controller,
+    CatchApisException,
+)
+from catch_apis.services import fixed_cache
+from catch_apis.services.catch_manager import catch_manager
+from catch_apis.services.fixed import FixedResult
+from catch_apis.config.env import ENV
 
 
 def test_invalid_queries():
@@ -149,3 +163,298 @@ def test_areal_search(test_client: TestClient):
     response.raise_for_status()
     results = response.json()
     assert len(results["data"]) == 0
+
+
+def test_pagination(test_client: TestClient):
+    parameters = {
+        "ra": "00:34:32.0",
+        "dec": "+8 00 48",
+        "sources": ["neat_palomar_tricam"],
+        "limit": 3,
+    }
+    response = test_client.get("/fixed", params=parameters)
+    response.raise_for_status()
+    results = response.json()
+    assert results["count"] == 4
+    assert len(results["data"]) == 3
+    assert results["next_cursor"] is not None
+    first_page = results["data"]
+
+    parameters["cursor"] = results["next_cursor"]
+    response = test_client.get("/fixed", params=parameters)
+    response.raise_for_status()
+    results = response.json()
+    assert results["count"] == 4
+    assert len(results["data"]) == 1
+    assert results["next_cursor"] is None
+    assert results["data"][0]["mjd_start"] > first_page[-1]["mjd_start"]
+
+    parameters["cursor"] = "invalid cursor"
+    response = test_client.get("/fixed", params=parameters)
+    response.raise_for_status()
+    results = response.json()
+    assert results["error"]
+    assert "Invalid cursor" in results["message"]
+
+
+def test_queued_query(
+    test_client: TestClient, mock_redis, mock_flask_request, monkeypatch
+):
+    parameters = {
+        "ra": "00:34:32.0",
+        "dec": "+8 00 48",
+        "sources": ["neat_palomar_tricam"],
+    }
+
+    # small queries are run immediately
+    result = fixed_target_query_controller(**parameters)
+    assert not result["queued"]
+    assert len(result["data"]) == 4
+
+    monkeypatch.setattr(ENV, "FIXED_INLINE_MAX_COST", 0)
+    result = fixed_target_query_controller(**parameters)
+    assert result["queued"]
+    assert not result["error"]
+    assert result["queue_position"] == 0
+    assert "data" not in result
+
+    job_id = result["job_id"]
+    assert result["results"] == f"http://testserver/fixed/{job_id}"
+    assert result["message_stream"] == f"http://testserver/stream/{job_id}"
+
+    response = test_client.get(f"/fixed/{job_id}")
+    response.raise_for_status()
+    assert not response.json()["complete"]
+
+    # run the query (mocked redis does not run queries)
+    queue = catch_apis.api.fixed.JobsQueue()
+    job = queue.jobs[0]
+    job.f(*job.args)
+    assert queue.pending_work == 0
+
+    response = test_client.get(f"/fixed/{job_id}", params={"limit": 3})
+    response.raise_for_status()
+    results = response.json()
+    assert results["complete"]
+    assert results["status"] == "finished"
+    assert results["query"]["sources"] == ["neat_palomar_tricam"]
+    assert results["count"] == 4
+    assert len(results["data"]) == 3
+
+    response = test_client.get(
+        f"/fixed/{job_id}", params={"cursor": results["next_cursor"]}
+    )
+    response.raise_for_status()
+    assert len(response.json()["data"]) == 1
+    assert response.json()["next_cursor"] is None
+
+    # the observations are stored by reference, not in redis
+    with catch_manager() as catch:
+        rows = (
+            catch.db.session.query(FixedResult)
+            .filter(FixedResult.job_id == uuid.UUID(job_id).hex)
+            .count()
+        )
+    assert rows == 4
+    stored = catch_apis.services.fixed.RedisConnection().get(
+        catch_apis.services.fixed._results_key(uuid.UUID(job_id))
+    )
+    assert "data" not in json.loads(stored)
+
+    response = test_client.get(f"/fixed/{uuid.uuid4().hex}")
+    assert response.status_code == 404
+    response = test_client.get("/fixed/asdf")
+    assert response.status_code == 400
+
+
+def test_batch_query(
+    test_client: TestClient, mock_redis, mock_flask_request, monkeypatch
+):
+    body = {
+        "positions": [
+            {"ra": "00:34:32.0", "dec": "+8 00 48"},
+            {"ra": "bad ra", "dec": "0"},
+            {"ra": "00:34:32.0", "dec": "+8 00 48", "radius": 35},
+        ],
+        "sources": ["neat_palomar_tricam"],
+    }
+
+    # small batches are run immediately
+    response = test_client.post("/fixed/batch", json=body)
+    response.raise_for_status()
+    results = response.json()
+    assert not results["error"]
+    assert not results["queued"]
+    assert [error["index"] for error in results["errors"]] == [1]
+    assert [position["count"] for position in results["positions"]] == [4, 8]
+    assert results["positions"][1]["radius"] == 35
+    assert results["count"] == 12
+
+    # the same results as single position queries
+    single = fixed_target_query_controller(
+        "00:34:32.0", "+8 00 48", sources=["neat_palomar_tricam"]
+    )
+    assert results["positions"][0]["data"] == single["data"]
+
+    monkeypatch.setattr(ENV, "FIXED_INLINE_MAX_COST", 0)
+    result = fixed_batch_controller(body)
+    assert result["queued"]
+    assert "positions" not in result
+    job_id = result["job_id"]
+    assert result["results"] == f"http://testserver/fixed/batch/{job_id}"
+
+    response = test_client.get(f"/fixed/batch/{job_id}")
+    response.raise_for_status()
+    assert not response.json()["complete"]
+
+    # run the batch (mocked redis does not run queries)
+    queue = catch_apis.api.fixed.JobsQueue()
+    job = queue.jobs[0]
+    job.f(*job.args)
+    assert queue.pending_work == 0
+
+    response = test_client.get(f"/fixed/batch/{job_id}")
+    response.raise_for_status()
+    batch = response.json()
+    assert batch["complete"]
+    assert batch["status"] == "finished"
+    for index, (position, expected) in enumerate(
+        zip(batch["positions"], results["positions"])
+    ):
+        assert position["results"] == f"http://testserver/fixed/batch/{job_id}/{index}"
+        assert position["count"] == expected["count"]
+        assert "data" not in position
+
+    # the observations are stored by reference, and paged for each position
+    with catch_manager() as catch:
+        rows = (
+            catch.db.session.query(FixedResult.position)
+            .filter(FixedResult.job_id == job_id)
+            .all()
+        )
+    assert sorted(rows) == [(0,)] * 4 + [(1,)] * 8
+
+    response = test_client.get(f"/fixed/batch/{job_id}/0")
+    response.raise_for_status()
+    position = response.json()
+    assert position["count"] == 4
+    assert position["next_cursor"] is None
+    assert position["data"] == results["positions"][0]["data"]
+
+    data = []
+    params = {"limit": 3}
+    while True:
+        response = test_client.get(f"/fixed/batch/{job_id}/1", params=params)
+        response.raise_for_status()
+        position = response.json()
+        data.extend(position["data"])
+        if position["next_cursor"] is None:
+            break
+        params["cursor"] = position["next_cursor"]
+    assert position["radius"] == 35
+    assert data == results["positions"][1]["data"]
+
+    response = test_client.get(f"/fixed/batch/{job_id}/2")
+    assert response.status_code == 404
+
+    # no valid positions
+    result = fixed_batch_controller({"positions": [{"ra": "bad ra", "dec": "0"}]})
+    assert result["error"]
+    assert len(result["errors"]) == 1
+
+
+def test_search_cache(test_client: TestClient, monkeypatch):
+    searches = []
+    query = Catch.query
+
+    def counted_query(self, target, job_id, sources=None, **kwargs):
+        searches.append(target)
+        return query(self, target, job_id, sources, **kwargs)
+
+    monkeypatch.setattr(Catch, "query", counted_query)
+
+    parameters = {
+        "ra": "00:34:32.0",
+        "dec": "+8 00 48",
+        "sources": ["neat_palomar_tricam"],
+    }
+    first = fixed_target_query_controller(**parameters)
+    assert len(searches) == 1
+
+    # identical and nearly identical searches are cached
+    cached = fixed_target_query_controller(**parameters)
+    assert len(searches) == 1
+    assert cached["data"] == first["data"]
+    assert cached["count"] == first["count"]
+
+    fixed_target_query_controller(**{**parameters, "ra": "00:34:32.01"})
+    assert len(searches) == 1
+
+    # other parameters are searched
+    fixed_target_query_controller(**{**parameters, "radius": 35})
+    assert len(searches) == 2
+
+    # survey updates invalidate the cache
+    with catch_manager() as catch:
+        catch.db.session.query(SurveyStats).filter(
+            SurveyStats.source == "neat_palomar_tricam"
+        ).update({"updated": Time.now().iso})
+
+    updated = fixed_target_query_controller(**parameters)
+    assert len(searches) == 3
+    assert updated["data"] == first["data"]
+
+    # least recently used searches are discarded
+    monkeypatch.setattr(ENV, "FIXED_CACHE_SIZE", 1)
+    fixed_target_query_controller(**{**parameters, "radius": 35})
+    assert len(searches) == 4
+    fixed_target_query_controller(**parameters)
+    assert len(searches) == 5
+    assert len(fixed_cache._cache) == 1
+
+
+def test_filters(test_client: TestClient):
+    parameters = {
+        "ra": "00:34:32.0",
+        "dec": "+8 00 48",
+        "sources": ["neat_palomar_tricam"],
+    }
+
+    # the test observations have no seeing or limiting magnitude
+    response = test_client.get("/fixed", params={**parameters, "seeing_max": 10})
+    response.raise_for_status()
+    results = response.json()
+    assert results["query"]["filters"] == {"seeing": [None, 10]}
+    assert results["count"] == 0
+    assert results["data"] == []
+
+    response = test_client.get(
+        "/fixed", params={**parameters, "maglimit_min": 21, "maglimit_max": 20}
+    )
+    response.raise_for_status()
+    results = response.json()
+    assert results["error"]
+    assert "Invalid maglimit range" in results["message"]
+
+
+def test_fields(test_client: TestClient):
+    parameters = {
+        "ra": "00:34:32.0",
+        "dec": "+8 00 48",
+        "sources": ["neat_palomar_tricam"],
+    }
+
+    response = test_client.get("/fixed", params={**parameters, "fields": "date,fov"})
+    response.raise_for_status()
+    results = response.json()
+    assert results["query"]["fields"] == ["date", "fov"]
+    assert results["count"] == 4
+    for row in results["data"]:
+        assert set(row) == {"product_id", "mjd_start", "date", "fov"}
+
+    # found object fields are not available
+    response = test_client.get("/fixed", params={**parameters, "fields": "vmag"})
+    response.raise_for_status()
+    results = response.json()
+    assert results["error"]
+    assert "Invalid fields: vmag" in results["message"]
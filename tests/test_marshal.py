@@ -0,0 +1,100 @@
+# Licensed with the 3-clause BSD license.  See LICENSE for details.
+
+from types import SimpleNamespace
+import pytest
+from astropy.time import Time
+from catch_apis.services import marshal
+
+
+class DummyObservation(SimpleNamespace):
+    __data_source_name__ = "Dummy Survey"
+    __field_prefix__ = "ps1"
+
+    def cutout_url(self, ra, dec):
+        return f"cutout?ra={ra}&dec={dec}"
+
+    def preview_url(self, ra, dec):
+        return f"preview?ra={ra}&dec={dec}"
+
+
+def dummy_observation(i):
+    return DummyObservation(
+        product_id=f"product_{i}",
+        source="dummy",
+        mjd_start=56000.0 + i,
+        mjd_stop=56000.0 + i + 0.01,
+        fov="",
+        filter="r",
+        exposure=30.0,
+        seeing=None,
+        airmass=None,
+        maglimit=20.0 + i,
+        archive_url=None,
+        frame_id=i,
+        projection_id=None,
+        skycell_id=None,
+    )
+
+
+def test_observations():
+    obs = [dummy_observation(i) for i in range(3)]
+    rows = marshal.observations(obs, 1.0, 2.0)
+
+    assert len(rows) == 3
+    for i, row in enumerate(rows):
+        assert row == marshal.observation(obs[i], 1.0, 2.0)
+        assert row["date"] == Time(56000.005 + i, format="mjd").iso
+        assert row["cutout_url"] == "cutout?ra=1.0&dec=2.0"
+        assert row["ps1:frame_id"] == i
+
+    # per-observation coordinates
+    rows = marshal.observations(obs, [1.0, 2.0, 3.0], [4.0, 5.0, 6.0])
+    assert rows[2]["preview_url"] == "preview?ra=3.0&dec=6.0"
+
+    # no coordinates, no URLs
+    rows = marshal.observations(obs)
+    assert "cutout_url" not in rows[0]
+
+    assert marshal.observations([]) == []
+
+
+def test_observations_columnar():
+    obs = [dummy_observation(i) for i in range(3)]
+    columns = marshal.observations(obs, columnar=True)
+    assert columns["product_id"] == ["product_0", "product_1", "product_2"]
+    assert columns["maglimit"] == [20.0, 21.0, 22.0]
+    assert columns["ps1:frame_id"] == [0, 1, 2]
+
+
+def test_to_columns_fills_missing_keys():
+    columns = marshal.to_columns([{"a": 1}, {"a": 2, "b": 3}])
+    assert columns == {"a": [1, 2], "b": [None, 3]}
+
+
+def test_observations_fields():
+    obs = [dummy_observation(i) for i in range(3)]
+
+    # all fields
+    fields = marshal.OBSERVATION_FIELDS + marshal.survey_specific_keys()
+    assert marshal.observations(obs, 1.0, 2.0, fields=fields) == marshal.observations(
+        obs, 1.0, 2.0
+    )
+
+    # required fields are always included
+    rows = marshal.observations(obs, 1.0, 2.0, fields=["date", "ps1:frame_id"])
+    assert rows[1] == {
+        "product_id": "product_1",
+        "mjd_start": 56001.0,
+        "date": Time(56001.005, format="mjd").iso,
+        "ps1:frame_id": 1,
+    }
+
+    columns = marshal.observations(obs, fields=["maglimit"], columnar=True)
+    assert set(columns) == {"product_id", "mjd_start", "maglimit"}
+
+
+def test_check_fields():
+    marshal.check_fields(None, marshal.OBSERVATION_FIELDS)
+    marshal.check_fields(["date"], marshal.OBSERVATION_FIELDS)
+    with pytest.raises(ValueError, match="Invalid fields: vmag"):
+        marshal.check_fields(["date", "vmag"], marshal.OBSERVATION_FIELDS)
@@ -2,21 +2,40 @@
 
 import json
 import uuid
+import asyncio
+import logging
 import pytest
 from unittest import mock
 from functools import partial
 from starlette.testclient import TestClient
-from catch_apis.services.message import Message
-from catch_apis.services.stream import message_stream_service
+from catch_apis.services.message import (
+    Message,
+    listen_for_task_messages,
+    stop_listening_for_task_messages,
+)
+from catch_apis.services.stream import (
+    message_stream_service,
+    job_message_stream_service,
+)
+from catch_apis.config.env import ENV
 from . import fixture_test_client, mock_messages
 
 
+def collect(stream):
+    """Collect all events from an async stream."""
+
+    async def _collect():
+        return [event async for event in stream]
+
+    return asyncio.run(_collect())
+
+
 def test_message_stream_service(mock_messages):
     job_id = uuid.uuid4()
     Message(job_id, "this is a test message").publish()
     Message(job_id, "this is another test message").publish()
 
-    messages = [message for message in message_stream_service(1)]
+    messages = collect(message_stream_service(1))
 
     # first two are our messages, the rest are stayin' alive and timeout
     data = json.loads(messages[0][6:])
@@ -50,3 +69,159 @@ def test_stream(test_client: TestClient, mock_messages):
         'data: {"job_prefix": "' + job_id.hex[:8] + '", "text": "test message, again", '
         in text
     )
+
+
+def test_listen_for_task_messages(mock_messages):
+    job_id = uuid.uuid4()
+    logger = logging.getLogger(f"CATCH-APIs {job_id.hex}")
+
+    # two tasks for the same job share one handler
+    listen_for_task_messages(job_id)
+    listen_for_task_messages(job_id)
+    assert len(logger.handlers) == 1
+
+    stop_listening_for_task_messages(job_id)
+    assert len(logger.handlers) == 1
+
+    stop_listening_for_task_messages(job_id)
+    assert len(logger.handlers) == 0
+
+
+def test_batched_task_messages(mock_messages, monkeypatch):
+    import catch_apis.services.message
+
+    monkeypatch.setattr(ENV, "REDIS_TASK_MESSAGES_BATCH_SIZE", 1000)
+    redis = catch_apis.services.message.RedisConnection()
+    stream = redis.items[ENV.REDIS_TASK_MESSAGES]
+
+    job_id = uuid.uuid4()
+    logger = logging.getLogger(f"CATCH-APIs {job_id.hex}")
+    logger.setLevel(logging.INFO)
+    listen_for_task_messages(job_id)
+    for i in range(10):
+        logger.info("message %d", i)
+
+    # publishing a message directly flushes the buffer first
+    Message(job_id, "done", status="success").publish()
+    texts = [json.loads(item["data"])["text"] for item in stream]
+    assert texts == [f"message {i}" for i in range(10)] + ["done"]
+
+    # stop listening flushes the buffer
+    logger.info("last message")
+    stop_listening_for_task_messages(job_id)
+    assert json.loads(stream[-1]["data"])["text"] == "last message"
+
+
+def test_publish_after_fork(mock_messages, monkeypatch):
+    import catch_apis.services.message
+
+    monkeypatch.setattr(ENV, "REDIS_TASK_MESSAGES_ASYNC", True)
+    redis = catch_apis.services.message.RedisConnection()
+    stream = redis.items[ENV.REDIS_TASK_MESSAGES]
+    publisher = catch_apis.services.message.publisher
+
+    # a forked process inherits the parent's publisher
+    job_id = uuid.uuid4()
+    monkeypatch.setattr(publisher, "_pid", -1)
+    publisher.publish(Message(job_id, "first message", status="running"))
+    publisher.publish(Message(job_id, "done", status="success"))
+    publisher.flush()
+
+    texts = [json.loads(item["data"])["text"] for item in stream]
+    assert texts == ["first message", "done"]
+
+
+def test_message_broadcaster(mock_messages, monkeypatch):
+    import catch_apis.services.stream
+
+    job_id = uuid.uuid4()
+    Message(job_id, "first message").publish()
+
+    broadcaster = catch_apis.services.stream.broadcaster
+
+    async def text(stream):
+        return json.loads((await anext(stream))[6:])["text"]
+
+    async def test():
+        # two clients share one reader
+        a = message_stream_service(1)
+        b = message_stream_service(1)
+        assert await text(a) == "first message"
+        assert await text(b) == "first message"
+        assert broadcaster.subscribers == 2
+
+        # late subscribers replay the stream
+        c = message_stream_service(1)
+        assert await text(c) == "first message"
+        await c.aclose()
+        assert broadcaster.subscribers == 2
+
+        # slow clients are dropped
+        monkeypatch.setattr(ENV, "STREAM_CLIENT_QUEUE_SIZE", 1)
+        d = message_stream_service(1)
+        assert await text(d) == "first message"
+        Message(job_id, "second message").publish()
+        Message(job_id, "third message").publish()
+        assert await text(a) == "second message"
+        assert await text(a) == "third message"
+        assert await anext(d) == ": dropped\n\n"
+
+        await a.aclose()
+        await b.aclose()
+        assert broadcaster.subscribers == 0
+
+    asyncio.run(test())
+
+
+def test_job_message_stream_service(mock_messages):
+    import catch_apis.services.stream
+
+    job_id = uuid.uuid4()
+    # same 8-character prefix
+    other_job_id = uuid.UUID(job_id.hex[:8] + uuid.uuid4().hex[8:])
+    Message(job_id, "first message").publish()
+    Message(other_job_id, "not for this job").publish()
+    Message(job_id, "Task complete.", status="success").publish()
+    Message(job_id, "after completion").publish()
+
+    # only this job's messages, and the stream closes after the success status
+    events = collect(job_message_stream_service(job_id, timeout=1))
+    assert len(events) == 2
+    assert events[0].startswith("id: 1-0\ndata: ")
+    assert json.loads(events[0].split("data: ")[1])["text"] == "first message"
+    assert events[1].startswith("id: 3-0\ndata: ")
+    assert json.loads(events[1].split("data: ")[1])["status"] == "success"
+
+    # resume after the first message, from the Redis stream rather than this
+    # process's history
+    broadcaster = catch_apis.services.stream.broadcaster
+    assert broadcaster.subscribers == 0
+    broadcaster._history.clear()
+    events = collect(job_message_stream_service(job_id, "1-0", timeout=1))
+    assert len(events) == 1
+    assert events[0].startswith("id: 3-0\n")
+
+
+def test_job_stream(test_client: TestClient, mock_messages):
+    job_id = uuid.uuid4()
+    Message(job_id, "a test message").publish()
+    Message(job_id, "Task complete.", status="success").publish()
+
+    response = test_client.get(f"/stream/{job_id.hex}")
+    response.raise_for_status()
+    text = response.content.decode()
+    assert text.startswith("id: 1-0\ndata: ")
+    assert '"text": "Task complete."' in text
+
+    response = test_client.get(
+        f"/stream/{job_id.hex}", headers={"Last-Event-ID": "1-0"}
+    )
+    assert response.content.decode().startswith("id: 2-0\n")
+
+    response = test_client.get(
+        f"/stream/{job_id.hex}", headers={"Last-Event-ID": "invalid"}
+    )
+    assert response.status_code == 400
+
+    response = test_client.get("/stream/invalid")
+    assert response.status_code == 400
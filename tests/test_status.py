@@ -1,12 +1,15 @@
 # Licensed with the 3-clause BSD license.  See LICENSE for details.
 
 import uuid
+import time
+import pytest
 from starlette.testclient import TestClient
 from astropy.time import Time
 
 from catch_apis.api.catch import catch_controller
 from catch_apis.tasks.catch import catch_task
 from catch_apis.config.env import ENV
+from catch_apis.services.queue import rq_job_id
 import catch_apis.services.status.queue
 from . import fixture_test_client, mock_flask_request, mock_redis, MockedJobsQueue
 
@@ -25,6 +28,60 @@ def test_status_sources(test_client: TestClient):
     assert neat_palomar_tricam["nights"] == 1
 
 
+def test_status_sources_cache(test_client: TestClient):
+    response = test_client.get("/status/sources")
+    response.raise_for_status()
+    etag = response.headers["ETag"]
+    assert "Last-Modified" in response.headers
+
+    # conditional requests
+    response = test_client.get("/status/sources", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    response = test_client.get(
+        "/status/sources",
+        headers={"If-Modified-Since": response.headers["Last-Modified"]},
+    )
+    assert response.status_code == 304
+
+    response = test_client.get("/status/sources", headers={"If-None-Match": '"x"'})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == etag
+
+
+def test_status_queries_invalidation(test_client: TestClient, mock_redis):
+    response = test_client.get("/status/queries")
+    response.raise_for_status()
+    assert response.json()[0]["jobs"] == 0
+
+    # a finished query invalidates the cached summary
+    catch_task(uuid.uuid4(), "65P", ["neat_palomar_tricam"], None, None, False, 0, True)
+    response = test_client.get("/status/queries")
+    response.raise_for_status()
+    assert response.json()[0]["jobs"] == 1
+
+
+def test_status_queries_invalidation_other_process(
+    test_client: TestClient, mock_redis, monkeypatch
+):
+    import catch_apis.services.status.cache
+
+    response = test_client.get("/status/queries")
+    response.raise_for_status()
+    assert response.json()[0]["jobs"] == 0
+
+    # a query finishes in another process, e.g., a woRQer, with its own cache
+    with monkeypatch.context() as m:
+        m.setattr(catch_apis.services.status.cache, "_cache", {})
+        catch_task(
+            uuid.uuid4(), "65P", ["neat_palomar_tricam"], None, None, False, 0, True
+        )
+
+    response = test_client.get("/status/queries")
+    response.raise_for_status()
+    assert response.json()[0]["jobs"] == 1
+
+
 def test_status_job_id(test_client: TestClient, mock_redis):
     job_id = uuid.uuid4()
     catch_task(job_id, "65P", ["neat_palomar_tricam"], None, None, False, 0, True)
@@ -99,6 +156,57 @@ def test_queue(test_client: TestClient, mock_redis, mock_flask_request, monkeypa
     assert results["jobs"][0]["status"] == "queued"
 
 
+def test_queue_job_ids(mock_redis):
+    job_id = uuid.uuid4()
+    queue = MockedJobsQueue()
+    queue.enqueue(f=print, job_id=rq_job_id(job_id, "neat_palomar_tricam"))
+    queue.enqueue(f=print, job_id=rq_job_id(job_id, "finalize"))
+    # rq's default job IDs are UUIDs, and are their own CATCH job
+    other_job_id = str(uuid.uuid4())
+    queue.enqueue(f=print, job_id=other_job_id)
+
+    assert queue.catch_job_ids == [job_id.hex, other_job_id]
+    assert queue.position(job_id) == 0
+    assert [job["job_id"] for job in queue.catch_jobs()] == [
+        job_id.hex,
+        other_job_id,
+    ]
+
+    with pytest.raises(ValueError):
+        rq_job_id(job_id, "not-a-part")
+
+
+def test_queue_work(mock_redis, monkeypatch):
+    job_id = uuid.uuid4()
+    rq_id = rq_job_id(job_id, "fixed")
+    queue = MockedJobsQueue()
+    queue.enqueue(f=print, job_id=rq_id)
+    queue.add_work(job_id, 100, [rq_id], "client")
+
+    # long running jobs are still tracked
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + ENV.CATCH_JOB_TIMEOUT_MAX)
+    queue.connection.hset(queue.job_class.key_for(rq_id), "status", "started")
+    assert queue.pending_work == 100
+    assert queue.client_jobs("client") == 1
+    assert queue.cost(job_id) == 100
+
+    # the job failed without removing its work, e.g., the worker was killed
+    queue.connection.hset(queue.job_class.key_for(rq_id), "status", "failed")
+    assert queue.pending_work == 0
+    assert queue.cost(job_id) is None
+
+    # deferred jobs wait for the entry's other jobs
+    task_id = rq_job_id(job_id, "task")
+    finalize_id = rq_job_id(job_id, "finalize")
+    queue.enqueue(f=print, job_id=task_id)
+    queue.enqueue(f=print, job_id=finalize_id, depends_on=task_id)
+    queue.add_work(job_id, 100, [task_id, finalize_id])
+    assert queue.pending_work == 100
+    queue.connection.delete(queue.job_class.key_for(task_id))
+    assert queue.pending_work == 0
+
+
 def test_queries(test_client: TestClient):
     response = test_client.get(f"/status/queries")
     response.raise_for_status()
@@ -111,3 +219,26 @@ def test_queries(test_client: TestClient):
         assert results[i]["finished"] == 0
         assert results[i]["in_progress"] == 0
         assert results[i]["jobs"] == 0
+
+
+def test_connections(test_client: TestClient):
+    # make a few database requests, then inspect the pool
+    for i in range(3):
+        test_client.get(f"/status/{uuid.uuid4().hex}").raise_for_status()
+
+    response = test_client.get("/status/connections")
+    response.raise_for_status()
+    results = response.json()
+
+    database = results["database"]
+    assert database["pooled"]
+    assert database["size"] == ENV.DB_POOL_SIZE
+    assert database["checked_out"] == 0
+    assert database["checkouts"] >= 3
+    # connections are reused
+    assert database["connects"] < database["checkouts"]
+    assert database["wait_time"] >= 0
+
+    redis = results["redis"]
+    assert redis["max_connections"] == ENV.REDIS_MAX_CONNECTIONS
+    assert 0 <= redis["in_use"] <= redis["created"]